@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Stand-in for ``systemctl`` used by the benchmark suite.
+
+Unit states are kept in the JSON file named by ``FAKE_SYSTEMCTL_STATE``, and a unit is
+considered loaded if its service file exists in ``FAKE_SYSTEMCTL_UNIT_DIR``. Every call
+sleeps for ``FAKE_SYSTEMCTL_LATENCY`` seconds first, to model a slow or busy systemd.
+Jobs complete immediately, so ``list-jobs`` never reports anything.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+STATE_FILE = Path(os.environ["FAKE_SYSTEMCTL_STATE"])
+UNIT_DIR = Path(os.environ["FAKE_SYSTEMCTL_UNIT_DIR"])
+LATENCY = float(os.environ.get("FAKE_SYSTEMCTL_LATENCY", "0"))
+
+JOB_STATES = {"start": "active", "restart": "active", "stop": "inactive"}
+FILE_STATES = {"enable": "enabled", "disable": "disabled"}
+
+
+def load_state() -> dict[str, dict[str, str]]:
+    try:
+        return json.loads(STATE_FILE.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def unit_state(states: dict[str, dict[str, str]], unit: str) -> dict[str, str]:
+    return states.get(unit, {"active": "inactive", "enabled": "disabled"})
+
+
+def show(states, properties: list[str], units: list[str]) -> int:
+    blocks = []
+    for unit in units:
+        loaded = (UNIT_DIR / unit).exists()
+        state = unit_state(states, unit)
+        values = {
+            "Id": unit,
+            "LoadState": "loaded" if loaded else "not-found",
+            "ActiveState": state["active"] if loaded else "inactive",
+            "SubState": "running" if loaded and state["active"] == "active" else "dead",
+            "UnitFileState": state["enabled"] if loaded else "",
+            "MainPID": "4242" if loaded and state["active"] == "active" else "0",
+        }
+        blocks.append("\n".join(f"{name}={values.get(name, '')}" for name in properties))
+    print("\n\n".join(blocks))
+    return 0
+
+
+def main(args: list[str]) -> int:
+    time.sleep(LATENCY)
+    args = [arg for arg in args if arg != "--no-block"]
+    if not args:
+        return 1
+    action, units = args[0], args[1:]
+    states = load_state()
+
+    if action == "show":
+        properties = units[0].removeprefix("--property=").split(",")
+        return show(states, properties, units[1:])
+    elif action == "list-jobs":
+        return 0
+    elif action in ("daemon-reload", "install", "uninstall"):
+        return 0
+
+    missing = [unit for unit in units if not (UNIT_DIR / unit).exists()]
+    if missing:
+        print(f"Unit {missing[0]} not found.", file=sys.stderr)
+        return 4
+
+    if action == "is-active":
+        active = unit_state(states, units[0])["active"]
+        print(active)
+        return 0 if active == "active" else 3
+    elif action == "is-enabled":
+        enabled = unit_state(states, units[0])["enabled"]
+        print(enabled)
+        return 0 if enabled == "enabled" else 1
+    elif action in JOB_STATES or action in FILE_STATES:
+        for unit in units:
+            state = states.setdefault(unit, dict(unit_state(states, unit)))
+            if action in JOB_STATES:
+                state["active"] = JOB_STATES[action]
+            else:
+                state["enabled"] = FILE_STATES[action]
+        STATE_FILE.write_text(json.dumps(states))
+        return 0
+
+    print(f"Unknown command verb {action}.", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Scalability benchmarks for manage-iocs.
+
+Generates synthetic fleets of IOC directories spread over several search paths, installs
+a fake ``systemctl`` (see ``fake_systemctl.py``) with a configurable per-call latency at
+the front of ``PATH``, and times the hot paths of the tool against each fleet. Results are
+written as JSON so that runs against different versions can be compared, e.g.::
+
+    python benchmarks/run_benchmarks.py --sizes 10 100 1000 --output before.json
+
+The benchmarks run in-process against a scratch directory and never touch the real
+systemd, ``/etc`` or ``/var/log``. Commands that require root are run with ``geteuid``
+patched, since they only write into the scratch directory.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+# Always go through the fake systemctl, never the host's systemd over D-Bus
+os.environ["MANAGE_IOCS_SYSTEMD_BACKEND"] = "subprocess"
+
+from manage_iocs import __version__, commands, utils  # noqa: E402
+
+# Every other IOC in the fleet has a systemd unit installed, and half of those are running
+INSTALLED_EVERY = 2
+
+
+def generate_fleet(root: Path, size: int, search_paths: int) -> list[Path]:
+    """Create ``size`` IOC directories spread evenly over ``search_paths`` directories."""
+    paths = [root / "iocs" / f"path{i}" for i in range(search_paths)]
+    hostname = "localhost"
+    for i in range(size):
+        ioc_dir = paths[i % search_paths] / f"ioc{i:05d}"
+        ioc_dir.mkdir(parents=True)
+        (ioc_dir / "config").write_text(
+            f"NAME=ioc{i:05d}\nPORT={4000 + i}\nHOST={hostname}\nUSER=softioc\nEXEC=st.cmd\n"
+        )
+    return paths
+
+
+def install_units(root: Path, size: int) -> dict[str, dict[str, str]]:
+    """Write service files for part of the fleet, returning the fake systemd state."""
+    states = {}
+    for i in range(0, size, INSTALLED_EVERY):
+        unit = f"softioc-ioc{i:05d}.service"
+        (root / "units" / unit).write_text(f"# Benchmark unit for ioc{i:05d}\n")
+        running = (i // INSTALLED_EVERY) % 2 == 0
+        states[unit] = {
+            "active": "active" if running else "inactive",
+            "enabled": "enabled" if running else "disabled",
+        }
+    return states
+
+
+def write_log(path: Path, size_mb: int, ioc: str):
+    """Write a procServ-style log of roughly the given size, with periodic restarts."""
+    line = f"{ioc}> dbpf SR:C01-BI{{DCCT:1}}I:Real-I 1.234 # some routine console output\n"
+    chunk = line * (1024 * 1024 // len(line))
+    with open(path, "w") as f:
+        for i in range(size_mb):
+            if i % 16 == 0:
+                f.write(f'@@@ Restarting child "{ioc}"\n')
+            f.write(chunk)
+
+
+def time_call(
+    func: Callable[[], object], repeat: int, reset: Callable[[], object] | None = None
+) -> dict[str, float]:
+    """Run a function ``repeat`` times, each with a fresh inventory snapshot.
+
+    ``reset`` is called (untimed) before every run, so that benchmarks which change the
+    fleet measure the same work each time rather than a no-op after the first run.
+    """
+    timings = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), utils.inventory_snapshot():
+            func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "mean": sum(timings) / len(timings), "max": max(timings)}
+
+
+def run_fleet(args, size: int) -> list[dict]:
+    root = Path(tempfile.mkdtemp(prefix=f"manage-iocs-bench-{size}-"))
+    try:
+        (root / "units").mkdir()
+        (root / "logs").mkdir()
+        (root / "cache").mkdir()
+        search_paths = generate_fleet(root, size, args.search_paths)
+        state_file = root / "systemctl-state.json"
+        initial_state = json.dumps(install_units(root, size))
+
+        bin_dir = root / "bin"
+        bin_dir.mkdir()
+        fake_systemctl = bin_dir / "systemctl"
+        fake_systemctl.write_text(
+            f"#!{sys.executable}\n" + (BENCHMARKS_DIR / "fake_systemctl.py").read_text()
+        )
+        fake_systemctl.chmod(0o755)
+        os.environ.update(
+            PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+            FAKE_SYSTEMCTL_STATE=str(state_file),
+            FAKE_SYSTEMCTL_UNIT_DIR=str(root / "units"),
+            FAKE_SYSTEMCTL_LATENCY=str(args.latency),
+        )
+
+        utils.IOC_SEARCH_PATH = search_paths
+        utils.SYSTEMD_SERVICE_PATH = root / "units"
+        utils.MANAGE_IOCS_LOG_PATH = root / "logs"
+        utils.MANAGE_IOCS_CACHE_PATH = root / "cache"
+
+        log_ioc = "ioc00000"
+        write_log(root / "logs" / f"{log_ioc}.log", args.log_size_mb, log_ioc)
+        # The last IOC in the fleet that does not have a unit installed yet
+        new_ioc = f"ioc{size - 1 if (size - 1) % INSTALLED_EVERY else size - 2:05d}"
+
+        def find_iocs_uncached():
+            utils.USE_INVENTORY_CACHE = False
+            try:
+                return utils.find_iocs()
+            finally:
+                utils.USE_INVENTORY_CACHE = True
+
+        def reset_fleet():
+            # Undo whatever the previous run started, stopped, enabled or installed
+            state_file.write_text(initial_state)
+            (root / "units" / f"softioc-{new_ioc}.service").unlink(missing_ok=True)
+
+        benchmarks: dict[str, Callable[[], object]] = {
+            "find_iocs (no cache)": find_iocs_uncached,
+            "find_iocs (cached)": utils.find_iocs,
+            "find_installed_iocs": utils.find_installed_iocs,
+            "status": commands.status,
+            "report": commands.report,
+            "install": lambda: commands.install(new_ioc),
+            "startall": commands.startall,
+            "lastlog": lambda: commands.lastlog(log_ioc),
+        }
+
+        utils.rebuild_inventory_cache()
+        results = []
+        for name, func in benchmarks.items():
+            if args.only and name.split()[0] not in args.only:
+                continue
+            timings = time_call(func, args.repeat, reset_fleet)
+            results.append({"benchmark": name, "fleet_size": size, **timings})
+            print(f"{size:>6} IOCs  {name:<22} {timings['min'] * 1000:10.2f} ms", file=sys.stderr)
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--search-paths", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per systemctl call")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--log-size-mb", type=int, default=64)
+    parser.add_argument("--only", nargs="+", help="only run benchmarks with these names")
+    parser.add_argument("--output", type=Path, help="write JSON results here (default stdout)")
+    args = parser.parse_args()
+
+    os.geteuid = lambda: 0  # install and friends only write into the scratch directory
+    report = {
+        "manage_iocs_version": __version__,
+        "python": platform.python_version(),
+        "search_paths": args.search_paths,
+        "systemctl_latency": args.latency,
+        "repeat": args.repeat,
+        "log_size_mb": args.log_size_mb,
+        "results": [result for size in args.sizes for result in run_fleet(args, size)],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
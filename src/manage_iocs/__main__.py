@@ -1,37 +1,149 @@
 """Interface for ``python -m manage_iocs``."""
 
-import inspect
 import sys
 from collections.abc import Callable
+from pathlib import Path
+from typing import Any
 
-from . import commands
+from . import _lazy, registry, tracing, utils
+
+agent = _lazy.lazy_import("manage_iocs.agent")
+
+
+def apply_global_options(args: list[str]) -> list[str]:
+    """Apply and strip options that are accepted by every command."""
+    if "--no-cache" in args:
+        utils.USE_INVENTORY_CACHE = False
+        args = [arg for arg in args if arg != "--no-cache"]
+    if "--no-agent" in args:
+        utils.USE_AGENT = False
+        args = [arg for arg in args if arg != "--no-agent"]
+    if "--timings" in args:
+        tracing.PRINT_TIMINGS = True
+        args = [arg for arg in args if arg != "--timings"]
+    for i, arg in enumerate(args):
+        if arg == "--trace":
+            if i + 1 >= len(args) or args[i + 1].startswith("--"):
+                raise RuntimeError("Option '--trace' requires a value!")
+            tracing.TRACE_FILE = Path(args[i + 1])
+            args = args[:i] + args[i + 2 :]
+            break
+        if arg.startswith("--trace="):
+            tracing.TRACE_FILE = Path(arg.removeprefix("--trace="))
+            args = args[:i] + args[i + 1 :]
+            break
+    return args
+
+
+def parse_options(name: str, args: list[str]) -> tuple[list[str], dict[str, Any]]:
+    """Split command line arguments into positional arguments and ``--option`` values.
+
+    Options map onto the command's keyword-only parameters, and their values are
+    converted to the type of the parameter's default. Boolean options are flags.
+    """
+    command_options = registry.COMMANDS[name].options
+    positional: list[str] = []
+    options: dict[str, Any] = {}
+
+    remaining = list(args)
+    while remaining:
+        arg = remaining.pop(0)
+        if not arg.startswith("--"):
+            positional.append(arg)
+            continue
+
+        option, has_value, value = arg[2:].partition("=")
+        parameter = option.replace("-", "_")
+        if parameter not in command_options:
+            raise RuntimeError(f"Unknown option for command '{name}': --{option}")
+
+        default = command_options[parameter]
+        if isinstance(default, bool) and not has_value:
+            options[parameter] = True
+            continue
+        elif not has_value:
+            if not remaining or remaining[0].startswith("--"):
+                raise RuntimeError(f"Option '--{option}' requires a value!")
+            value = remaining.pop(0)
+
+        try:
+            if isinstance(default, bool):
+                options[parameter] = value.lower() in ("1", "true", "yes", "on")
+            elif isinstance(default, int | float):
+                options[parameter] = type(default)(value)
+            else:
+                options[parameter] = value
+        except ValueError as e:
+            raise RuntimeError(f"Invalid value for option '--{option}': {value}") from e
+
+    return positional, options
 
 
 def get_command_from_args(args: list[str]) -> Callable:
     if len(args) < 2:
         raise RuntimeError("No command provided!")
 
-    command = getattr(commands, args[1], None)
-    if not command or not inspect.isfunction(command):
-        raise RuntimeError(f"Unknown command: {args[1]}")
+    name = args[1]
+    info = registry.COMMANDS.get(name)
+    if info is None:
+        raise RuntimeError(f"Unknown command: {name}")
 
-    if not bool(inspect.signature(command).parameters):
-        return command
-    elif len(args) < 3:
-        raise RuntimeError(f"Command '{command.__name__}' requires additional arguments!")
+    positional, options = parse_options(name, args[2:])
+    if len(positional) < info.arity:
+        raise RuntimeError(f"Command '{name}' requires additional arguments!")
 
-    # Return a lambda that calls the command with the additional args
-    # Assign it the same name as the original command for testing purposes
+    # The commands module is only imported once we know the command line is valid.
+    # Assign the wrapper the same name as the original command for testing purposes
     def command_w_args():
-        return command(*args[2:])
+        from . import commands
+
+        return getattr(commands, name)(*positional, **options)
 
-    command_w_args.__name__ = command.__name__
+    command_w_args.__name__ = name
+    command_w_args.options = options  # type: ignore[attr-defined]
 
     return command_w_args
 
 
+def run_traced(command: Callable) -> int:
+    """Run a command under a tracer, then write the trace and/or print the timings."""
+    tracer = tracing.start()
+    try:
+        with tracing.span(command.__name__, "command"), utils.inventory_snapshot():
+            return command()
+    finally:
+        tracing.stop()
+        if tracing.TRACE_FILE is not None:
+            tracer.write(tracing.TRACE_FILE)
+        if tracing.PRINT_TIMINGS:
+            print(tracer.summary(), file=sys.stderr)
+
+
 def main():
-    get_command_from_args(sys.argv)()
+    args = apply_global_options(sys.argv)
+    command = get_command_from_args(args)
+    traced = tracing.TRACE_FILE is not None or tracing.PRINT_TIMINGS
+
+    # Read-only commands are served by the resident agent when it is running. The agent
+    # always uses the inventory cache, so it is skipped when the cache is bypassed, and
+    # when tracing, since the time would be spent in the agent.
+    if (
+        not traced
+        and utils.USE_AGENT
+        and utils.USE_INVENTORY_CACHE
+        and registry.COMMANDS[command.__name__].served_by_agent
+        and not command.options.get("watch")
+    ):
+        response = agent.request(args[1:])
+        if response is not None:
+            sys.stdout.write(response["stdout"])
+            sys.stderr.write(response["stderr"])
+            return response["rc"]
+
+    if traced:
+        return run_traced(command)
+    with utils.inventory_snapshot():
+        return command()
 
 
 if __name__ == "__main__":
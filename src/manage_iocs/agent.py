@@ -0,0 +1,144 @@
+"""Optional resident agent serving read-only commands over a Unix socket.
+
+Every CLI invocation pays for interpreter startup, a scan of the IOC search paths and a
+fresh connection to systemd. When ``manage-iocs agent`` is running, read-only commands are
+instead forwarded to it: the agent keeps a warm inventory and unit-state cache, runs the
+command in-process, and sends back what it printed. If the agent is not running, the CLI
+silently falls back to running the command itself.
+
+The wire protocol is one JSON object per line in each direction.
+"""
+
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from . import registry, utils
+
+# Only commands that never change anything may be served by the agent
+AGENT_COMMANDS = tuple(name for name, info in registry.COMMANDS.items() if info.served_by_agent)
+
+# How long the agent reuses its inventory, and the unit states it has queried
+AGENT_INVENTORY_TTL = 5.0
+AGENT_UNIT_STATE_TTL = 1.0
+
+# How long the client waits on the agent before running the command itself
+CONNECT_TIMEOUT = 0.5
+RESPONSE_TIMEOUT = 30.0
+
+
+def socket_path() -> Path:
+    return utils.MANAGE_IOCS_CACHE_PATH / "agent.sock"
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "AgentServer"
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            response = self.server.run(json.loads(line)["args"])
+        except Exception as e:
+            response = {"error": f"Bad request: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    """Serve read-only commands, one at a time, from a warm inventory."""
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._inventory: utils.Inventory | None = None
+        self._inventory_time = 0.0
+        super().__init__(str(path), _RequestHandler)
+        os.chmod(path, 0o666)
+
+    def _warm_inventory(self) -> utils.Inventory:
+        now = time.monotonic()
+        if self._inventory is None or now - self._inventory_time > AGENT_INVENTORY_TTL:
+            self._inventory = utils.Inventory(unit_state_ttl=AGENT_UNIT_STATE_TTL)
+            self._inventory_time = now
+        return self._inventory
+
+    def run(self, args: list[str]) -> dict[str, Any]:
+        """Run a command as if it was given on the command line, capturing its output."""
+        from .__main__ import get_command_from_args
+
+        if not args or args[0] not in AGENT_COMMANDS:
+            return {"error": f"Command not served by the agent: {' '.join(args)}"}
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with self._lock:
+            try:
+                command = get_command_from_args(["manage-iocs", *args])
+                if command.options.get("watch"):
+                    # Watching never returns, and would block the agent for everyone else
+                    return {"error": "Watching is not served by the agent"}
+                with (
+                    contextlib.redirect_stdout(stdout),
+                    contextlib.redirect_stderr(stderr),
+                    utils.inventory_snapshot(self._warm_inventory()),
+                ):
+                    rc = command()
+            except Exception as e:
+                return {"error": str(e)}
+        return {"rc": rc or 0, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def serve(path: Path | None = None):
+    """Run the agent until interrupted."""
+    path = socket_path() if path is None else path
+    if request_raw(path, {"args": []}) is not None:
+        raise RuntimeError(f"The manage-iocs agent is already running at '{path}'!")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with contextlib.suppress(FileNotFoundError):
+        path.unlink()  # Left behind by an agent that did not shut down cleanly
+
+    with AgentServer(path) as server:
+        print(f"manage-iocs agent listening on '{path}'")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            path.unlink(missing_ok=True)
+    return 0
+
+
+def request_raw(path: Path, message: dict[str, Any]) -> dict[str, Any] | None:
+    """Send one message to the agent, returning None if it could not be reached."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(path))
+            sock.settimeout(RESPONSE_TIMEOUT)
+            sock.sendall(json.dumps(message).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError:
+        return None
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def request(args: list[str]) -> dict[str, Any] | None:
+    """Ask the agent to run a command, returning None if it is not running.
+
+    Raises the error reported by the agent if the command itself failed.
+    """
+    path = socket_path()
+    if not path.exists():
+        return None
+    response = request_raw(path, {"args": args})
+    if response is not None and "error" in response:
+        raise RuntimeError(response["error"])
+    return response
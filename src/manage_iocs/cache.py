@@ -0,0 +1,187 @@
+"""Persistent on-disk cache of parsed IOC config files.
+
+The cache maps every IOC search path to the IOC directories found in it. Each entry
+remembers the (inode, mtime, size) of its ``config`` file along with the parsed key/value
+pairs, so that a warm lookup only has to ``stat`` each config file instead of listing,
+probing and re-reading every directory. Search paths themselves are keyed on their mtime,
+which changes whenever an IOC directory is added or removed.
+"""
+
+import json
+import os
+import stat
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Any
+
+CACHE_VERSION = 1
+
+# Timestamps newer than this (in seconds) are not trusted, since a second modification
+# within the filesystem's timestamp granularity would go unnoticed.
+RACY_WINDOW = 2.0
+
+
+def _stat_key(st: os.stat_result) -> list[int] | None:
+    if time.time() - st.st_mtime < RACY_WINDOW:
+        return None
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def _mtime_key(st: os.stat_result) -> int | None:
+    if time.time() - st.st_mtime < RACY_WINDOW:
+        return None
+    return st.st_mtime_ns
+
+
+class InventoryCache:
+    """Incrementally revalidated cache of IOC configs, stored as JSON."""
+
+    def __init__(self, cache_file: Path, search_paths: dict[str, Any] | None = None):
+        self.cache_file = cache_file
+        self.search_paths: dict[str, Any] = search_paths or {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, cache_file: Path) -> "InventoryCache":
+        """Load the cache from disk, starting empty if it is missing or unreadable."""
+
+        try:
+            with open(cache_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(cache_file)
+
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return cls(cache_file)
+        return cls(cache_file, data.get("search_paths", {}))
+
+    def save(self, strict: bool = False):
+        """Atomically write the cache to disk if anything changed.
+
+        Failures (e.g. running as a user who cannot write to the cache directory) are
+        ignored unless ``strict`` is set.
+        """
+
+        if not self.dirty:
+            return
+        tmp_file = self.cache_file.with_name(f".{self.cache_file.name}.{os.getpid()}")
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump({"version": CACHE_VERSION, "search_paths": self.search_paths}, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            tmp_file.unlink(missing_ok=True)
+            if strict:
+                raise
+            return
+        self.dirty = False
+
+    def scan(
+        self,
+        search_path: Path,
+        parse: Callable[[Path], dict[str, str]],
+        executor: Executor | None = None,
+    ) -> dict[str, dict[str, str]]:
+        """Get the parsed config of every IOC directory in the given search path.
+
+        Only configs whose (inode, mtime, size) changed since the last scan are re-parsed,
+        and the search path is only re-listed if its own mtime changed. If an executor is
+        given, the IOC directories are revalidated concurrently.
+        """
+
+        key = str(search_path)
+        try:
+            path_stat = os.stat(search_path)
+        except OSError:
+            if self.search_paths.pop(key, None) is not None:
+                self.dirty = True
+            return {}
+
+        cached = self.search_paths.get(key)
+        old_items: dict[str, Any] = cached["items"] if cached else {}
+        entries: dict[str, os.DirEntry | None]
+        if (
+            cached is None
+            or cached["mtime_ns"] is None
+            or cached["mtime_ns"] != path_stat.st_mtime_ns
+        ):
+            # The listing already tells which entries are directories, mostly without a stat
+            with os.scandir(search_path) as it:
+                entries = {entry.name: entry for entry in it if entry.is_dir()}
+            names = sorted(entries)
+        else:
+            names = list(old_items)
+            entries = {}
+
+        def revalidate(name: str) -> dict[str, Any] | None:
+            return self._revalidate(
+                search_path / name, old_items.get(name), parse, entries.get(name)
+            )
+
+        revalidated = executor.map(revalidate, names) if executor else map(revalidate, names)
+        items = {
+            name: item for name, item in zip(names, revalidated, strict=True) if item is not None
+        }
+
+        entry = {"mtime_ns": _mtime_key(path_stat), "items": items}
+        if entry != cached:
+            self.search_paths[key] = entry
+            self.dirty = True
+
+        return {name: item["config"] for name, item in items.items() if item["config"] is not None}
+
+    def _revalidate(
+        self,
+        ioc_dir: Path,
+        old: dict[str, Any] | None,
+        parse: Callable[[Path], dict[str, str]],
+        dir_entry: os.DirEntry | None = None,
+    ) -> dict[str, Any] | None:
+        """Get the cache item of an IOC directory, reusing ``old`` if it is still valid.
+
+        ``dir_entry`` is the directory's entry from a fresh listing of the search path, if
+        there was one; its (cached) stat is used instead of stat'ing the directory again.
+        """
+
+        def dir_stat() -> os.stat_result:
+            return dir_entry.stat() if dir_entry is not None else os.stat(ioc_dir)
+
+        config_path = ioc_dir / "config"
+        if old is not None and old["config"] is not None:
+            try:
+                if old["config_stat"] is not None and (
+                    _stat_key(os.stat(config_path)) == old["config_stat"]
+                ):
+                    return old
+            except OSError:
+                pass
+        elif old is not None and old["mtime_ns"] is not None:
+            # A directory without a config only gains one if its own mtime changes
+            try:
+                if dir_stat().st_mtime_ns == old["mtime_ns"]:
+                    return old
+            except OSError:
+                return None
+
+        try:
+            config_stat = os.stat(config_path)
+        except OSError:
+            pass
+        else:
+            # Only a directory can hold a config, so the directory needs no stat of its own
+            return {
+                "mtime_ns": None,
+                "config_stat": _stat_key(config_stat),
+                "config": parse(config_path),
+            }
+
+        try:
+            st = dir_stat()
+        except OSError:
+            return None
+        if not stat.S_ISDIR(st.st_mode):
+            return None
+        return {"mtime_ns": _mtime_key(st), "config_stat": None, "config": None}
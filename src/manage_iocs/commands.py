@@ -1,15 +1,34 @@
-import inspect
-import socket
 import sys
 import time as ttime
-from subprocess import PIPE, Popen
 
-from . import __version__, utils
-
-EXTRA_PAD_WIDTH = 5
-
-# Length added to string to account for ANSI color escape codes
-ANSI_COLOR_ESC_CODE_LEN = 9
+from . import __version__, _lazy, registry, utils
+
+# Only loaded by the commands that need them, to keep simple commands fast
+asyncio = _lazy.lazy_import("asyncio")
+agent_ = _lazy.lazy_import("manage_iocs.agent")
+cgroups = _lazy.lazy_import("manage_iocs.cgroups")
+console = _lazy.lazy_import("manage_iocs.console")
+exporter_ = _lazy.lazy_import("manage_iocs.exporter")
+logs_ = _lazy.lazy_import("manage_iocs.logs")
+output = _lazy.lazy_import("manage_iocs.output")
+ports = _lazy.lazy_import("manage_iocs.ports")
+rolling = _lazy.lazy_import("manage_iocs.rolling")
+
+# Fields of the records emitted by the machine-readable output formats
+REPORT_FIELDS = ["base", "ioc", "user", "port", "exec", "host", "status"]
+STATUS_FIELDS = [
+    "ioc",
+    "status",
+    "enabled",
+    "unit_file_state",
+    "active_state",
+    "sub_state",
+    "main_pid",
+    "since",
+]
+USAGE_FIELDS = ["ioc", "cpu_percent", "memory_bytes", "io_read_rate", "io_write_rate"]
+# Latencies are in seconds
+HEALTH_FIELDS = ["ioc", "status", "connect_time", "first_byte_time", "responds", "healthy", "error"]
 
 
 def version():
@@ -22,22 +41,7 @@ def version():
 def help():
     """Display this help message."""
     version()
-    print("Usage: manage-iocs [command] <ioc>")
-    print("Available commands:")
-    docs: dict[str, str] = {}
-    signatures: dict[str, list[str]] = {}
-    for func in inspect.getmembers(sys.modules[__name__], inspect.isfunction):
-        docs[func[0]] = str(func[1].__doc__)
-        signatures[func[0]] = list(inspect.signature(func[1]).parameters.keys())
-
-    usages = [
-        f"  {name} " + " ".join(f"<{param}>" for param in params)
-        for name, params in signatures.items()
-    ]
-    max_sig_len = max(len(sig) for sig in usages)
-
-    for usage, doc in zip(usages, docs.values(), strict=False):
-        print(f"  {usage.ljust(max_sig_len + EXTRA_PAD_WIDTH)} - {doc}")
+    print(registry.help_text())
     return 0
 
 
@@ -45,64 +49,107 @@ def help():
 def attach(ioc: str):
     """Connect to procServ telnet server for the given IOC."""
 
-    is_running, _ = utils.get_ioc_status(ioc)
-    if is_running != "Running":
+    if utils.unit_state(ioc).status != "Running":
         raise RuntimeError(f"Cannot attach to IOC '{ioc}': IOC is not running!")
 
     procserv_port = utils.get_ioc_procserv_port(ioc)
-    print(f"Attaching to IOC '{ioc}' at port {procserv_port}...")
-    proc = Popen(
-        ["telnet", "localhost", str(procserv_port)],
-        stdin=PIPE,
-        stdout=PIPE,
+    print(f"Attaching to IOC '{ioc}' at port {procserv_port} (press ^] to detach)...")
+    return console.attach_console("localhost", procserv_port)
+
+
+def exec(
+    command: str,
+    *iocs: str,
+    all: bool = False,
+    parallel: int = utils.EXEC_CONCURRENCY,
+    timeout: float = utils.EXEC_TIMEOUT,
+    format: str = "text",
+):
+    """Run an iocsh command on the console of the given IOCs (or --all running IOCs)."""
+
+    if format not in output.EXEC_FORMATS:
+        raise RuntimeError(f"Unknown output format: {format}")
+    if all == bool(iocs):
+        raise RuntimeError("Specify either IOC names or --all, but not both!")
+
+    with utils.inventory_snapshot() as inventory:
+        for ioc in iocs:
+            if not inventory.is_installed(ioc):
+                raise RuntimeError(f"No IOC with name '{ioc}' is installed!")
+        targets = list(iocs) or list(inventory.installed)
+        unit_states = utils.systemctl_show(targets)
+
+        ports = {}
+        results = []
+        for ioc in targets:
+            if ioc in unit_states and unit_states[ioc].status == "Running":
+                ports[ioc] = inventory[ioc].procserv_port
+            elif ioc in unit_states and unit_states[ioc].timed_out:
+                results.append(console.ExecResult(ioc, error="systemd did not report its state"))
+            elif iocs:
+                results.append(console.ExecResult(ioc, error="IOC is not running"))
+
+    results += asyncio.run(
+        console.exec_on_iocs(command, ports, concurrency=parallel, timeout=timeout)
     )
-    return proc.wait()
-
-
-def report():
-    """Show config(s) of an all IOCs on localhost"""
-    base_hostname = socket.gethostname()
-    if "." in base_hostname:
-        base_hostname = base_hostname.split(".")[0]
-
-    iocs = [
-        ioc_config
-        for ioc_config in utils.find_iocs().values()
-        if ioc_config.host == "localhost"
-        or ioc_config.host == base_hostname
-        or ioc_config.host == socket.gethostname()
-    ]
-
-    if len(iocs) == 0:
-        print("No IOCs found on configured to run on this host.")
-        print(f"Searched in: {utils.IOC_SEARCH_PATH}")
-        return 1
+    results.sort(key=lambda result: targets.index(result.ioc))
+    return min(output.print_exec_results(results, format), 1)
+
+
+def report(*, format: str = "table", host: str = ""):
+    """Show config(s) of an all IOCs on localhost (or on --host)"""
+    output.check_format(format)
+    messages = sys.stdout if format == "table" else sys.stderr
+    host_key = utils.normalize_host(host) if host else utils.this_host()
+    local = host_key == utils.this_host()
+    with utils.inventory_snapshot() as inventory:
+        iocs = list(inventory.on_host(host_key).values())
+
+        if len(iocs) == 0:
+            where = "this host" if local else f"host '{host}'"
+            print(f"No IOCs found on configured to run on {where}.", file=messages)
+            print(f"Searched in: {utils.IOC_SEARCH_PATH}", file=messages)
+            return 1
+
+        # The state of IOCs on other hosts is not known to the systemd of this one
+        unit_states = (
+            utils.systemctl_show([ioc.name for ioc in iocs if utils.is_service_installed(ioc.name)])
+            if local
+            else {}
+        )
+        duplicate_ports = (inventory.port_index if local else ports.PortIndex(iocs)).duplicates()
+    output.warn_timed_out(unit_states.values())
+    no_state = "Not installed" if local else "Remote"
 
-    if len({ioc.procserv_port for ioc in iocs}) < len(iocs):
-        print("Warning: Detected multiple IOCs configured to use the same procServ port!")
-    elif len({ioc.name for ioc in iocs}) < len(iocs):
-        print("Warning: Detected multiple IOCs configured with the same name!")
-
-    max_base_len = max(len(str(ioc.path)) for ioc in iocs) + EXTRA_PAD_WIDTH
-    max_ioc_name_len = max(len(ioc.name) for ioc in iocs) + EXTRA_PAD_WIDTH
-    max_user_len = max(len(ioc.user) for ioc in iocs) + EXTRA_PAD_WIDTH
-    max_port_len = max(len(str(ioc.procserv_port)) for ioc in iocs) + EXTRA_PAD_WIDTH
-    max_exec_len = max(len(ioc.exec_path) for ioc in iocs) + max_base_len - EXTRA_PAD_WIDTH
-
-    header = (
-        f"{'BASE'.ljust(max_base_len)}| {'IOC'.ljust(max_ioc_name_len)}| "
-        f"{'USER'.ljust(max_user_len)}| {'PORT'.ljust(max_port_len)}| "
-        f"{'EXEC'.ljust(max_exec_len)}"
-    )
-    print(header)
-    print("-" * len(header))
-    for ioc in iocs:
-        ttime.sleep(0.01)
+    if duplicate_ports:
         print(
-            f"{str(ioc.path).ljust(max_base_len)}| {ioc.name.ljust(max_ioc_name_len)}| "
-            f"{ioc.user.ljust(max_user_len)}| {str(ioc.procserv_port).ljust(max_port_len)}| "
-            f"{str(ioc.path / ioc.chdir / ioc.exec_path).ljust(max_exec_len)}"
+            "Warning: Detected multiple IOCs configured to use the same procServ port!",
+            file=messages,
         )
+        for port, names in duplicate_ports.items():
+            print(f"  Port {port}: {', '.join(names)}", file=messages)
+
+    records = (
+        {
+            "base": str(ioc.path),
+            "ioc": ioc.name,
+            "user": ioc.user,
+            "port": ioc.procserv_port,
+            "exec": str(ioc.path / ioc.chdir / ioc.exec_path),
+            "host": ioc.host,
+            "status": unit_states[ioc.name].status if ioc.name in unit_states else no_state,
+        }
+        for ioc in iocs
+    )
+    if format != "table":
+        output.write_records(records, format, REPORT_FIELDS)
+        return 0
+
+    rows = [
+        [r["base"], r["ioc"], r["user"], str(r["port"]), r["exec"], r["status"]] for r in records
+    ]
+    print(output.render_table(["BASE", "IOC", "USER", "PORT", "EXEC", "STATUS"], rows, "| "))
+    return 0
 
 
 @utils.requires_root
@@ -143,14 +190,33 @@ def start(ioc: str):
     return ret
 
 
-def startall():
+def startall(*, chunk: int = 0, timeout: float = utils.JOB_TIMEOUT):
     """Start all IOCs on this host."""
 
-    iocs = utils.find_installed_iocs().values()
-    ret = 0
-    for ioc in iocs:
-        ret += start(ioc.name)
-    return ret
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        results = utils.systemctl_bulk("start", list(inventory.installed), chunk, timeout)
+    failures = output.print_bulk_results("start", results, ttime.monotonic() - start_time)
+    return min(failures, 1)
+
+
+def restartall(*, batch: int = 1, max_unavailable: int = 0, timeout: float = utils.JOB_TIMEOUT):
+    """Restart all running IOCs on this host in waves, waiting for each wave to be ready."""
+
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        installed = inventory.installed
+        unit_states = utils.systemctl_show(list(installed))
+        running = [
+            installed[ioc]
+            for ioc, unit_state in unit_states.items()
+            if unit_state.status == "Running"
+        ]
+    output.warn_timed_out(unit_states.values())
+    results, downtimes = rolling.rolling_restart(running, batch, max_unavailable, timeout)
+    failures = output.print_bulk_results("restart", results, ttime.monotonic() - start_time)
+    output.print_slowest(downtimes)
+    return min(failures, 1)
 
 
 @utils.requires_ioc_installed
@@ -165,36 +231,36 @@ def stop(ioc: str):
     return ret
 
 
-def stopall():
+def stopall(*, chunk: int = 0, timeout: float = utils.JOB_TIMEOUT):
     """Stop all IOCs on this host."""
 
-    iocs = utils.find_installed_iocs().values()
-    ret = 0
-    for ioc in iocs:
-        ret += stop(ioc.name)
-    return ret
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        results = utils.systemctl_bulk("stop", list(inventory.installed), chunk, timeout)
+    failures = output.print_bulk_results("stop", results, ttime.monotonic() - start_time)
+    return min(failures, 1)
 
 
 @utils.requires_root
-def enableall():
+def enableall(*, chunk: int = 0, timeout: float = utils.JOB_TIMEOUT):
     """Enable autostart for all IOCs on this host."""
 
-    iocs = utils.find_installed_iocs().values()
-    ret = 0
-    for ioc in iocs:
-        ret += enable(ioc.name)
-    return ret
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        results = utils.systemctl_bulk("enable", list(inventory.installed), chunk, timeout)
+    failures = output.print_bulk_results("enable", results, ttime.monotonic() - start_time)
+    return min(failures, 1)
 
 
 @utils.requires_root
-def disableall():
+def disableall(*, chunk: int = 0, timeout: float = utils.JOB_TIMEOUT):
     """Disable autostart for all IOCs on this host."""
 
-    iocs = utils.find_installed_iocs().values()
-    ret = 0
-    for ioc in iocs:
-        ret += disable(ioc.name)
-    return ret
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        results = utils.systemctl_bulk("disable", list(inventory.installed), chunk, timeout)
+    failures = output.print_bulk_results("disable", results, ttime.monotonic() - start_time)
+    return min(failures, 1)
 
 
 @utils.requires_ioc_installed
@@ -210,131 +276,232 @@ def restart(ioc: str):
 
 
 @utils.requires_root
-def uninstall(ioc: str):
-    """Remove /etc/systemd/system/softioc-[ioc].service"""
-
-    _, _, ret = utils.systemctl_passthrough("stop", ioc)
-    if ret != 0:
-        raise RuntimeError(f"Failed to stop IOC '{ioc}' before uninstalling!")
-    _, _, ret = utils.systemctl_passthrough("disable", ioc)
-    if ret != 0:
-        raise RuntimeError(f"Failed to disable IOC '{ioc}' before uninstalling!")
-    _, _, ret = utils.systemctl_passthrough("uninstall", ioc)
-    if ret == 0:
-        print(f"IOC '{ioc}' uninstalled successfully.")
-    else:
-        raise RuntimeError(f"Failed to uninstall IOC '{ioc}'!")
-    return ret
+def sync(*, restart: bool = False, dry_run: bool = False):
+    """Rewrite outdated service files of installed IOCs (and --restart the running ones)."""
+
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        installed = list(inventory.installed.values())
+        if dry_run:
+            outdated = [ioc.name for ioc in installed if utils.service_file_outdated(ioc)]
+            for ioc in outdated:
+                print(f"  {ioc}")
+            print(f"Sync: {len(outdated)} of {len(installed)} service files out of date.")
+            return 0
+
+        results = utils.sync_service_files(installed)
+        if not results:
+            print(f"Sync: all {len(installed)} service files are up to date.")
+            return 0
+        failures = output.print_bulk_results("sync", results, ttime.monotonic() - start_time)
+
+        if restart:
+            rewritten = [ioc for ioc, result in results.items() if result.succeeded]
+            unit_states = utils.systemctl_show(rewritten)
+            output.warn_timed_out(unit_states.values())
+            running = [
+                ioc
+                for ioc in rewritten
+                if ioc in unit_states and unit_states[ioc].status == "Running"
+            ]
+            start_time = ttime.monotonic()
+            restart_results = utils.systemctl_bulk("restart", running)
+            failures += output.print_bulk_results(
+                "restart", restart_results, ttime.monotonic() - start_time
+            )
+    return min(failures, 1)
 
 
 @utils.requires_root
-def install(ioc: str):
-    """Create /etc/systemd/system/softioc-[ioc].service"""
-
-    iocs = utils.find_installed_iocs()
-    if ioc in iocs:
-        raise RuntimeError(f"IOC '{ioc}' is already installed!")
-
-    procserv_ports = [ioc.procserv_port for ioc in utils.find_installed_iocs().values()]
-    if utils.find_iocs()[ioc].procserv_port in procserv_ports:
-        raise RuntimeError(
-            f"Cannot install IOC '{ioc}': procServ port "
-            f"{utils.find_iocs()[ioc].procserv_port} is already in use!"
-        )
+def uninstall(*iocs: str, all: bool = False):
+    """Remove /etc/systemd/system/softioc-[ioc].service for the given IOCs (or --all)."""
 
-    service_file = utils.SYSTEMD_SERVICE_PATH / f"softioc-{ioc}.service"
-    ioc_config = utils.find_iocs()[ioc]
-    base_hostname = socket.gethostname()
-    if "." in base_hostname:
-        base_hostname = base_hostname.split(".")[0]
+    if all == bool(iocs):
+        raise RuntimeError("Specify either IOC names or --all, but not both!")
 
-    if ioc_config.host not in [base_hostname, "localhost", socket.gethostname()]:
-        raise RuntimeError(
-            f"Cannot install IOC '{ioc}' on this host; configured host is '{ioc_config.host}'!"
-        )
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        results = utils.uninstall_iocs(list(dict.fromkeys(iocs)) or list(inventory.installed))
 
-    if ioc_config.user == "root":
-        raise RuntimeError(f"Refusing to install IOC '{ioc}' to run as user 'root'!")
-
-    with open(service_file, "w") as f:
-        f.write(
-            f"""
-#
-# Installed by manage-iocs
-#
-[Unit]
-Description=IOC {ioc} via procServ
-After=network.target remote_fs.target local_fs.target syslog.target time.target centrifydc.service
-ConditionFileIsExecutable=/usr/bin/procServ
-
-[Service]
-User={ioc_config.user}
-ExecStart=/usr/bin/procServ -f -q -c {ioc_config.path} -i ^D^C^] -p /var/run/softioc-{ioc}.pid \
-  -n {ioc} --restrict -L /var/log/softioc/{ioc}/{ioc}.log \
-  {ioc_config.procserv_port} {ioc_config.path}/{ioc_config.exec_path}
-Environment="PROCPORT={ioc_config.procserv_port}"
-Environment="HOSTNAME={ioc_config.host}"
-Environment="IOCNAME={ioc}"
-Environment="TOP={ioc_config.path}"
-#Restart=on-failure
-
-[Install]
-WantedBy=multi-user.target
-"""
-        )
-
-    _, stderr, ret = utils.systemctl_passthrough("install", ioc)
-    if ret == 0:
-        print(f"IOC '{ioc}' installed successfully.")
-    else:
-        raise RuntimeError(f"Failed to install IOC '{ioc}'!: {stderr.strip()}")
-    return ret
+    if len(iocs) == 1:
+        if not results[iocs[0]].succeeded:
+            raise RuntimeError(results[iocs[0]].detail)
+        print(f"IOC '{iocs[0]}' uninstalled successfully.")
+        return 0
+    failures = output.print_bulk_results("uninstall", results, ttime.monotonic() - start_time)
+    return min(failures, 1)
 
 
-def status():
+@utils.requires_root
+def install(*iocs: str, all: bool = False):
+    """Create /etc/systemd/system/softioc-[ioc].service for the given IOCs (or --all)."""
+
+    if all == bool(iocs):
+        raise RuntimeError("Specify either IOC names or --all, but not both!")
+
+    start_time = ttime.monotonic()
+    with utils.inventory_snapshot() as inventory:
+        targets = list(dict.fromkeys(iocs)) or [
+            ioc
+            for ioc in inventory.on_host(utils.this_host())
+            if not utils.is_service_installed(ioc)
+        ]
+        results = utils.install_iocs(targets)
+
+    if len(iocs) == 1:
+        if not results[iocs[0]].succeeded:
+            raise RuntimeError(results[iocs[0]].detail)
+        print(f"IOC '{iocs[0]}' installed successfully.")
+        return 0
+    failures = output.print_bulk_results("install", results, ttime.monotonic() - start_time)
+    return min(failures, 1)
+
+
+def status(*, format: str = "table", watch: bool = False, interval: float = 2.0):
     """Get the status of the given IOC."""
 
-    ret = 0
-    statuses: dict[str, tuple[str, bool]] = {}
-    installed_iocs = utils.find_installed_iocs().keys()
+    output.check_format(format)
+    if watch and format != "table":
+        raise RuntimeError("Option '--watch' can only be used with table output!")
+    with utils.inventory_snapshot() as inventory:
+        installed_iocs = inventory.installed.keys()
     if len(installed_iocs) == 0:
-        print("No Installed IOCs found on this host.")
+        print(
+            "No Installed IOCs found on this host.",
+            file=sys.stdout if format == "table" else sys.stderr,
+        )
         return 1
 
-    for installed_ioc in installed_iocs:
-        try:
-            statuses[installed_ioc] = utils.get_ioc_status(installed_ioc)
-        except RuntimeError:
-            pass  # TODO: Handle this better?
-
-    max_ioc_name_len = max(len(ioc_name) for ioc_name in statuses.keys()) + EXTRA_PAD_WIDTH
-    max_status_len = max(len(status[0]) for status in statuses.values()) + EXTRA_PAD_WIDTH
-    max_enabled_len = len("Auto-Start")
-
-    print(f"{'IOC'.ljust(max_ioc_name_len)}{'Status'.ljust(max_status_len)}Auto-Start")
-    ttime.sleep(0.01)
-    print("-" * (max_ioc_name_len + max_status_len + max_enabled_len))
-    for ioc_name, (state, is_enabled) in statuses.items():
-        ttime.sleep(0.01)
-        if state == "Running":
-            state_str = f"\033[92m{state}\033[0m"  # Green
-        elif state == "Stopped":
-            state_str = f"\033[91m{state}\033[0m"  # Red
-        else:
-            state_str = f"\033[93m{state}\033[0m"  # Yellow
+    if watch:
+        # The inventory is kept from the first scan; only unit state is queried each tick
+        def fetch_rows() -> list[list[str]]:
+            return output.status_rows(utils.systemctl_show(list(installed_iocs)).values())
+
+        return output.watch_table(output.STATUS_HEADER, fetch_rows, interval)
+
+    unit_states = utils.systemctl_show(list(installed_iocs))
+    # Units that are masked, static etc. are listed with their actual unit file state
+    states = [unit_states[ioc_name] for ioc_name in installed_iocs if ioc_name in unit_states]
+    timed_out = output.warn_timed_out(states)
+
+    if format != "table":
+        records = (
+            {
+                "ioc": unit_state.ioc,
+                "status": unit_state.status,
+                "enabled": unit_state.enabled,
+                "unit_file_state": unit_state.unit_file_state,
+                "active_state": unit_state.active_state,
+                "sub_state": unit_state.sub_state,
+                "main_pid": unit_state.main_pid,
+                "since": unit_state.active_enter_timestamp
+                if unit_state.active_state == "active"
+                else unit_state.inactive_enter_timestamp,
+            }
+            for unit_state in states
+        )
+        output.write_records(records, format, STATUS_FIELDS)
+        return 1 if timed_out else 0
+
+    print(output.render_table(output.STATUS_HEADER, output.status_rows(states)))
+    return 1 if timed_out else 0
+
+
+def usage(*, interval: float = 1.0, sort: str = "cpu", format: str = "table"):
+    """Show the CPU, memory and I/O usage of every running IOC, from its cgroup."""
+
+    output.check_format(format)
+    with utils.inventory_snapshot() as inventory:
+        installed_iocs = list(inventory.installed)
+    usages = cgroups.measure_usage(installed_iocs, interval, sort)
+
+    if format != "table":
+        records = ({field: getattr(usage, field) for field in USAGE_FIELDS} for usage in usages)
+        output.write_records(records, format, USAGE_FIELDS)
+        return 0
+
+    if not usages:
+        print("No running IOCs found on this host.")
+        return 0
+    print(output.render_table(output.USAGE_HEADER, output.usage_rows(usages)))
+    return 0
+
+
+def health(
+    *, check_console: bool = False, timeout: float = utils.HEALTH_TIMEOUT, format: str = "table"
+):
+    """Probe the procServ port of every running IOC, alongside its systemd state."""
+
+    output.check_format(format)
+    with utils.inventory_snapshot() as inventory:
+        installed = inventory.installed
+        unit_states = list(utils.systemctl_show(list(installed)).values())
+    timed_out = output.warn_timed_out(unit_states)
+    ports = {
+        unit_state.ioc: installed[unit_state.ioc].procserv_port
+        for unit_state in unit_states
+        if unit_state.status == "Running"
+    }
+    probes = {
+        probe.ioc: probe
+        for probe in asyncio.run(
+            console.probe_iocs(ports, check_console=check_console, timeout=timeout)
+        )
+    }
+    # IOCs whose state is unknown cannot be vouched for either
+    unhealthy = sum(not probe.healthy for probe in probes.values()) + timed_out
+
+    if format != "table":
+        records = (
+            {
+                "ioc": unit_state.ioc,
+                "status": unit_state.status,
+                "connect_time": probe.connect_time if probe else None,
+                "first_byte_time": probe.first_byte_time if probe else None,
+                "responds": probe.responds if probe else None,
+                "healthy": probe.healthy if probe else None,
+                "error": probe.error if probe else "",
+            }
+            for unit_state in unit_states
+            for probe in [probes.get(unit_state.ioc)]
+        )
+        output.write_records(records, format, HEALTH_FIELDS)
         print(
-            f"{ioc_name.ljust(max_ioc_name_len)}{state_str.ljust(max_status_len + ANSI_COLOR_ESC_CODE_LEN)}{'Enabled' if is_enabled else 'Disabled'}"  # noqa: E501
+            f"Health: {len(probes) + timed_out - unhealthy} healthy, {unhealthy} unhealthy.",
+            file=sys.stderr,
         )
+        return min(unhealthy, 1)
 
-    return ret
+    print(output.render_table(output.HEALTH_HEADER, output.health_rows(unit_states, probes)))
+    print(f"Health: {len(probes) + timed_out - unhealthy} healthy, {unhealthy} unhealthy.")
+    return min(unhealthy, 1)
 
 
 def nextport():
-    """Find the next unused procServ port."""
+    """Find the lowest unused procServ port."""
+
+    first, last = utils.PROCSERV_PORT_RANGE
+    with utils.inventory_snapshot() as inventory:
+        port = inventory.port_index.first_free(first, last, exclude=ports.listening_ports())
+
+    if port is None:
+        raise RuntimeError(f"No unused procServ port left in the range {first}-{last}!")
+    print(port)
+    return 0
 
-    used_ports = [ioc.procserv_port for ioc in utils.find_iocs().values()]
 
-    print(max(used_ports) + 1 if len(used_ports) > 0 else 4000)
+@utils.requires_root
+def cache(action: str):
+    """Manage the on-disk IOC inventory cache (rebuild or clear)."""
+
+    if action == "rebuild":
+        iocs = utils.rebuild_inventory_cache()
+        print(f"Rebuilt inventory cache with {len(iocs)} IOC(s).")
+    elif action == "clear":
+        utils.clear_inventory_cache()
+        print("Cleared inventory cache.")
+    else:
+        raise RuntimeError(f"Unknown cache action: {action}")
     return 0
 
 
@@ -346,18 +513,49 @@ def lastlog(ioc: str):
     if not log_file.exists():
         raise RuntimeError(f"No log file found for IOC '{ioc}' at '{log_file}'!")
 
-    with open(log_file) as f:
-        log = f.readlines()
-        start_index = 0
-        for i, line in reversed(list(enumerate(log))):
-            if line.strip() == f'@@@ Restarting child "{ioc}"':
-                start_index = i
-                break
-        if start_index == 0:
-            last_log = "".join(log)
-        else:
-            last_log = "".join(log[start_index:])
-        print(last_log)
+    with open(log_file, "rb") as f:
+        start_offset = logs_.find_last_marker(f, logs_.restart_marker(ioc))
+        logs_.copy_from(f, start_offset, sys.stdout)
+    print()
+    return 0
+
+
+@utils.requires_ioc_installed
+def logs(ioc: str, *iocs: str, follow: bool = False, since_restart: bool = False):
+    """Print the log of one or more IOCs, optionally following new output."""
+
+    names = [ioc, *iocs]
+    with utils.inventory_snapshot() as inventory:
+        for name in iocs:
+            if not inventory.is_installed(name):
+                raise RuntimeError(f"No IOC with name '{name}' is installed!")
+
+    followed = []
+    for name in names:
+        log_file = utils.MANAGE_IOCS_LOG_PATH / f"{name}.log"
+        if not log_file.exists() and not follow:
+            raise RuntimeError(f"No log file found for IOC '{name}' at '{log_file}'!")
+
+        log = logs_.FollowedLog(log_file, sys.stdout, prefix=f"{name}: " if iocs else "")
+        offset: int | None = 0
+        if log_file.exists() and since_restart:
+            with open(log_file, "rb") as f:
+                offset = logs_.find_last_marker(f, logs_.restart_marker(name))
+        elif follow and not since_restart:
+            offset = None
+        log.open(offset)
+        followed.append(log)
+
+    if not follow:
+        for log in followed:
+            log.update()
+            log.close()
+        return 0
+
+    try:
+        logs_.follow_logs(followed)
+    except KeyboardInterrupt:
+        pass
     return 0
 
 
@@ -366,10 +564,11 @@ def lastlog(ioc: str):
 def rename(ioc: str, new_name: str):
     """Rename an installed IOC."""
 
-    state, is_enabled = utils.get_ioc_status(ioc)
+    unit_state = utils.unit_state(ioc)
     uninstall(ioc)
 
-    ioc_config = utils.find_iocs()[ioc]
+    with utils.inventory_snapshot() as inventory:
+        ioc_config = inventory[ioc]
     with open(ioc_config.path / "config", "w") as f:
         f.write(f"NAME={new_name}\n")
         f.write(f"HOST={ioc_config.host}\n")
@@ -381,7 +580,19 @@ def rename(ioc: str, new_name: str):
             f.write(f"CHDIR={ioc_config.chdir}\n")
 
     install(new_name)
-    if is_enabled:
+    if unit_state.enabled:
         enable(new_name)
-    if state == "Running":
+    if unit_state.status == "Running":
         start(new_name)
+
+
+def agent():
+    """Run the resident agent that serves status, report and nextport over a socket."""
+
+    return agent_.serve()
+
+
+def exporter(*, address: str = "localhost", port: int = 9811, interval: float = 15.0):
+    """Serve Prometheus metrics about the IOCs on this host over HTTP."""
+
+    return exporter_.serve(address, port, interval)
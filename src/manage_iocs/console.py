@@ -0,0 +1,346 @@
+"""Client for the procServ console of an IOC.
+
+procServ serves the IOC console as a (minimal) telnet server. Rather than shelling out to
+``telnet``, the console is driven directly over an asyncio socket, with just enough of the
+telnet protocol implemented to keep procServ happy.
+"""
+
+import asyncio
+import contextlib
+import os
+import re
+import sys
+import termios
+import time
+import tty
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from .utils import EXEC_CONCURRENCY, EXEC_TIMEOUT, HEALTH_CONCURRENCY, HEALTH_TIMEOUT
+
+# Telnet protocol bytes, see RFC 854
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# Options we are happy to let the server enable: echo and suppress-go-ahead
+ACCEPTED_OPTIONS = {1, 3}
+
+# Detaches from the console, like the telnet escape character (^])
+ESCAPE_KEY = b"\x1d"
+
+# procServ is started with ``-i ^D^C^]``; never send these to the IOC
+IGNORED_KEYS = b"\x04\x03"
+
+READ_SIZE = 4096
+
+# Matches the iocsh prompt at the end of the console output, e.g. "epics> "
+DEFAULT_PROMPT = r"[\w:.\-]*> ?$"
+
+
+class TelnetParser:
+    """Strip telnet commands from a byte stream, and work out how to answer them.
+
+    Commands may be split across reads, so the parser keeps its state between calls.
+    """
+
+    def __init__(self):
+        self._state = "data"
+        self._command = 0
+
+    def feed(self, data: bytes) -> tuple[bytes, bytes]:
+        """Parse received bytes, returning the console output and any replies to send."""
+        output = bytearray()
+        replies = bytearray()
+        for byte in data:
+            if self._state == "data":
+                if byte == IAC:
+                    self._state = "iac"
+                else:
+                    output.append(byte)
+            elif self._state == "iac":
+                if byte == IAC:
+                    output.append(IAC)
+                    self._state = "data"
+                elif byte in (DO, DONT, WILL, WONT):
+                    self._command = byte
+                    self._state = "option"
+                elif byte == SB:
+                    self._state = "subnegotiation"
+                else:
+                    self._state = "data"
+            elif self._state == "option":
+                if self._command == DO:
+                    replies += bytes([IAC, WONT, byte])
+                elif self._command == WILL:
+                    replies += bytes([IAC, DO if byte in ACCEPTED_OPTIONS else DONT, byte])
+                self._state = "data"
+            elif self._state == "subnegotiation":
+                if byte == IAC:
+                    self._state = "subnegotiation-iac"
+            elif self._state == "subnegotiation-iac":
+                self._state = "data" if byte == SE else "subnegotiation"
+        return bytes(output), bytes(replies)
+
+
+def filter_keys(data: bytes) -> tuple[bytes, bool]:
+    """Prepare keystrokes for the IOC, returning them and whether to detach."""
+    detach = ESCAPE_KEY in data
+    data = data.split(ESCAPE_KEY, 1)[0]
+    data = data.translate(None, IGNORED_KEYS)
+    return data.replace(bytes([IAC]), bytes([IAC, IAC])), detach
+
+
+@contextlib.contextmanager
+def raw_terminal(fd: int):
+    """Put the terminal into raw mode for the duration of the block, if it is a terminal."""
+    if not os.isatty(fd):
+        yield
+        return
+    attributes = termios.tcgetattr(fd)
+    try:
+        tty.setraw(fd)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+
+
+async def _forward_output(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, out: BinaryIO
+):
+    parser = TelnetParser()
+    while data := await reader.read(READ_SIZE):
+        output, replies = parser.feed(data)
+        if replies:
+            writer.write(replies)
+        if output:
+            out.write(output)
+            out.flush()
+
+
+async def _forward_input(stdin_fd: int, writer: asyncio.StreamWriter):
+    loop = asyncio.get_running_loop()
+    keys: asyncio.Queue[bytes] = asyncio.Queue()
+    loop.add_reader(stdin_fd, lambda: keys.put_nowait(os.read(stdin_fd, READ_SIZE)))
+    try:
+        while data := await keys.get():
+            data, detach = filter_keys(data)
+            if data:
+                writer.write(data)
+                await writer.drain()
+            if detach:
+                break
+    finally:
+        loop.remove_reader(stdin_fd)
+
+
+async def run_console(
+    host: str, port: int, stdin_fd: int | None = None, out: BinaryIO | None = None
+) -> int:
+    """Relay a terminal to the procServ console until detached or the server hangs up."""
+    stdin_fd = sys.stdin.fileno() if stdin_fd is None else stdin_fd
+    out = sys.stdout.buffer if out is None else out
+
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as e:
+        raise RuntimeError(f"Could not connect to procServ at {host}:{port}: {e}") from e
+
+    output_task = asyncio.create_task(_forward_output(reader, writer, out))
+    input_task = asyncio.create_task(_forward_input(stdin_fd, writer))
+    try:
+        with raw_terminal(stdin_fd):
+            await asyncio.wait([output_task, input_task], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (output_task, input_task):
+            task.cancel()
+        await asyncio.gather(output_task, input_task, return_exceptions=True)
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
+    return 0
+
+
+def attach_console(host: str, port: int) -> int:
+    """Attach the current terminal to the procServ console at the given port."""
+    return asyncio.run(run_console(host, port))
+
+
+@dataclass
+class ExecResult:
+    """Output of a command run on the console of a single IOC."""
+
+    ioc: str
+    output: str = ""
+    error: str = ""
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.error
+
+
+async def _read_until_prompt(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    parser: TelnetParser,
+    prompt: re.Pattern,
+) -> str:
+    """Read console output until the last (incomplete) line looks like the prompt."""
+    received = ""
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            raise ConnectionError("procServ closed the connection")
+        output, replies = parser.feed(data)
+        if replies:
+            writer.write(replies)
+        received += output.decode(errors="replace").replace("\r", "")
+        if prompt.search(received.rpartition("\n")[2]):
+            return received
+
+
+async def run_command(host: str, port: int, command: str, prompt: str = DEFAULT_PROMPT) -> str:
+    """Run one command on a procServ console and return what it printed."""
+    pattern = re.compile(prompt)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        parser = TelnetParser()
+        # Ask for a fresh prompt so we know the IOC shell is ready
+        writer.write(b"\r\n")
+        await _read_until_prompt(reader, writer, parser, pattern)
+
+        writer.write(command.encode() + b"\r\n")
+        output = await _read_until_prompt(reader, writer, parser, pattern)
+    finally:
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
+
+    lines = output.split("\n")[:-1]  # Drop the trailing prompt
+    if lines and lines[0].strip() == command.strip():
+        lines = lines[1:]  # Drop the echoed command
+    return "\n".join(lines)
+
+
+async def exec_on_iocs(
+    command: str,
+    ports: dict[str, int],
+    host: str = "localhost",
+    concurrency: int = EXEC_CONCURRENCY,
+    timeout: float = EXEC_TIMEOUT,
+    prompt: str = DEFAULT_PROMPT,
+) -> list[ExecResult]:
+    """Run a command on the consoles of many IOCs concurrently.
+
+    At most ``concurrency`` consoles are open at once, and each IOC gets ``timeout``
+    seconds to respond. Results are returned in the same order as ``ports``.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run_one(ioc: str, port: int) -> ExecResult:
+        async with semaphore:
+            try:
+                output = await asyncio.wait_for(run_command(host, port, command, prompt), timeout)
+            except TimeoutError:
+                return ExecResult(ioc, error=f"timed out after {timeout:g}s")
+            except OSError as e:
+                return ExecResult(ioc, error=str(e) or type(e).__name__)
+        return ExecResult(ioc, output=output)
+
+    return await asyncio.gather(*(run_one(ioc, port) for ioc, port in ports.items()))
+
+
+@dataclass
+class HealthResult:
+    """Outcome of probing the procServ console of a single IOC.
+
+    Latencies are in seconds, and None if that stage of the probe was never reached.
+    """
+
+    ioc: str
+    connect_time: float | None = None
+    first_byte_time: float | None = None
+    # Whether the IOC shell answered with a prompt, or None if that was not checked
+    responds: bool | None = None
+    error: str = ""
+
+    @property
+    def healthy(self) -> bool:
+        return not self.error and self.responds is not False
+
+
+async def probe_console(
+    result: HealthResult, host: str, port: int, check_console: bool, prompt: re.Pattern
+):
+    """Fill in the result as each stage of the probe completes.
+
+    The result is updated in place, so that the stages reached so far are kept if the
+    probe is cancelled.
+    """
+    start = time.monotonic()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        result.connect_time = time.monotonic() - start
+        parser = TelnetParser()
+        received = b""
+        # procServ greets every new connection, so the first bytes arrive unprompted
+        while not received:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                raise ConnectionError("procServ closed the connection")
+            received, replies = parser.feed(data)
+            if replies:
+                writer.write(replies)
+        result.first_byte_time = time.monotonic() - start
+
+        if check_console:
+            result.responds = False
+            # An empty command is a no-op for the IOC shell, which just prints its prompt
+            writer.write(b"\r\n")
+            await _read_until_prompt(reader, writer, parser, prompt)
+            result.responds = True
+    finally:
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
+
+
+async def probe_iocs(
+    ports: dict[str, int],
+    host: str = "localhost",
+    check_console: bool = False,
+    concurrency: int = HEALTH_CONCURRENCY,
+    timeout: float = HEALTH_TIMEOUT,
+    prompt: str = DEFAULT_PROMPT,
+) -> list[HealthResult]:
+    """Probe the consoles of many IOCs concurrently, within one overall timeout.
+
+    Results are returned in the same order as ``ports``.
+    """
+    pattern = re.compile(prompt)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    results = [HealthResult(ioc) for ioc in ports]
+
+    async def run_one(result: HealthResult, port: int):
+        try:
+            async with semaphore:
+                await probe_console(result, host, port, check_console, pattern)
+        except asyncio.CancelledError:
+            result.error = f"timed out after {timeout:g}s"
+        except OSError as e:
+            result.error = str(e) or type(e).__name__
+
+    tasks = [
+        asyncio.create_task(run_one(result, port))
+        for result, port in zip(results, ports.values(), strict=True)
+    ]
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending)
+    return results
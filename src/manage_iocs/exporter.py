@@ -0,0 +1,203 @@
+"""Prometheus exporter for the state of the IOCs on this host.
+
+``manage-iocs exporter`` serves ``/metrics`` over HTTP in the Prometheus text format. The
+metrics are collected by a background thread every refresh interval and kept in memory,
+so a scrape only ever returns the last collected text: scrapes never rescan the search
+paths or query systemd themselves, however often they come.
+"""
+
+import asyncio
+import http.server
+import threading
+import time
+
+from . import console, logs, utils
+
+# How long the procServ ports of all IOCs may take to answer, in total
+PROBE_TIMEOUT = 2.0
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metric_family(
+    name: str, kind: str, description: str, samples: list[tuple[dict[str, str], float]]
+) -> list[str]:
+    """Format one metric family in the Prometheus text exposition format."""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_str = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_str}}} {value:g}" if label_str else f"{name} {value:g}")
+    return lines
+
+
+class MetricsCollector:
+    """Collect the metrics of every installed IOC, keeping the result in memory."""
+
+    def __init__(self, probe_timeout: float = PROBE_TIMEOUT):
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._text = ""
+        self._restart_counters: dict[str, logs.MarkerCounter] = {}
+
+    @property
+    def text(self) -> str:
+        """The metrics as of the last refresh."""
+        with self._lock:
+            return self._text
+
+    def _count_restarts(self, ioc: str) -> int:
+        if ioc not in self._restart_counters:
+            self._restart_counters[ioc] = logs.MarkerCounter(
+                utils.MANAGE_IOCS_LOG_PATH / f"{ioc}.log", logs.restart_marker(ioc)
+            )
+        return self._restart_counters[ioc].update()
+
+    def refresh(self):
+        """Rescan the inventory and query every IOC, replacing the metrics served."""
+        durations = {}
+        start = time.monotonic()
+        with utils.inventory_snapshot(utils.Inventory()) as inventory:
+            installed = inventory.installed
+            durations["scan"] = time.monotonic() - start
+
+            start = time.monotonic()
+            unit_states = utils.systemctl_show(list(installed))
+            durations["systemd"] = time.monotonic() - start
+
+        start = time.monotonic()
+        running = {
+            ioc: installed[ioc].procserv_port
+            for ioc, unit_state in unit_states.items()
+            if unit_state.status == "Running"
+        }
+        probes = asyncio.run(console.probe_iocs(running, timeout=self.probe_timeout))
+        reachable = {probe.ioc for probe in probes if probe.connect_time is not None}
+        durations["probe"] = time.monotonic() - start
+
+        start = time.monotonic()
+        restarts = {ioc: self._count_restarts(ioc) for ioc in installed}
+        for ioc in self._restart_counters.keys() - installed.keys():
+            del self._restart_counters[ioc]
+        durations["logs"] = time.monotonic() - start
+
+        # IOCs whose state systemd did not report in time are neither up nor down
+        iocs = [ioc for ioc in installed if ioc in unit_states and not unit_states[ioc].timed_out]
+        unknown = [ioc for ioc in installed if ioc not in iocs]
+        lines = [
+            *metric_family(
+                "manage_iocs_installed_iocs",
+                "gauge",
+                "Number of IOCs installed on this host.",
+                [({}, len(installed))],
+            ),
+            *metric_family(
+                "manage_iocs_ioc_active",
+                "gauge",
+                "Whether the systemd unit of the IOC is active.",
+                [({"ioc": ioc}, unit_states[ioc].active_state == "active") for ioc in iocs],
+            ),
+            *metric_family(
+                "manage_iocs_ioc_enabled",
+                "gauge",
+                "Whether the IOC is started automatically at boot.",
+                [({"ioc": ioc}, unit_states[ioc].enabled) for ioc in iocs],
+            ),
+            *metric_family(
+                "manage_iocs_ioc_state_unknown",
+                "gauge",
+                "Whether systemd did not report the state of the IOC in time.",
+                [({"ioc": ioc}, ioc in unknown) for ioc in installed],
+            ),
+            *metric_family(
+                "manage_iocs_procserv_up",
+                "gauge",
+                "Whether the procServ port of the IOC accepts connections.",
+                [
+                    ({"ioc": ioc, "port": str(installed[ioc].procserv_port)}, ioc in reachable)
+                    for ioc in iocs
+                ],
+            ),
+            *metric_family(
+                "manage_iocs_ioc_restarts_total",
+                "counter",
+                "Number of times procServ (re)started the IOC, according to its log.",
+                [({"ioc": ioc}, restarts[ioc]) for ioc in installed],
+            ),
+            *metric_family(
+                "manage_iocs_refresh_duration_seconds",
+                "gauge",
+                "Time taken by each stage of the last refresh.",
+                [({"stage": stage}, duration) for stage, duration in durations.items()],
+            ),
+            *metric_family(
+                "manage_iocs_last_refresh_timestamp_seconds",
+                "gauge",
+                "Unix time of the last refresh.",
+                [({}, time.time())],
+            ),
+        ]
+        with self._lock:
+            self._text = "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    server: "ExporterServer"
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.collector.text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are too frequent to be worth logging
+
+
+class ExporterServer(http.server.ThreadingHTTPServer):
+    """Serve the metrics of a collector, refreshing them in a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], collector: MetricsCollector, interval: float):
+        super().__init__(address, _MetricsHandler)
+        self.collector = collector
+        self.interval = interval
+        self._stop = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.collector.refresh()
+            except Exception as e:
+                print(f"Failed to refresh metrics: {e}")
+
+    def start_refreshing(self):
+        self._refresher.start()
+
+    def server_close(self):
+        self._stop.set()
+        super().server_close()
+
+
+def serve(address: str, port: int, interval: float):
+    """Run the exporter until interrupted."""
+    collector = MetricsCollector()
+    collector.refresh()
+    with ExporterServer((address, port), collector, interval) as server:
+        server.start_refreshing()
+        print(f"manage-iocs exporter listening on http://{address}:{port}/metrics")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
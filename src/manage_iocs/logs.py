@@ -0,0 +1,268 @@
+"""Helpers for reading procServ log files without loading them into memory.
+
+procServ logs of long-running IOCs grow to several gigabytes, so these helpers only ever
+hold one block of the file at a time: markers are searched for by reading backwards from
+the end, and the interesting section is then streamed out block by block. Logs can
+also be followed live, using inotify to wake up only when they change.
+"""
+
+import codecs
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import BinaryIO, TextIO
+
+LOG_BLOCK_SIZE = 64 * 1024
+
+
+def restart_marker(ioc: str) -> bytes:
+    """Get the line procServ writes to the log whenever it (re)starts the IOC."""
+    return f'@@@ Restarting child "{ioc}"'.encode()
+
+
+def find_last_marker(f: BinaryIO, marker: bytes, block_size: int = LOG_BLOCK_SIZE) -> int:
+    """Find the offset of the last line of the file consisting only of the marker.
+
+    The file is read backwards one block at a time. Returns 0 if the marker is not found.
+    """
+    position = f.seek(0, os.SEEK_END)
+    partial = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        lines = (f.read(read_size) + partial).split(b"\n")
+
+        line_starts = [position]
+        for line in lines[:-1]:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+
+        # The first line may continue into the previous block, unless this is the start
+        first = 1 if position > 0 else 0
+        partial = lines[0] if position > 0 else b""
+        for line_start, line in zip(
+            reversed(line_starts[first:]), reversed(lines[first:]), strict=True
+        ):
+            if line.strip() == marker:
+                return line_start
+    return 0
+
+
+def copy_from(f: BinaryIO, offset: int, out: TextIO, block_size: int = LOG_BLOCK_SIZE) -> int:
+    """Decode and write the file from the given offset to the end, returning bytes copied."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    f.seek(offset)
+    copied = 0
+    while block := f.read(block_size):
+        out.write(decoder.decode(block))
+        copied += len(block)
+    out.write(decoder.decode(b"", final=True))
+    return copied
+
+
+class MarkerCounter:
+    """Count the occurrences of a marker in a log, reading only what was appended since.
+
+    If the log is truncated or replaced (e.g. by logrotate), counting starts over.
+    """
+
+    def __init__(self, path: Path, marker: bytes):
+        self.path = path
+        self.marker = marker
+        self.count = 0
+        self._inode: int | None = None
+        self._offset = 0
+        # The end of the last block read, in case a marker is split across reads
+        self._carry = b""
+
+    def update(self, block_size: int = LOG_BLOCK_SIZE) -> int:
+        """Count any new markers, returning the total so far."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self.count
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._inode = st.st_ino
+            self._offset = 0
+            self._carry = b""
+            self.count = 0
+
+        keep = len(self.marker) - 1
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            while block := f.read(block_size):
+                data = self._carry + block
+                self.count += data.count(self.marker)
+                self._carry = data[-keep:] if keep else b""
+                self._offset += len(block)
+        return self.count
+
+
+# Flags from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Everything that can mean a watched log has grown, been truncated, or been rotated
+LOG_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal wrapper around the Linux inotify API."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        """Watch the given path, returning the watch descriptor."""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"Could not watch '{path}': {os.strerror(errno)}")
+        return wd
+
+    def read_events(self) -> list[tuple[int, int, str]]:
+        """Read all pending events as (watch descriptor, mask, name) tuples."""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+
+class FollowedLog:
+    """A log file being followed, which survives truncation and rotation."""
+
+    def __init__(self, path: Path, out: TextIO, prefix: str = ""):
+        self.path = path
+        self.out = out
+        self.prefix = prefix
+        self._file: BinaryIO | None = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+
+    def open(self, offset: int | None = None):
+        """Open the log, positioned at the given offset or at the end."""
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            self._file = None
+            return
+        if offset is None:
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file.seek(offset)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._write("", final=True)
+
+    def update(self):
+        """Write anything new in the log, following truncation and rotation."""
+        if self._file is not None:
+            if os.fstat(self._file.fileno()).st_size < self._file.tell():
+                self._file.seek(0)
+            self._drain()
+
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self._file is None or inode != os.fstat(self._file.fileno()).st_ino:
+            if self._file is not None:
+                self._file.close()
+            self.open(offset=0)
+            if self._file is not None:
+                self._drain()
+
+    def _drain(self):
+        assert self._file is not None
+        while block := self._file.read(LOG_BLOCK_SIZE):
+            self._write(self._decoder.decode(block))
+        self.out.flush()
+
+    def _write(self, text: str, final: bool = False):
+        if not self.prefix:
+            self.out.write(text)
+            return
+        lines = (self._pending + text).split("\n")
+        self._pending = "" if final else lines.pop()
+        for line in lines:
+            if line or not final:
+                self.out.write(f"{self.prefix}{line}\n")
+
+
+def follow_logs(
+    logs: list[FollowedLog], stop: threading.Event | None = None, poll_interval: float = 0.5
+):
+    """Stream new output from the given logs until interrupted or the event is set.
+
+    Rather than polling, the directories holding the logs are watched with inotify, so
+    rotated or recreated files are picked up as soon as they appear.
+    """
+    inotify = Inotify()
+    try:
+        watched: dict[int, dict[str, FollowedLog]] = {}
+        directories: dict[Path, int] = {}
+        for log in logs:
+            directory = log.path.parent
+            if directory not in directories:
+                directories[directory] = inotify.add_watch(directory, LOG_EVENTS | IN_ONLYDIR)
+            watched.setdefault(directories[directory], {})[log.path.name] = log
+
+        # Catch up on anything written before the watches were in place
+        for log in logs:
+            log.update()
+
+        while stop is None or not stop.is_set():
+            ready, _, _ = select.select([inotify], [], [], poll_interval)
+            if not ready:
+                continue
+            changed: dict[int, FollowedLog] = {}
+            for wd, mask, name in inotify.read_events():
+                if mask & IN_Q_OVERFLOW:
+                    changed.update((id(log), log) for log in logs)
+                elif name in watched.get(wd, {}):
+                    log = watched[wd][name]
+                    changed[id(log)] = log
+            for log in changed.values():
+                log.update()
+    finally:
+        inotify.close()
+        for log in logs:
+            log.close()
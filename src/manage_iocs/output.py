@@ -0,0 +1,309 @@
+"""Helpers for presenting the results of multi-IOC commands."""
+
+import csv
+import json
+import re
+import sys
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from . import _lazy
+from .utils import BulkResult, UnitState
+
+# Only needed for annotations, so tables do not load the console and cgroup support
+cgroups = _lazy.lazy_import("manage_iocs.cgroups")
+console = _lazy.lazy_import("manage_iocs.console")
+
+EXTRA_PAD_WIDTH = 5
+
+OUTPUT_FORMATS = ("table", "json", "ndjson", "csv")
+
+ANSI_ESCAPE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+
+
+def check_format(format: str):
+    """Raise if the given output format is not supported."""
+    if format not in OUTPUT_FORMATS:
+        raise RuntimeError(
+            f"Unknown output format: {format} (expected one of {', '.join(OUTPUT_FORMATS)})"
+        )
+
+
+def write_records(records: Iterable[dict[str, Any]], format: str, fields: list[str]) -> int:
+    """Stream records to stdout in a machine-readable format, returning how many were written.
+
+    Each record is written and flushed as soon as it is produced, so that consumers can
+    start processing before the whole fleet has been queried.
+    """
+    count = 0
+    if format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+    elif format == "json":
+        sys.stdout.write("[")
+
+    for record in records:
+        if format == "csv":
+            writer.writerow(record)
+        elif format == "json":
+            sys.stdout.write(("," if count else "") + "\n  " + json.dumps(record))
+        else:
+            sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
+        count += 1
+
+    if format == "json":
+        sys.stdout.write("\n]\n" if count else "]\n")
+    sys.stdout.flush()
+    return count
+
+
+def _cell_width(cell: str) -> int:
+    return len(ANSI_ESCAPE.sub("", cell))
+
+
+def table_widths(header: list[str], rows: list[list[str]]) -> list[int]:
+    """Get the padded width of every column but the last, ignoring ANSI color codes."""
+    return [
+        max(_cell_width(row[i]) for row in [header, *rows]) + EXTRA_PAD_WIDTH
+        for i in range(len(header) - 1)
+    ]
+
+
+def render_row(row: list[str], widths: list[int], separator: str = "") -> str:
+    """Render one table row, padding each cell to its column width."""
+    cells = [cell + " " * (widths[i] - _cell_width(cell)) for i, cell in enumerate(row[:-1])]
+    return separator.join([*cells, row[-1]])
+
+
+def render_table(header: list[str], rows: list[list[str]], separator: str = "") -> str:
+    """Render rows into an aligned table, ignoring ANSI color codes when measuring cells."""
+    widths = table_widths(header, rows)
+    header_line = render_row(header, widths, separator)
+    return "\n".join(
+        [header_line, "-" * len(header_line), *(render_row(row, widths, separator) for row in rows)]
+    )
+
+
+STATUS_HEADER = ["IOC", "Status", "Auto-Start"]
+
+
+def _colored_status(state: str) -> str:
+    if state == "Running":
+        return f"\033[92m{state}\033[0m"  # Green
+    elif state == "Stopped":
+        return f"\033[91m{state}\033[0m"  # Red
+    return f"\033[93m{state}\033[0m"  # Yellow
+
+
+def _auto_start(unit_state: UnitState) -> str:
+    if unit_state.timed_out:
+        return "-"
+    # e.g. "Masked" or "Static", or "Not-found" if systemd was not reloaded yet
+    return (unit_state.unit_file_state or unit_state.load_state).capitalize() or "-"
+
+
+def status_rows(unit_states: Iterable[UnitState]) -> list[list[str]]:
+    """Build the rows of the status table, with the state of each IOC in color."""
+    return [
+        [unit_state.ioc, _colored_status(unit_state.status), _auto_start(unit_state)]
+        for unit_state in unit_states
+    ]
+
+
+def warn_timed_out(unit_states: Iterable[UnitState]) -> int:
+    """Warn about IOCs whose state systemd did not report in time, returning their number."""
+    timed_out = [unit_state.ioc for unit_state in unit_states if unit_state.timed_out]
+    if timed_out:
+        print(
+            f"Warning: systemd did not report the state of {len(timed_out)} IOC(s) in time: "
+            f"{', '.join(timed_out)}",
+            file=sys.stderr,
+        )
+    return len(timed_out)
+
+
+HEALTH_HEADER = ["IOC", "Status", "Connect", "First Byte", "Console", "Health"]
+
+
+def _milliseconds(seconds: float | None) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+
+def health_rows(
+    unit_states: Iterable[UnitState], probes: dict[str, "console.HealthResult"]
+) -> list[list[str]]:
+    """Build the rows of the health table, showing probe results next to the unit state."""
+    rows = []
+    for unit_state in unit_states:
+        probe = probes.get(unit_state.ioc)
+        if probe is None:
+            rows.append([unit_state.ioc, _colored_status(unit_state.status), "-", "-", "-", "-"])
+            continue
+        console_str = {None: "-", True: "Responds", False: "No prompt"}[probe.responds]
+        if probe.healthy:
+            health_str = "\033[92mOK\033[0m"
+        else:
+            health_str = f"\033[91mFAILED\033[0m ({probe.error or 'console did not respond'})"
+        rows.append(
+            [
+                unit_state.ioc,
+                _colored_status(unit_state.status),
+                _milliseconds(probe.connect_time),
+                _milliseconds(probe.first_byte_time),
+                console_str,
+                health_str,
+            ]
+        )
+    return rows
+
+
+# Minimum column width while watching, leaving room for longer states such as Activating
+WATCH_STATUS_WIDTH = 12
+
+
+def watch_table(
+    header: list[str],
+    fetch_rows: Callable[[], list[list[str]]],
+    interval: float,
+    max_updates: int | None = None,
+) -> int:
+    """Redraw a table in place every interval, until interrupted.
+
+    The first column identifies each row. After the first full draw, only the rows that
+    changed since the previous refresh are rewritten, using ANSI cursor movement. The
+    whole table is redrawn only if rows appear or disappear, or a cell outgrows its column.
+    """
+    previous: list[list[str]] = []
+    widths: list[int] = []
+    updates = 0
+    try:
+        while True:
+            rows = fetch_rows()
+            chunks = []
+            if [row[0] for row in rows] != [row[0] for row in previous] or any(
+                _cell_width(cell) + EXTRA_PAD_WIDTH > width
+                for row in rows
+                for cell, width in zip(row, widths, strict=False)
+            ):
+                widths = [max(width, WATCH_STATUS_WIDTH) for width in table_widths(header, rows)]
+                header_line = render_row(header, widths)
+                chunks.append("\033[H\033[2J" + header_line + "\n" + "-" * len(header_line))
+                chunks.extend("\n" + render_row(row, widths) for row in rows)
+            else:
+                for i, row in enumerate(rows):
+                    if row != previous[i]:
+                        # The header and rule take up the first two lines of the screen
+                        chunks.append(f"\033[{i + 3};1H\033[2K{render_row(row, widths)}")
+            footer_line = len(rows) + 3
+            chunks.append(
+                f"\033[{footer_line};1H\033[2K"
+                f"Every {interval:g}s, last updated {time.strftime('%H:%M:%S')}"
+            )
+            sys.stdout.write("".join(chunks))
+            sys.stdout.flush()
+
+            previous = rows
+            updates += 1
+            if max_updates is not None and updates >= max_updates:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    sys.stdout.write("\n")
+    return 0
+
+
+def print_bulk_results(action: str, results: dict[str, BulkResult], elapsed: float) -> int:
+    """Print the outcome of a bulk action for each IOC, returning the number of failures."""
+
+    failures = [result for result in results.values() if not result.succeeded]
+    if len(results) > 0:
+        max_ioc_name_len = max(len(ioc) for ioc in results)
+        for ioc, result in results.items():
+            outcome = "OK" if result.succeeded else "FAILED"
+            if result.detail:
+                outcome += f" ({result.detail})"
+            print(f"  {ioc.ljust(max_ioc_name_len)}  {outcome}")
+
+    print(
+        f"{action.capitalize()}: {len(results) - len(failures)} succeeded, "
+        f"{len(failures)} failed in {elapsed:.2f}s."
+    )
+    return len(failures)
+
+
+USAGE_HEADER = ["IOC", "CPU", "Memory", "Read", "Write"]
+
+
+def format_bytes(count: float) -> str:
+    """Format a number of bytes with a binary unit, e.g. ``12.3 MiB``."""
+    if abs(count) < 1024:
+        return f"{count:.0f} B"
+    for unit in ("KiB", "MiB", "GiB", "TiB"):
+        count /= 1024
+        if abs(count) < 1024 or unit == "TiB":
+            break
+    return f"{count:.1f} {unit}"
+
+
+def usage_rows(usages: Iterable["cgroups.Usage"]) -> list[list[str]]:
+    """Build the rows of the usage table."""
+    return [
+        [
+            usage.ioc,
+            f"{usage.cpu_percent:.1f}%",
+            format_bytes(usage.memory_bytes),
+            f"{format_bytes(usage.io_read_rate)}/s",
+            f"{format_bytes(usage.io_write_rate)}/s",
+        ]
+        for usage in usages
+    ]
+
+
+# How many of the slowest IOCs to name after a rolling restart
+SLOWEST_COUNT = 3
+
+
+def print_slowest(downtimes: dict[str, float], count: int = SLOWEST_COUNT):
+    """Name the IOCs that were unavailable the longest."""
+    if downtimes:
+        slowest = sorted(downtimes.items(), key=lambda item: item[1], reverse=True)[:count]
+        print("Slowest: " + ", ".join(f"{ioc} ({downtime:.1f}s)" for ioc, downtime in slowest))
+
+
+EXEC_FORMATS = ("text", "json")
+
+
+def print_exec_results(results: list["console.ExecResult"], format: str = "text") -> int:
+    """Print the console output collected from each IOC, returning the number of failures."""
+
+    failures = [result for result in results if not result.succeeded]
+    if format == "json":
+        write_records(
+            (
+                {
+                    "ioc": result.ioc,
+                    "succeeded": result.succeeded,
+                    "output": result.output,
+                    "error": result.error,
+                }
+                for result in results
+            ),
+            "json",
+            ["ioc", "succeeded", "output", "error"],
+        )
+        print(
+            f"Exec: {len(results) - len(failures)} succeeded, {len(failures)} failed.",
+            file=sys.stderr,
+        )
+        return len(failures)
+
+    lines = []
+    for result in results:
+        lines.append(f"==> {result.ioc} <==")
+        lines.append(result.output if result.succeeded else f"FAILED ({result.error})")
+    lines.append(f"Exec: {len(results) - len(failures)} succeeded, {len(failures)} failed.")
+    print("\n".join(lines))
+    return len(failures)
@@ -0,0 +1,76 @@
+"""Allocation of procServ ports.
+
+Ports are handed out from a sorted index of the ports configured for the IOCs on this
+host, so that ports freed by removed IOCs are reused, and so that checking whether a port
+is taken is a binary search rather than a scan of every IOC. Ports that other programs are
+already listening on are skipped as well.
+"""
+
+import bisect
+from collections.abc import Container, Iterable
+from pathlib import Path
+
+from .utils import IOC
+
+PROC_NET_TCP = [Path("/proc/net/tcp"), Path("/proc/net/tcp6")]
+
+# Socket state of a listening socket in /proc/net/tcp
+TCP_LISTEN = "0A"
+
+
+class PortIndex:
+    """Sorted index of the procServ ports configured for a set of IOCs."""
+
+    def __init__(self, iocs: Iterable[IOC]):
+        entries = sorted((ioc.procserv_port, ioc.name) for ioc in iocs)
+        self._ports = [port for port, _ in entries]
+        self._names = [name for _, name in entries]
+
+    def __len__(self) -> int:
+        return len(self._ports)
+
+    def __contains__(self, port: int) -> bool:
+        i = bisect.bisect_left(self._ports, port)
+        return i < len(self._ports) and self._ports[i] == port
+
+    def owners(self, port: int) -> list[str]:
+        """Get the names of the IOCs configured to use the given port."""
+        start = bisect.bisect_left(self._ports, port)
+        end = bisect.bisect_right(self._ports, port, lo=start)
+        return self._names[start:end]
+
+    def duplicates(self) -> dict[int, list[str]]:
+        """Get the ports that are configured for more than one IOC, and their IOCs."""
+        duplicates: dict[int, list[str]] = {}
+        for i in range(1, len(self._ports)):
+            if self._ports[i] == self._ports[i - 1]:
+                duplicates.setdefault(self._ports[i], [self._names[i - 1]]).append(self._names[i])
+        return duplicates
+
+    def first_free(self, first: int, last: int, exclude: Container[int] = ()) -> int | None:
+        """Get the lowest port in [first, last] not configured for any IOC nor excluded."""
+        i = bisect.bisect_left(self._ports, first)
+        port = first
+        while port <= last:
+            if i < len(self._ports) and self._ports[i] == port:
+                i = bisect.bisect_right(self._ports, port, lo=i)
+            elif port not in exclude:
+                return port
+            port += 1
+        return None
+
+
+def listening_ports(proc_files: Iterable[Path] | None = None) -> set[int]:
+    """Get the local TCP ports that any program on this host is listening on."""
+    ports = set()
+    for proc_file in PROC_NET_TCP if proc_files is None else proc_files:
+        try:
+            with open(proc_file) as f:
+                next(f, None)  # Column headings
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 3 and fields[3] == TCP_LISTEN:
+                        ports.add(int(fields[1].rpartition(":")[2], 16))
+        except OSError:
+            continue
+    return ports
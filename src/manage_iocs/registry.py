@@ -0,0 +1,153 @@
+"""Static registry of the commands provided by :mod:`manage_iocs.commands`.
+
+Resolving a command, checking its arguments and printing help only need what is recorded
+here, so the CLI does not have to import (and introspect) the commands module and
+everything it depends on before it knows what to run. The test suite checks that the
+registry matches the signatures and docstrings in the commands module.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+EXTRA_PAD_WIDTH = 5
+
+
+@dataclass(frozen=True)
+class CommandInfo:
+    """Arguments accepted by a command, and its one-line description."""
+
+    doc: str
+    # Names of the required positional arguments
+    params: tuple[str, ...] = ()
+    # Name of the trailing variadic argument, if the command accepts one
+    varargs: str = ""
+    # Keyword-only ``--option`` parameters, with their defaults
+    options: dict[str, Any] = field(default_factory=dict)
+    # Read-only commands that a running agent may serve instead (see ``agent.py``)
+    served_by_agent: bool = False
+
+    @property
+    def arity(self) -> int:
+        return len(self.params)
+
+
+BULK_OPTIONS = {"chunk": 0, "timeout": 300.0}
+
+COMMANDS: dict[str, CommandInfo] = {
+    "agent": CommandInfo(
+        "Run the resident agent that serves status, report and nextport over a socket."
+    ),
+    "attach": CommandInfo("Connect to procServ telnet server for the given IOC.", ("ioc",)),
+    "cache": CommandInfo("Manage the on-disk IOC inventory cache (rebuild or clear).", ("action",)),
+    "disable": CommandInfo("Disable autostart for the given IOC.", ("ioc",)),
+    "disableall": CommandInfo("Disable autostart for all IOCs on this host.", options=BULK_OPTIONS),
+    "enable": CommandInfo("Enable autostart for the given IOC.", ("ioc",)),
+    "enableall": CommandInfo("Enable autostart for all IOCs on this host.", options=BULK_OPTIONS),
+    "exec": CommandInfo(
+        "Run an iocsh command on the console of the given IOCs (or --all running IOCs).",
+        ("command",),
+        varargs="iocs",
+        options={"all": False, "parallel": 16, "timeout": 10.0, "format": "text"},
+    ),
+    "exporter": CommandInfo(
+        "Serve Prometheus metrics about the IOCs on this host over HTTP.",
+        options={"address": "localhost", "port": 9811, "interval": 15.0},
+    ),
+    "health": CommandInfo(
+        "Probe the procServ port of every running IOC, alongside its systemd state.",
+        options={"check_console": False, "timeout": 5.0, "format": "table"},
+    ),
+    "help": CommandInfo("Display this help message."),
+    "install": CommandInfo(
+        "Create /etc/systemd/system/softioc-[ioc].service for the given IOCs (or --all).",
+        varargs="iocs",
+        options={"all": False},
+    ),
+    "lastlog": CommandInfo("Display the output of the last IOC startup", ("ioc",)),
+    "logs": CommandInfo(
+        "Print the log of one or more IOCs, optionally following new output.",
+        ("ioc",),
+        varargs="iocs",
+        options={"follow": False, "since_restart": False},
+    ),
+    "nextport": CommandInfo("Find the lowest unused procServ port.", served_by_agent=True),
+    "rename": CommandInfo("Rename an installed IOC.", ("ioc", "new_name")),
+    "report": CommandInfo(
+        "Show config(s) of an all IOCs on localhost (or on --host)",
+        options={"format": "table", "host": ""},
+        served_by_agent=True,
+    ),
+    "restart": CommandInfo("Restart the given IOC.", ("ioc",)),
+    "restartall": CommandInfo(
+        "Restart all running IOCs on this host in waves, waiting for each wave to be ready.",
+        options={"batch": 1, "max_unavailable": 0, "timeout": 300.0},
+    ),
+    "start": CommandInfo("Start the given IOC.", ("ioc",)),
+    "startall": CommandInfo("Start all IOCs on this host.", options=BULK_OPTIONS),
+    "status": CommandInfo(
+        "Get the status of the given IOC.",
+        options={"format": "table", "watch": False, "interval": 2.0},
+        served_by_agent=True,
+    ),
+    "stop": CommandInfo("Stop the given IOC.", ("ioc",)),
+    "stopall": CommandInfo("Stop all IOCs on this host.", options=BULK_OPTIONS),
+    "sync": CommandInfo(
+        "Rewrite outdated service files of installed IOCs (and --restart the running ones).",
+        options={"restart": False, "dry_run": False},
+    ),
+    "uninstall": CommandInfo(
+        "Remove /etc/systemd/system/softioc-[ioc].service for the given IOCs (or --all).",
+        varargs="iocs",
+        options={"all": False},
+    ),
+    "usage": CommandInfo(
+        "Show the CPU, memory and I/O usage of every running IOC, from its cgroup.",
+        options={"interval": 1.0, "sort": "cpu", "format": "table"},
+    ),
+    "version": CommandInfo("Print the version of the manage-iocs package."),
+}
+
+GLOBAL_OPTIONS = {
+    "--no-cache": "Bypass the inventory cache.",
+    "--no-agent": "Do not use a running agent.",
+    "--trace <file>": "Write a Chrome trace-event JSON of where the time went (for Perfetto).",
+    "--timings": "Print the time spent in each phase to stderr.",
+}
+
+
+def usage(name: str, options: bool = True) -> str:
+    """Describe how to call a command, e.g. ``logs <ioc> [iocs...] [--follow]``."""
+    info = COMMANDS[name]
+    words = [name, *(f"<{param}>" for param in info.params)]
+    if info.varargs:
+        words.append(f"[{info.varargs}...]")
+    if options:
+        words += option_usage(name)
+    return " ".join(words)
+
+
+def option_usage(name: str) -> list[str]:
+    """Describe the ``--options`` of a command, e.g. ``[--follow]``."""
+    words = []
+    for option, default in COMMANDS[name].options.items():
+        flag = f"--{option.replace('_', '-')}"
+        words.append(f"[{flag}]" if isinstance(default, bool) else f"[{flag} <{option}>]")
+    return words
+
+
+def help_text() -> str:
+    """Describe every command and global option.
+
+    Options go on an indented line of their own, so that they do not push every
+    description far to the right.
+    """
+    usages = {name: f"  {usage(name, options=False)}" for name in COMMANDS}
+    width = max(len(line) for line in usages.values()) + EXTRA_PAD_WIDTH
+    lines = ["Usage: manage-iocs [command] <ioc>", "Available commands:"]
+    for name, info in COMMANDS.items():
+        lines.append(f"  {usages[name].ljust(width)} - {info.doc}")
+        if info.options:
+            lines.append(f"        {' '.join(option_usage(name))}")
+    lines.append("Global options:")
+    lines += [f"  {f'  {option}'.ljust(width)} - {doc}" for option, doc in GLOBAL_OPTIONS.items()]
+    return "\n".join(lines)
@@ -0,0 +1,139 @@
+"""Rolling restarts of many IOCs, in waves gated on the IOCs being ready again.
+
+Restarting every IOC on a host at once takes all of them down together, and then has them
+all compete for CPU while they start. A rolling restart instead restarts a few IOCs at a
+time, and only moves on once the restarted IOCs are ready: their procServ port accepts
+connections again, and the IOC shell prompt has appeared in their log.
+"""
+
+import re
+import socket
+import time
+from pathlib import Path
+
+from . import systemd, utils
+from .console import DEFAULT_PROMPT
+from .utils import IOC, BulkResult
+
+# How long to wait on each connection attempt to a procServ port
+PORT_PROBE_TIMEOUT = 0.5
+
+# The IOC shell prompt on a line of its own in the log
+PROMPT_PATTERN = re.compile(f"^{DEFAULT_PROMPT}", re.MULTILINE)
+
+# Bytes kept from the previous read of the log, in case the prompt was split across reads
+LOG_TAIL_SIZE = 256
+
+
+def port_accepts(port: int, host: str = "localhost") -> bool:
+    """Check whether something accepts connections on the given TCP port."""
+    try:
+        with socket.create_connection((host, port), timeout=PORT_PROBE_TIMEOUT):
+            return True
+    except OSError:
+        return False
+
+
+class ReadinessProbe:
+    """Track whether an IOC has come back up since it was restarted."""
+
+    def __init__(self, ioc: IOC, log_file: Path):
+        self.ioc = ioc
+        self.log_file = log_file
+        self.started = time.monotonic()
+        self.ready_after: float | None = None
+        # The old process is only known to be gone once systemd finished the restart job
+        self.job_done = False
+        self._log_tail = b""
+        try:
+            # Only output written after the restart counts
+            self._log_offset: int | None = log_file.stat().st_size
+        except OSError:
+            # Without a log, the procServ port is all that can be checked
+            self._log_offset = None
+
+    def _prompt_logged(self) -> bool:
+        if self._log_offset is None:
+            return True
+        try:
+            with open(self.log_file, "rb") as f:
+                if f.seek(0, 2) < self._log_offset:
+                    self._log_offset = 0  # The log was rotated or truncated
+                f.seek(self._log_offset)
+                data = f.read()
+        except OSError:
+            return False
+        self._log_offset += len(data)
+        text = (self._log_tail + data).decode(errors="replace").replace("\r", "")
+        self._log_tail = (self._log_tail + data)[-LOG_TAIL_SIZE:]
+        return PROMPT_PATTERN.search(text) is not None
+
+    def check(self) -> float | None:
+        """Get how long the IOC took to become ready, or None if it is not ready yet."""
+        if self.ready_after is None and (
+            self._prompt_logged() and port_accepts(self.ioc.procserv_port)
+        ):
+            self.ready_after = time.monotonic() - self.started
+        return self.ready_after
+
+
+def rolling_restart(
+    iocs: list[IOC], batch: int = 1, max_unavailable: int = 0, timeout: float = utils.JOB_TIMEOUT
+) -> tuple[dict[str, BulkResult], dict[str, float]]:
+    """Restart IOCs in waves of ``batch``, with at most ``max_unavailable`` down at once.
+
+    A ``max_unavailable`` of 0 means the same as ``batch``, i.e. every wave waits for the
+    previous one to be ready. Each IOC gets ``timeout`` seconds to become ready; once any
+    IOC fails, no further IOCs are restarted. Returns the result for each IOC, and how long
+    each restarted IOC was unavailable.
+    """
+    backend = systemd.get_backend()
+    batch = max(batch, 1)
+    max_unavailable = max_unavailable if max_unavailable > 0 else batch
+
+    results: dict[str, BulkResult] = {}
+    downtimes: dict[str, float] = {}
+    todo = list(iocs)
+    restarting: list[ReadinessProbe] = []
+    while todo or restarting:
+        wave_size = min(batch, max_unavailable - len(restarting))
+        if todo and wave_size > 0 and all(result.succeeded for result in results.values()):
+            wave, todo = todo[:wave_size], todo[wave_size:]
+            probes = [
+                ReadinessProbe(ioc, utils.MANAGE_IOCS_LOG_PATH / f"{ioc.name}.log") for ioc in wave
+            ]
+            _, stderr, rc = backend.enqueue(
+                "restart", sorted(f"softioc-{ioc.name}.service" for ioc in wave)
+            )
+            if rc != 0:
+                # Fail the IOCs systemd complained about (or the whole wave) straight away
+                named = [ioc for ioc in wave if f"softioc-{ioc.name}.service" in stderr]
+                for ioc in named or wave:
+                    results[ioc.name] = BulkResult(ioc.name, False, stderr or "restart refused")
+                probes = [probe for probe in probes if probe.ioc.name not in results]
+            restarting += probes
+        elif not restarting:
+            # Stopped early after a failure
+            for ioc in todo:
+                results[ioc.name] = BulkResult(ioc.name, False, "skipped after an earlier failure")
+            break
+
+        time.sleep(utils.JOB_POLL_INTERVAL)
+        # Don't probe the ports until the old processes are gone
+        waiting = [probe for probe in restarting if not probe.job_done]
+        if waiting:
+            pending = backend.pending_jobs()
+            for probe in waiting:
+                probe.job_done = f"softioc-{probe.ioc.name}.service" not in pending
+        for probe in list(restarting):
+            name = probe.ioc.name
+            ready_after = probe.check() if probe.job_done else None
+            if ready_after is not None:
+                downtimes[name] = ready_after
+                results[name] = BulkResult(name, True, f"ready after {ready_after:.1f}s")
+                restarting.remove(probe)
+            elif time.monotonic() - probe.started > timeout:
+                downtimes[name] = time.monotonic() - probe.started
+                results[name] = BulkResult(name, False, f"not ready after {timeout:g}s")
+                restarting.remove(probe)
+    return {ioc.name: results[ioc.name] for ioc in iocs}, downtimes
@@ -0,0 +1,473 @@
+"""Backends used to control IOC units through systemd.
+
+Two interchangeable backends are provided: :class:`SubprocessBackend` forks ``systemctl``
+for every request, while :class:`DBusBackend` talks to ``org.freedesktop.systemd1``
+directly over a single D-Bus connection that is reused for the whole invocation. The
+D-Bus backend needs the optional ``jeepney`` dependency, and the subprocess backend is
+used whenever it is unavailable.
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from datetime import datetime
+from subprocess import PIPE, Popen, TimeoutExpired
+from typing import Any, TypeVar
+
+from . import _lazy, tracing
+
+asyncio = _lazy.lazy_import("asyncio")
+futures = _lazy.lazy_import("concurrent.futures")
+queue = _lazy.lazy_import("queue")
+
+# One of "auto", "dbus" or "subprocess"
+SYSTEMD_BACKEND = os.environ.get("MANAGE_IOCS_SYSTEMD_BACKEND", "auto")
+
+SYSTEMD_BUS_NAME = "org.freedesktop.systemd1"
+SYSTEMD_OBJECT_PATH = "/org/freedesktop/systemd1"
+MANAGER_INTERFACE = "org.freedesktop.systemd1.Manager"
+UNIT_INTERFACE = "org.freedesktop.systemd1.Unit"
+SERVICE_INTERFACE = "org.freedesktop.systemd1.Service"
+
+# Actions that queue a systemd job rather than completing synchronously
+JOB_ACTIONS = ("start", "stop", "restart")
+
+# Properties that live on the Service rather than the Unit interface
+SERVICE_PROPERTIES = {"MainPID", "ExecMainStartTimestamp", "NRestarts"}
+
+# How long a single query of systemd may take before it is abandoned. Jobs (start, stop,
+# restart) are not limited, since systemd times those out itself.
+CALL_TIMEOUT = 30.0
+
+# Return code reported for a systemctl call that was killed for taking too long
+TIMEOUT_RETURNCODE = 124
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+class _Worker:
+    """A daemon thread that runs blocking calls one at a time, in the order submitted.
+
+    Unlike the event loop's default executor (used by ``asyncio.to_thread``), the thread is
+    never joined: a call its caller gave up on cannot hold up the end of the command. Calls
+    that are cancelled while still queued are never run.
+    """
+
+    def __init__(self, name: str):
+        self._calls: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._serve, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, func: Callable[..., T], *args: Any) -> "futures.Future[T]":
+        future: futures.Future[T] = futures.Future()
+        self._calls.put((future, func, args))
+        return future
+
+    def _serve(self):
+        while True:
+            future, func, args = self._calls.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class SystemdBackend(ABC):
+    """Interface implemented by every way of talking to systemd."""
+
+    name = ""
+
+    # How many calls of this backend can usefully run at once
+    max_concurrency = 1
+
+    _worker: _Worker | None = None
+
+    @abstractmethod
+    def passthrough(self, action: str, unit: str) -> tuple[str, str, int]:
+        """Perform a ``systemctl`` action on a single unit.
+
+        Returns the stdout, stderr and return code that ``systemctl`` would have produced.
+        """
+
+    @abstractmethod
+    def show(self, units: list[str], properties: list[str]) -> list[dict[str, str]]:
+        """Get the given properties of each unit, formatted as ``systemctl show`` would."""
+
+    @abstractmethod
+    def enqueue(self, action: str, units: list[str]) -> tuple[str, str, int]:
+        """Apply an action to many units at once, without waiting for queued jobs."""
+
+    @abstractmethod
+    def pending_jobs(self) -> set[str]:
+        """Get the names of all units that still have a job queued or running."""
+
+    @abstractmethod
+    def reload(self) -> tuple[str, str, int]:
+        """Make systemd reload all unit files, like ``systemctl daemon-reload``."""
+
+    async def show_async(self, units: list[str], properties: list[str]) -> list[dict[str, str]]:
+        """Like :meth:`show`, without blocking the event loop."""
+        return await self._in_worker(self.show, units, properties)
+
+    async def enqueue_async(self, action: str, units: list[str]) -> tuple[str, str, int]:
+        """Like :meth:`enqueue`, without blocking the event loop."""
+        return await self._in_worker(self.enqueue, action, units)
+
+    async def _in_worker(self, func: Callable[..., T], *args: Any) -> T:
+        """Run a blocking call on the backend's own worker thread, one call at a time."""
+        if self._worker is None:
+            self._worker = _Worker(f"manage-iocs-{self.name or 'systemd'}")
+        return await asyncio.wrap_future(self._worker.submit(func, *args))
+
+    def close(self):  # noqa: B027 - backends without resources to release need not override
+        """Release any resources held by the backend."""
+
+
+def parse_show_output(output: str) -> list[dict[str, str]]:
+    """Split the output of ``systemctl show`` into one property dict per unit."""
+    return [
+        dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+        for block in output.strip().split("\n\n")
+        if block.strip()
+    ]
+
+
+class SubprocessBackend(SystemdBackend):
+    """Run a ``systemctl`` process for every request."""
+
+    name = "subprocess"
+    max_concurrency = 8
+
+    def _systemctl(self, *args: str, timeout: float | None = CALL_TIMEOUT) -> tuple[str, str, int]:
+        with tracing.span(" ".join(["systemctl", *args[:2]]), "subprocess", argv=list(args)):
+            proc = Popen(["systemctl", *args], stdin=PIPE, stdout=PIPE)
+            try:
+                out, err = proc.communicate(timeout=timeout)
+            except TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+                return "", f"systemctl {args[0]} timed out after {timeout:g}s", TIMEOUT_RETURNCODE
+        decoded_out = out.decode().strip() if out else ""
+        decoded_err = err.decode().strip() if err else ""
+        return decoded_out, decoded_err, proc.returncode
+
+    async def _systemctl_async(self, *args: str) -> tuple[str, str, int]:
+        """Run systemctl as an asyncio subprocess, killing it if the caller is cancelled."""
+        with tracing.span(" ".join(["systemctl", *args[:2]]), "subprocess", argv=list(args)):
+            proc = await asyncio.create_subprocess_exec(
+                "systemctl", *args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+            )
+            try:
+                out, err = await proc.communicate()
+            except BaseException:
+                proc.kill()
+                await proc.wait()
+                raise
+        decoded_out = out.decode().strip() if out else ""
+        decoded_err = err.decode().strip() if err else ""
+        return decoded_out, decoded_err, proc.returncode or 0
+
+    @staticmethod
+    def _show_args(units: list[str], properties: list[str]) -> list[str]:
+        return ["show", f"--property={','.join(properties)}", *units]
+
+    @staticmethod
+    def _enqueue_args(action: str, units: list[str]) -> list[str]:
+        return ["--no-block", action, *units] if action in JOB_ACTIONS else [action, *units]
+
+    def passthrough(self, action: str, unit: str) -> tuple[str, str, int]:
+        return self._systemctl(
+            action, unit, timeout=None if action in JOB_ACTIONS else CALL_TIMEOUT
+        )
+
+    def show(self, units: list[str], properties: list[str]) -> list[dict[str, str]]:
+        out, _, _ = self._systemctl(*self._show_args(units, properties))
+        return parse_show_output(out)
+
+    async def show_async(self, units: list[str], properties: list[str]) -> list[dict[str, str]]:
+        out, _, _ = await self._systemctl_async(*self._show_args(units, properties))
+        return parse_show_output(out)
+
+    def enqueue(self, action: str, units: list[str]) -> tuple[str, str, int]:
+        return self._systemctl(*self._enqueue_args(action, units))
+
+    async def enqueue_async(self, action: str, units: list[str]) -> tuple[str, str, int]:
+        return await self._systemctl_async(*self._enqueue_args(action, units))
+
+    def pending_jobs(self) -> set[str]:
+        out, _, _ = self._systemctl("list-jobs", "--no-legend")
+        return {line.split()[1] for line in out.splitlines() if len(line.split()) > 1}
+
+    def reload(self) -> tuple[str, str, int]:
+        return self._systemctl("daemon-reload")
+
+
+def _format_property(name: str, value: Any) -> str:
+    """Format a D-Bus property value the way ``systemctl show`` prints it."""
+    if name.endswith("Timestamp"):
+        if not value:
+            return ""
+        return datetime.fromtimestamp(value / 1e6).astimezone().strftime("%a %Y-%m-%d %H:%M:%S %Z")
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, list | tuple):
+        return " ".join(str(item) for item in value)
+    return str(value)
+
+
+class DBusBackend(SystemdBackend):
+    """Talk to the systemd manager over one D-Bus connection."""
+
+    name = "dbus"
+
+    def __init__(self, bus: str = "SYSTEM"):
+        from jeepney import DBusAddress, MatchRule, message_bus
+        from jeepney.io.blocking import open_dbus_connection
+
+        self._connection = open_dbus_connection(bus=bus)
+        # The connection is used from the async worker as well as the calling thread
+        self._lock = threading.RLock()
+        self._manager = DBusAddress(
+            SYSTEMD_OBJECT_PATH, bus_name=SYSTEMD_BUS_NAME, interface=MANAGER_INTERFACE
+        )
+        self._job_removed = MatchRule(
+            type="signal",
+            interface=MANAGER_INTERFACE,
+            member="JobRemoved",
+            path=SYSTEMD_OBJECT_PATH,
+        )
+        try:
+            self._call(message_bus, "AddMatch", "s", (self._job_removed.serialise(),))
+            self._call(self._manager, "Subscribe")
+        except Exception:
+            self._connection.close()
+            raise
+
+    def close(self):
+        self._connection.close()
+
+    def _call(
+        self,
+        address,
+        method: str,
+        signature: str | None = None,
+        body: tuple = (),
+        timeout: float = CALL_TIMEOUT,
+    ):
+        from jeepney import new_method_call
+        from jeepney.wrappers import unwrap_msg
+
+        with tracing.span(method, "dbus"), self._lock:
+            reply = self._connection.send_and_get_reply(
+                new_method_call(address, method, signature, body), timeout=timeout
+            )
+        return unwrap_msg(reply)
+
+    def _unit_address(self, unit: str, interface: str, timeout: float = CALL_TIMEOUT):
+        from jeepney import DBusAddress
+
+        (path,) = self._call(self._manager, "LoadUnit", "s", (unit,), timeout=timeout)
+        return DBusAddress(path, bus_name=SYSTEMD_BUS_NAME, interface=interface)
+
+    def _get_properties(
+        self, unit: str, interface: str, deadline: float | None = None
+    ) -> dict[str, Any]:
+        """Get all properties of a unit, giving up (TimeoutError) at the monotonic deadline."""
+        from jeepney import Properties
+        from jeepney.wrappers import unwrap_msg
+
+        def remaining() -> float:
+            if deadline is None:
+                return CALL_TIMEOUT
+            if deadline <= time.monotonic():
+                raise TimeoutError(f"No reply for {unit} from systemd in time")
+            return deadline - time.monotonic()
+
+        address = self._unit_address(unit, interface, remaining())
+        with tracing.span("GetAll", "dbus", unit=unit), self._lock:
+            reply = self._connection.send_and_get_reply(
+                Properties(address).get_all(), timeout=remaining()
+            )
+        (properties,) = unwrap_msg(reply)
+        return {name: value for name, (_, value) in properties.items()}
+
+    def _run_job(self, method: str, unit: str) -> tuple[str, str, int]:
+        """Queue a job for the unit and wait for systemd to report that it finished."""
+        with self._lock, self._connection.filter(self._job_removed, queue=deque()) as jobs:
+            (job,) = self._call(self._manager, method, "ss", (unit, "replace"))
+            while True:
+                _, job_path, _, result = self._connection.recv_until_filtered(jobs).body
+                if job_path == job:
+                    break
+        if result == "done":
+            return "", "", 0
+        return "", f"Job for {unit} failed with result '{result}'.", 1
+
+    def passthrough(self, action: str, unit: str) -> tuple[str, str, int]:
+        from jeepney.wrappers import DBusErrorResponse
+
+        try:
+            if action in ("start", "stop", "restart"):
+                return self._run_job(f"{action.capitalize()}Unit", unit)
+            elif action == "enable":
+                self._call(self._manager, "EnableUnitFiles", "asbb", ([unit], False, True))
+                self._call(self._manager, "Reload")
+            elif action == "disable":
+                self._call(self._manager, "DisableUnitFiles", "asb", ([unit], False))
+                self._call(self._manager, "Reload")
+            elif action == "is-active":
+                state = self._get_properties(unit, UNIT_INTERFACE)["ActiveState"]
+                return state, "", 0 if state == "active" else 3
+            elif action == "is-enabled":
+                (state,) = self._call(self._manager, "GetUnitFileState", "s", (unit,))
+                return state, "", 0 if state == "enabled" else 1
+            elif action in ("install", "uninstall", "daemon-reload"):
+                # Unit files are written and removed by manage-iocs itself; systemd
+                # only has to reload them.
+                self._call(self._manager, "Reload")
+            else:
+                return "", f"Unsupported action for D-Bus backend: {action}", 1
+        except DBusErrorResponse as e:
+            return "", str(e), 1
+        return "", "", 0
+
+    def enqueue(self, action: str, units: list[str]) -> tuple[str, str, int]:
+        from jeepney.wrappers import DBusErrorResponse
+
+        errors = []
+        if action in JOB_ACTIONS:
+            for unit in units:
+                try:
+                    self._call(self._manager, f"{action.capitalize()}Unit", "ss", (unit, "replace"))
+                except DBusErrorResponse as e:
+                    errors.append(f"Failed to {action} {unit}: {e}")
+        elif action in ("enable", "disable"):
+            try:
+                if action == "enable":
+                    self._call(self._manager, "EnableUnitFiles", "asbb", (units, False, True))
+                else:
+                    self._call(self._manager, "DisableUnitFiles", "asb", (units, False))
+                self._call(self._manager, "Reload")
+            except DBusErrorResponse as e:
+                errors.append(f"Failed to {action} units: {e}")
+        else:
+            return "", f"Unsupported action for D-Bus backend: {action}", 1
+        return "", "\n".join(errors), 1 if errors else 0
+
+    def pending_jobs(self) -> set[str]:
+        (jobs,) = self._call(self._manager, "ListJobs")
+        return {job[1] for job in jobs}
+
+    def reload(self) -> tuple[str, str, int]:
+        from jeepney.wrappers import DBusErrorResponse
+
+        try:
+            self._call(self._manager, "Reload")
+        except DBusErrorResponse as e:
+            return "", str(e), 1
+        return "", "", 0
+
+    def show(
+        self,
+        units: list[str],
+        properties: list[str],
+        abandoned: threading.Event | None = None,
+    ) -> list[dict[str, str]]:
+        # Every unit takes several round trips, so the whole query gets CALL_TIMEOUT, and
+        # stops early once the caller gave up on it
+        deadline = time.monotonic() + CALL_TIMEOUT
+        results = []
+        for unit in units:
+            if abandoned is not None and abandoned.is_set():
+                raise TimeoutError("Query of systemd abandoned by its caller")
+            values = self._get_properties(unit, UNIT_INTERFACE, deadline)
+            if SERVICE_PROPERTIES.intersection(properties) and values.get("LoadState") == "loaded":
+                values.update(self._get_properties(unit, SERVICE_INTERFACE, deadline))
+            results.append(
+                {name: _format_property(name, values.get(name, "")) for name in properties}
+            )
+        return results
+
+    async def show_async(self, units: list[str], properties: list[str]) -> list[dict[str, str]]:
+        abandoned = threading.Event()
+        try:
+            return await self._in_worker(self.show, units, properties, abandoned)
+        except asyncio.CancelledError:
+            abandoned.set()
+            raise
+
+
+def open_backend(kind: str) -> SystemdBackend:
+    """Create a backend of the given kind ("auto", "dbus" or "subprocess")."""
+    if kind == "subprocess":
+        return SubprocessBackend()
+    elif kind not in ("auto", "dbus"):
+        raise RuntimeError(f"Unknown systemd backend: {kind}")
+
+    try:
+        return DBusBackend()
+    except Exception as e:
+        if kind == "dbus":
+            raise RuntimeError(f"Could not connect to systemd over D-Bus: {e}") from e
+        return SubprocessBackend()
+
+
+_backend: SystemdBackend | None = None
+
+
+def get_backend() -> SystemdBackend:
+    """Get the backend for this invocation, connecting on first use."""
+    global _backend
+    if _backend is None:
+        with tracing.span("open_backend", "systemd", kind=SYSTEMD_BACKEND):
+            _backend = open_backend(SYSTEMD_BACKEND)
+    return _backend
+
+
+async def _run_calls(
+    calls: dict[K, Callable[[], Awaitable[T]]], concurrency: int, timeout: float, deadline: float
+) -> tuple[dict[K, T], dict[K, str]]:
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(call: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await asyncio.wait_for(call(), timeout)
+
+    tasks = {asyncio.ensure_future(run(call)): key for key, call in calls.items()}
+    if not tasks:
+        return {}, {}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    # Let the cancelled calls clean up (e.g. kill their systemctl process)
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    results: dict[K, T] = {}
+    timed_out = {tasks[task]: f"no reply within the {deadline:g}s deadline" for task in pending}
+    for task in done:
+        try:
+            results[tasks[task]] = task.result()
+        except TimeoutError:
+            timed_out[tasks[task]] = f"timed out after {timeout:g}s"
+    return results, timed_out
+
+
+def run_calls(
+    calls: dict[K, Callable[[], Awaitable[T]]],
+    concurrency: int,
+    timeout: float,
+    deadline: float,
+) -> tuple[dict[K, T], dict[K, str]]:
+    """Run asynchronous systemd calls concurrently, bounded in number and in time.
+
+    At most ``concurrency`` calls run at once, each may take ``timeout`` seconds, and all
+    of them together ``deadline`` seconds. Calls still running then are cancelled.
+    Returns the results of the calls that completed, and why the others did not, by key.
+    """
+    return asyncio.run(_run_calls(calls, concurrency, timeout, deadline))
@@ -0,0 +1,197 @@
+"""Timed spans of where a command spends its time, for the --trace and --timings flags.
+
+Code marks its phases with ``tracing.span()``, which does nothing unless a tracer was
+started. While one is, every span records its start, duration and thread, along with the
+filesystem operations its thread made in the meantime. Those are counted from Python's
+audit events, so they cover every ``open`` and directory listing regardless of where
+it happens, apart from those of the import system. ``stat`` calls raise no audit event
+and are not counted.
+
+The spans can be written in the Chrome trace-event format, which Perfetto
+(https://ui.perfetto.dev) and ``chrome://tracing`` open directly.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+# Set by the global --trace and --timings flags
+TRACE_FILE: Path | None = None
+PRINT_TIMINGS = False
+
+# Audit events counted as filesystem operations, by the name they are reported under
+FS_EVENTS = {
+    "open": "open",
+    "os.scandir": "scandir",
+    "os.listdir": "listdir",
+    "os.rename": "rename",
+    "os.remove": "remove",
+    "os.mkdir": "mkdir",
+    "subprocess.Popen": "subprocess",
+}
+
+# Files opened by the import system rather than by manage-iocs itself
+IMPORT_SUFFIXES = (".py", ".pyc", ".so", ".pth")
+
+# The tracer of the running command, if any
+TRACER: "Tracer | None" = None
+
+_NO_SPAN = contextlib.nullcontext()
+_audit_hook_added = False
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start_ns: int
+    duration_ns: int
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """Collect the spans of one command, from every thread."""
+
+    def __init__(self):
+        self.origin_ns = time.perf_counter_ns()
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_counts: list[Counter[str]] = []
+
+    def _counts(self) -> Counter[str]:
+        """Get the filesystem operation counts of the calling thread."""
+        counts = getattr(self._local, "counts", None)
+        if counts is None:
+            counts = self._local.counts = Counter()
+            with self._lock:
+                self._thread_counts.append(counts)
+        return counts
+
+    def count(self, operation: str):
+        self._counts()[operation] += 1
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        counts = self._counts()
+        before = counts.copy()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            span = Span(
+                name,
+                category,
+                start - self.origin_ns,
+                duration,
+                threading.get_native_id(),
+                {**args, **(counts - before)},
+            )
+            with self._lock:
+                self.spans.append(span)
+
+    @property
+    def fs_operations(self) -> Counter[str]:
+        """Filesystem operations made so far, over every thread."""
+        with self._lock:
+            return sum(self._thread_counts, Counter())
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        """The spans as complete ("X") events of the Chrome trace-event format."""
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ns)
+        return [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": span.duration_ns / 1000,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": span.args,
+            }
+            for span in spans
+        ]
+
+    def write(self, path: Path):
+        """Write the trace as JSON that Perfetto can open."""
+        import json
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> str:
+        """Summarize the time spent in each phase, and the filesystem operations made."""
+        totals: dict[str, tuple[int, int]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            count, duration = totals.get(span.category, (0, 0))
+            totals[span.category] = (count + 1, duration + span.duration_ns)
+
+        width = max((len(category) for category in totals), default=0)
+        lines = ["Timings (time summed over threads):"]
+        lines += [
+            f"  {category.ljust(width)}  {count:5d} x {duration / 1e6:10.1f} ms"
+            for category, (count, duration) in sorted(
+                totals.items(), key=lambda item: item[1][1], reverse=True
+            )
+        ]
+        operations = self.fs_operations
+        if operations:
+            counts = ", ".join(f"{count} {name}" for name, count in operations.most_common())
+            lines.append(f"Filesystem operations: {counts}")
+        return "\n".join(lines)
+
+
+def _is_import(event: str, args: tuple) -> bool:
+    """Check whether an audit event comes from importing a (lazy) module."""
+    if event == "open":
+        return isinstance(args[0], str) and args[0].endswith(IMPORT_SUFFIXES)
+    if event == "os.listdir":
+        # The import system lists every directory on the path it searches
+        return args[0] in sys.path_importer_cache
+    return False
+
+
+def _audit_hook(event: str, args: tuple):
+    tracer = TRACER
+    if tracer is not None and event in FS_EVENTS and not _is_import(event, args):
+        tracer.count(FS_EVENTS[event])
+
+
+def start() -> Tracer:
+    """Start tracing, replacing any tracer already running."""
+    global TRACER, _audit_hook_added
+    if not _audit_hook_added:
+        # Audit hooks cannot be removed, so one hook serves every tracer
+        sys.addaudithook(_audit_hook)
+        _audit_hook_added = True
+    TRACER = Tracer()
+    return TRACER
+
+
+def stop() -> Tracer | None:
+    """Stop tracing, returning the tracer that was running."""
+    global TRACER
+    tracer, TRACER = TRACER, None
+    return tracer
+
+
+def span(name: str, category: str, **args: Any) -> contextlib.AbstractContextManager:
+    """Time a block of code as a span of the running tracer (if there is one)."""
+    tracer = TRACER
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, category, **args)
@@ -1,10 +1,21 @@
+import contextlib
 import functools
 import os
-import socket
-from collections.abc import Callable
+import time
+from collections.abc import Callable, Iterator
+from contextvars import ContextVar
 from dataclasses import dataclass
 from pathlib import Path
-from subprocess import PIPE, Popen
+
+from . import _lazy, tracing
+
+cache = _lazy.lazy_import("manage_iocs.cache")
+futures = _lazy.lazy_import("concurrent.futures")
+hashlib = _lazy.lazy_import("hashlib")
+ipaddress = _lazy.lazy_import("ipaddress")
+ports = _lazy.lazy_import("manage_iocs.ports")
+socket = _lazy.lazy_import("socket")
+systemd = _lazy.lazy_import("manage_iocs.systemd")
 
 IOC_SEARCH_PATH = [Path("/epics/iocs"), Path("/opt/epics/iocs"), Path("/opt/iocs")]
 if "MANAGE_IOCS_SEARCH_PATH" in os.environ:
@@ -12,8 +23,25 @@ if "MANAGE_IOCS_SEARCH_PATH" in os.environ:
         [Path(p) for p in os.environ["MANAGE_IOCS_SEARCH_PATH"].split(os.pathsep)]
     )
 
+# Range of procServ ports handed out by nextport, e.g. MANAGE_IOCS_PORT_RANGE=4000-4999
+PROCSERV_PORT_RANGE = (4000, 65535)
+if "MANAGE_IOCS_PORT_RANGE" in os.environ:
+    _first, _, _last = os.environ["MANAGE_IOCS_PORT_RANGE"].partition("-")
+    PROCSERV_PORT_RANGE = (int(_first), int(_last))
+
 SYSTEMD_SERVICE_PATH = Path("/etc/systemd/system")
 MANAGE_IOCS_LOG_PATH = Path("/var/log/softioc")
+MANAGE_IOCS_CACHE_PATH = Path("/run/manage-iocs")
+
+# Threads used to list search paths and read IOC configs, since on NFS every stat and
+# open is a network round-trip
+SCAN_WORKERS = 16
+
+# Disabled with the global --no-cache flag
+USE_INVENTORY_CACHE = True
+
+# Disabled with the global --no-agent flag
+USE_AGENT = True
 
 
 @dataclass
@@ -30,7 +58,7 @@ class IOC:
 def read_config_file(config_path: Path) -> dict[str, str]:
     """Read config file for IOC"""
     config: dict[str, str] = {}
-    with open(config_path) as f:
+    with tracing.span("read_config_file", "config", path=str(config_path)), open(config_path) as f:
         for line in f:
             line = line.strip()
             if line and not line.startswith("#"):
@@ -39,62 +67,363 @@ def read_config_file(config_path: Path) -> dict[str, str]:
     return config
 
 
-def find_iocs() -> dict[str, IOC]:
-    """Get a list of IOCs available in the search paths."""
-    iocs = {}
-    search_paths = IOC_SEARCH_PATH
-    for search_path in search_paths:
-        if os.path.exists(search_path):
-            for item in os.listdir(search_path):
-                if os.path.isdir(search_path / item) and os.path.exists(
-                    search_path / item / "config"
-                ):
-                    config = read_config_file(search_path / item / "config")
-                    iocs[item] = IOC(
-                        name=item,
-                        procserv_port=int(config["PORT"]),
-                        path=search_path / item,
-                        host=config.get("HOST", "localhost"),
-                        user=config.get("USER", "iocuser"),
-                        exec_path=config.get("EXEC", "st.cmd"),
-                        chdir=config.get("CHDIR", "."),
-                    )
-    return iocs
+def ioc_from_config(name: str, path: Path, config: dict[str, str]) -> IOC:
+    """Build an IOC record from the contents of its config file."""
+    return IOC(
+        name=name,
+        procserv_port=int(config["PORT"]),
+        path=path,
+        host=config.get("HOST", "localhost"),
+        user=config.get("USER", "iocuser"),
+        exec_path=config.get("EXEC", "st.cmd"),
+        chdir=config.get("CHDIR", "."),
+    )
+
+
+def _read_ioc_dir(ioc_dir: Path) -> dict[str, str] | None:
+    try:
+        return read_config_file(ioc_dir / "config")
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        # Directories the user cannot enter are skipped, as if they had no config
+        return None
+
+
+def scan_search_path(
+    search_path: Path, executor: "futures.Executor | None" = None
+) -> dict[str, dict[str, str]]:
+    """Read the config of every IOC directory in the given search path.
+
+    Directory entry types come from ``os.scandir``, so only the config files themselves
+    are opened. If an executor is given, the configs are read concurrently.
+    """
+    try:
+        with os.scandir(search_path) as entries:
+            names = sorted(entry.name for entry in entries if entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+
+    ioc_dirs = [search_path / name for name in names]
+    configs = executor.map(_read_ioc_dir, ioc_dirs) if executor else map(_read_ioc_dir, ioc_dirs)
+    return {name: config for name, config in zip(names, configs, strict=True) if config is not None}
+
+
+def _load_iocs(
+    inventory_cache: "cache.InventoryCache | None", host: str | None = None
+) -> dict[str, IOC]:
+    def scan(search_path: Path) -> dict[str, dict[str, str]]:
+        with tracing.span("scan_search_path", "scan", path=str(search_path)):
+            if inventory_cache is not None:
+                return inventory_cache.scan(search_path, read_config_file, executor)
+            return scan_search_path(search_path, executor)
 
+    # Search paths are scanned concurrently, sharing one pool for the per-IOC work. The
+    # pools are separate so that a path scan never waits on a worker held by another.
+    with (
+        futures.ThreadPoolExecutor(SCAN_WORKERS) as executor,
+        futures.ThreadPoolExecutor(max(len(IOC_SEARCH_PATH), 1)) as path_executor,
+    ):
+        scans = list(path_executor.map(scan, IOC_SEARCH_PATH))
 
-def find_iocs_on_host() -> dict[str, IOC]:
-    """Get a list of IOCs available on the given host."""
-    all_iocs = find_iocs()
+    # Merged in search path order, so that later search paths take precedence
+    merged: dict[str, tuple[Path, dict[str, str]]] = {}
+    for search_path, configs in zip(IOC_SEARCH_PATH, scans, strict=True):
+        for item, config in configs.items():
+            merged[item] = (search_path, config)
+    # Only the records of the requested host are built
     return {
-        name: ioc
-        for name, ioc in all_iocs.items()
-        if ioc.host == socket.gethostname() or ioc.host == "localhost"
+        item: ioc_from_config(item, search_path / item, config)
+        for item, (search_path, config) in merged.items()
+        if host is None or normalize_host(config.get("HOST", "localhost")) == host
     }
 
 
-def find_installed_iocs() -> dict[str, IOC]:
-    """Get a list of IOCs that have systemd service files installed."""
-    iocs = {}
-    for ioc in find_iocs().values():
-        service_file = SYSTEMD_SERVICE_PATH / f"softioc-{ioc.name}.service"
-        if service_file.exists():
-            iocs[ioc.name] = ioc
+def find_iocs(host: str | None = None) -> dict[str, IOC]:
+    """Get a list of IOCs available in the search paths (only those of ``host``, if given).
+
+    The host must be normalized with ``normalize_host``.
+    """
+    if not USE_INVENTORY_CACHE:
+        with tracing.span("find_iocs", "inventory"):
+            return _load_iocs(None, host)
+
+    with tracing.span("find_iocs", "inventory"):
+        with tracing.span("load", "cache"):
+            inventory_cache = cache.InventoryCache.load(MANAGE_IOCS_CACHE_PATH / "inventory.json")
+        iocs = _load_iocs(inventory_cache, host)
+        with tracing.span("save", "cache"):
+            inventory_cache.save()
     return iocs
 
 
+def rebuild_inventory_cache() -> dict[str, IOC]:
+    """Discard the on-disk inventory cache and re-populate it from a full scan."""
+    inventory_cache = cache.InventoryCache(MANAGE_IOCS_CACHE_PATH / "inventory.json")
+    iocs = _load_iocs(inventory_cache)
+    inventory_cache.dirty = True
+    inventory_cache.save(strict=True)
+    return iocs
+
+
+def clear_inventory_cache():
+    """Remove the on-disk inventory cache."""
+    (MANAGE_IOCS_CACHE_PATH / "inventory.json").unlink(missing_ok=True)
+
+
+@functools.cache
+def this_host() -> str:
+    """The normalized name of this host."""
+    return socket.gethostname().lower().rstrip(".").split(".")[0]
+
+
+def normalize_host(host: str) -> str:
+    """Reduce a HOST setting to the key IOCs are indexed by.
+
+    Host names are compared case-insensitively and without their domain, so that the short
+    name and the FQDN of a host are the same host; ``localhost`` is this host. IP addresses
+    are kept whole, in their canonical form.
+    """
+    host = host.strip().lower().rstrip(".")
+    if host == "localhost":
+        return this_host()
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return host.split(".")[0]
+    return this_host() if address.is_loopback else str(address)
+
+
+def find_iocs_on_host(host: str | None = None) -> dict[str, IOC]:
+    """Get a list of IOCs configured to run on the given host (by default this one)."""
+    with inventory_snapshot() as inventory:
+        return inventory.on_host(this_host() if host is None else normalize_host(host))
+
+
+def runs_on_this_host(ioc: IOC) -> bool:
+    """Check whether an IOC is configured to run on this host."""
+    return normalize_host(ioc.host) == this_host()
+
+
+def find_ioc(name: str) -> IOC | None:
+    """Look up a single IOC by name without listing every search path.
+
+    Later search paths take precedence, matching the behavior of ``find_iocs``.
+    """
+    if not name or os.sep in name or name in (".", ".."):
+        return None
+
+    for search_path in reversed(IOC_SEARCH_PATH):
+        config_path = search_path / name / "config"
+        if os.path.isfile(config_path):
+            return ioc_from_config(name, search_path / name, read_config_file(config_path))
+    return None
+
+
+def service_file_path(ioc: str) -> Path:
+    return SYSTEMD_SERVICE_PATH / f"softioc-{ioc}.service"
+
+
+def is_service_installed(ioc: str) -> bool:
+    """Check whether a systemd service file exists for the given IOC."""
+    return service_file_path(ioc).exists()
+
+
+def find_installed_iocs(iocs: dict[str, IOC] | None = None) -> dict[str, IOC]:
+    """Get a list of IOCs that have systemd service files installed."""
+    if iocs is None:
+        iocs = find_iocs()
+    return {name: ioc for name, ioc in iocs.items() if is_service_installed(name)}
+
+
+UNIT_PROPERTIES = [
+    "Id",
+    "LoadState",
+    "ActiveState",
+    "SubState",
+    "UnitFileState",
+    "MainPID",
+    "ActiveEnterTimestamp",
+    "InactiveEnterTimestamp",
+]
+
+
+@dataclass
+class UnitState:
+    ioc: str
+    load_state: str = ""
+    active_state: str = ""
+    sub_state: str = ""
+    unit_file_state: str = ""
+    main_pid: int = 0
+    active_enter_timestamp: str = ""
+    inactive_enter_timestamp: str = ""
+    # systemd did not answer in time, so the state of the unit is unknown
+    timed_out: bool = False
+
+    @property
+    def status(self) -> str:
+        """User-friendly active state, as reported by ``get_ioc_status``."""
+        if self.timed_out:
+            return "Timed out"
+        if self.active_state == "active":
+            return "Running"
+        elif self.active_state == "inactive":
+            return "Stopped"
+        return self.active_state.capitalize()
+
+    @property
+    def enabled(self) -> bool:
+        return self.unit_file_state == "enabled"
+
+    @property
+    def known(self) -> bool:
+        """Whether systemd knows the unit file, i.e. it is either enabled or disabled."""
+        return self.unit_file_state in ("enabled", "disabled")
+
+
+class Inventory:
+    """Snapshot of the IOCs visible to this host.
+
+    The full scan of the search paths is only done if a command needs every IOC; commands
+    that touch a single IOC resolve it directly with ``find_ioc``.
+    """
+
+    def __init__(self, unit_state_ttl: float = 0.0):
+        self._iocs: dict[str, IOC] | None = None
+        self._installed: dict[str, IOC] | None = None
+        self._port_index: ports.PortIndex | None = None
+        self._installed_port_index: ports.PortIndex | None = None
+        self._host_index: dict[str, dict[str, IOC]] | None = None
+        self._host_lookups: dict[str, dict[str, IOC]] = {}
+        self._lookups: dict[str, IOC | None] = {}
+        # Unit states are only remembered by long-lived inventories (see the agent)
+        self.unit_state_ttl = unit_state_ttl
+        self._unit_states: dict[str, tuple[float, UnitState]] = {}
+
+    @property
+    def iocs(self) -> dict[str, IOC]:
+        """All IOCs found in the search paths."""
+        if self._iocs is None:
+            self._iocs = find_iocs()
+        return self._iocs
+
+    @property
+    def installed(self) -> dict[str, IOC]:
+        """IOCs that have systemd service files installed."""
+        if self._installed is None:
+            self._installed = find_installed_iocs(self.iocs)
+        return self._installed
+
+    @property
+    def host_index(self) -> dict[str, dict[str, IOC]]:
+        """All IOCs, partitioned by the (normalized) host they are configured to run on."""
+        if self._host_index is None:
+            index: dict[str, dict[str, IOC]] = {}
+            for name, ioc in self.iocs.items():
+                index.setdefault(normalize_host(ioc.host), {})[name] = ioc
+            self._host_index = index
+        return self._host_index
+
+    def on_host(self, host: str) -> dict[str, IOC]:
+        """Get the IOCs configured to run on the given (normalized) host.
+
+        Unless every IOC was already loaded, only the records of that host are built.
+        """
+        if self._iocs is not None:
+            return self.host_index.get(host, {})
+        if host not in self._host_lookups:
+            self._host_lookups[host] = find_iocs(host)
+        return self._host_lookups[host]
+
+    @property
+    def port_index(self) -> "ports.PortIndex":
+        """Index of the procServ ports of the IOCs configured to run on this host."""
+        if self._port_index is None:
+            self._port_index = ports.PortIndex(self.on_host(this_host()).values())
+        return self._port_index
+
+    @property
+    def installed_port_index(self) -> "ports.PortIndex":
+        """Index of the procServ ports of every installed IOC, whatever its configured host."""
+        if self._installed_port_index is None:
+            self._installed_port_index = ports.PortIndex(self.installed.values())
+        return self._installed_port_index
+
+    def get(self, name: str) -> IOC | None:
+        """Get a single IOC, or None if no IOC with the given name exists."""
+        if self._iocs is not None:
+            return self._iocs.get(name)
+        if name not in self._lookups:
+            self._lookups[name] = find_ioc(name)
+        return self._lookups[name]
+
+    def __getitem__(self, name: str) -> IOC:
+        ioc = self.get(name)
+        if ioc is None:
+            raise RuntimeError(f"No IOC with name '{name}' found!")
+        return ioc
+
+    def is_installed(self, name: str) -> bool:
+        """Check whether the given IOC exists and has a systemd service file installed."""
+        if self._installed is not None:
+            return name in self._installed
+        return self.get(name) is not None and is_service_installed(name)
+
+    def refresh_installed(self):
+        """Forget which IOCs are installed, after service files were added or removed."""
+        self._installed = None
+        self._installed_port_index = None
+        self._unit_states.clear()
+
+    def cached_unit_states(self, iocs: list[str]) -> dict[str, UnitState]:
+        """Get the unit states queried for these IOCs within the last ``unit_state_ttl``."""
+        now = time.monotonic()
+        return {
+            ioc: self._unit_states[ioc][1]
+            for ioc in iocs
+            if ioc in self._unit_states and now - self._unit_states[ioc][0] < self.unit_state_ttl
+        }
+
+    def remember_unit_states(self, states: dict[str, UnitState]):
+        if self.unit_state_ttl > 0:
+            now = time.monotonic()
+            self._unit_states.update((ioc, (now, state)) for ioc, state in states.items())
+
+
+_active_inventory: ContextVar[Inventory | None] = ContextVar("_active_inventory", default=None)
+
+
+@contextlib.contextmanager
+def inventory_snapshot(inventory: Inventory | None = None) -> Iterator[Inventory]:
+    """Get the inventory snapshot for the current invocation, creating one if needed.
+
+    Nested calls (e.g. ``startall`` calling ``start``) share the outermost snapshot. A
+    long-lived process can pass in an existing inventory to reuse it across invocations;
+    an inventory passed in always replaces the active snapshot for the block.
+    """
+    active = _active_inventory.get()
+    if inventory is None and active is not None:
+        yield active
+        return
+
+    inventory = Inventory() if inventory is None else inventory
+    token = _active_inventory.set(inventory)
+    try:
+        yield inventory
+    finally:
+        _active_inventory.reset(token)
+
+
 def get_ioc_procserv_port(ioc: str) -> int:
     """Get the procServ port number for the given IOC."""
 
-    return find_iocs()[ioc].procserv_port
+    with inventory_snapshot() as inventory:
+        return inventory[ioc].procserv_port
 
 
 def systemctl_passthrough(action: str, ioc: str) -> tuple[str, str, int]:
     """Helper to call systemctl with the given action and IOC name."""
-    proc = Popen(["systemctl", action, f"softioc-{ioc}.service"], stdin=PIPE, stdout=PIPE)
-    out, err = proc.communicate()
-    decoded_out = out.decode().strip() if out else ""
-    decoded_err = err.decode().strip() if err else ""
-    return decoded_out, decoded_err, proc.returncode
+    with tracing.span(f"systemctl {action}", "systemd", ioc=ioc):
+        return systemd.get_backend().passthrough(action, f"softioc-{ioc}.service")
 
 
 def get_ioc_status(ioc_name: str) -> tuple[str, bool]:
@@ -115,12 +444,363 @@ def get_ioc_status(ioc_name: str) -> tuple[str, bool]:
     return state.capitalize(), enabled == "enabled"
 
 
+def unit_state_from_properties(properties: dict[str, str]) -> UnitState | None:
+    """Build the state of an IOC unit from its ``systemctl show`` properties."""
+    unit = properties.get("Id", "")
+    if not (unit.startswith("softioc-") and unit.endswith(".service")):
+        return None
+    main_pid = properties.get("MainPID", "0")
+    return UnitState(
+        ioc=unit.removeprefix("softioc-").removesuffix(".service"),
+        load_state=properties.get("LoadState", ""),
+        active_state=properties.get("ActiveState", ""),
+        sub_state=properties.get("SubState", ""),
+        unit_file_state=properties.get("UnitFileState", ""),
+        main_pid=int(main_pid) if main_pid.isdigit() else 0,
+        active_enter_timestamp=properties.get("ActiveEnterTimestamp", ""),
+        inactive_enter_timestamp=properties.get("InactiveEnterTimestamp", ""),
+    )
+
+
+def parse_systemctl_show(output: str) -> dict[str, UnitState]:
+    """Parse the output of ``systemctl show`` for one or more IOC units."""
+    states = [unit_state_from_properties(p) for p in systemd.parse_show_output(output)]
+    return {state.ioc: state for state in states if state is not None}
+
+
+# Units queried per ``systemctl show`` call; the calls of one query run concurrently
+SHOW_CHUNK_SIZE = 64
+
+# How long a multi-IOC query may wait on systemd in total, across all of its calls
+SYSTEMD_DEADLINE = 60.0
+
+
+def systemctl_show(iocs: list[str]) -> dict[str, UnitState]:
+    """Query the state of many IOC units at once.
+
+    Units are queried ``SHOW_CHUNK_SIZE`` at a time, with the calls running concurrently
+    under ``systemd.CALL_TIMEOUT`` each and ``SYSTEMD_DEADLINE`` overall. IOCs whose query
+    did not complete in time are returned with ``timed_out`` set rather than left out.
+    """
+    if len(iocs) == 0:
+        return {}
+
+    inventory = _active_inventory.get()
+    cached = inventory.cached_unit_states(iocs) if inventory is not None else {}
+    todo = [ioc for ioc in iocs if ioc not in cached]
+    chunks = [todo[i : i + SHOW_CHUNK_SIZE] for i in range(0, len(todo), SHOW_CHUNK_SIZE)]
+    queried: dict[str, UnitState] = {}
+    if chunks:
+        backend = systemd.get_backend()
+        calls = {
+            i: functools.partial(
+                backend.show_async, [f"softioc-{ioc}.service" for ioc in chunk], UNIT_PROPERTIES
+            )
+            for i, chunk in enumerate(chunks)
+        }
+        with tracing.span("systemctl show", "systemd", units=len(todo), calls=len(calls)):
+            replies, timed_out = systemd.run_calls(
+                calls, backend.max_concurrency, systemd.CALL_TIMEOUT, SYSTEMD_DEADLINE
+            )
+        for properties in replies.values():
+            states = (unit_state_from_properties(p) for p in properties)
+            queried.update((state.ioc, state) for state in states if state is not None)
+        if inventory is not None:
+            inventory.remember_unit_states(queried)
+        for i in timed_out:
+            queried.update((ioc, UnitState(ioc, timed_out=True)) for ioc in chunks[i])
+    return {ioc: cached.get(ioc) or queried[ioc] for ioc in iocs if ioc in cached or ioc in queried}
+
+
+def unit_state(ioc: str) -> UnitState:
+    """Query the state of a single IOC unit, raising if systemd did not report it."""
+    state = systemctl_show([ioc]).get(ioc)
+    if state is None:
+        raise RuntimeError(f"systemd reported no state for IOC '{ioc}'!")
+    if state.timed_out:
+        raise RuntimeError(f"systemd did not report the state of IOC '{ioc}' in time!")
+    return state
+
+
+# How long bulk operations wait for queued systemd jobs, and how often they check on them
+JOB_TIMEOUT = 300.0
+JOB_POLL_INTERVAL = 0.1
+
+# How long exec waits on each IOC console, and how many consoles it opens at once
+EXEC_TIMEOUT = 10.0
+EXEC_CONCURRENCY = 16
+
+# How long health waits for all probes in total, and how many consoles it opens at once
+HEALTH_TIMEOUT = 5.0
+HEALTH_CONCURRENCY = 256
+
+# Final unit states that count as success for each bulk action
+BULK_ACTION_SUCCEEDED: dict[str, Callable[[UnitState], bool]] = {
+    "start": lambda state: state.active_state == "active",
+    "restart": lambda state: state.active_state == "active",
+    "stop": lambda state: state.active_state in ("inactive", "failed"),
+    "enable": lambda state: state.unit_file_state == "enabled",
+    "disable": lambda state: state.unit_file_state == "disabled",
+}
+
+
+@dataclass
+class BulkResult:
+    ioc: str
+    succeeded: bool
+    detail: str = ""
+
+
+def systemctl_bulk(
+    action: str, iocs: list[str], chunk_size: int = 0, timeout: float = JOB_TIMEOUT
+) -> dict[str, BulkResult]:
+    """Apply an action to many IOC units with one systemctl call per chunk.
+
+    Jobs for every unit in a chunk are queued at once and run in parallel; the next chunk
+    is only sent once all jobs of the previous one have finished. A chunk size of 0 sends
+    every unit at once. Units that are already in the requested state are skipped.
+    """
+    backend = systemd.get_backend()
+    succeeded = BULK_ACTION_SUCCEEDED[action]
+
+    results: dict[str, BulkResult] = {}
+    if action != "restart":
+        # Leave units that are already in the requested state alone
+        for ioc, state in systemctl_show(iocs).items():
+            if succeeded(state):
+                results[ioc] = BulkResult(ioc, True, "unchanged")
+    todo = [ioc for ioc in iocs if ioc not in results]
+
+    chunk_size = chunk_size if chunk_size > 0 else max(len(todo), 1)
+    for i in range(0, len(todo), chunk_size):
+        chunk = todo[i : i + chunk_size]
+        units = {f"softioc-{ioc}.service" for ioc in chunk}
+        with tracing.span(f"systemctl {action}", "systemd", units=len(units)):
+            enqueue = functools.partial(backend.enqueue_async, action, sorted(units))
+            replies, timed_out = systemd.run_calls(
+                {0: enqueue}, 1, systemd.CALL_TIMEOUT, systemd.CALL_TIMEOUT
+            )
+        if timed_out:
+            results.update((ioc, BulkResult(ioc, False, timed_out[0])) for ioc in chunk)
+            continue
+        _, stderr, _ = replies[0]
+
+        deadline = time.monotonic() + timeout
+        with tracing.span("wait for jobs", "systemd", units=len(units)):
+            pending = units & backend.pending_jobs()
+            while pending and time.monotonic() < deadline:
+                time.sleep(JOB_POLL_INTERVAL)
+                pending &= backend.pending_jobs()
+
+        states = systemctl_show(chunk)
+        for ioc in chunk:
+            state = states.get(ioc)
+            if f"softioc-{ioc}.service" in pending:
+                results[ioc] = BulkResult(ioc, False, f"timed out after {timeout:g}s")
+            elif state is None:
+                results[ioc] = BulkResult(ioc, False, stderr or "unknown unit")
+            elif not succeeded(state):
+                detail = state.status if action in systemd.JOB_ACTIONS else state.unit_file_state
+                results[ioc] = BulkResult(ioc, False, detail or "unknown")
+            else:
+                results[ioc] = BulkResult(ioc, True)
+    return {ioc: results[ioc] for ioc in iocs}
+
+
+def render_service_file(ioc_config: IOC) -> str:
+    """Get the contents of the systemd service file for an IOC."""
+    ioc = ioc_config.name
+    return f"""
+#
+# Installed by manage-iocs
+#
+[Unit]
+Description=IOC {ioc} via procServ
+After=network.target remote_fs.target local_fs.target syslog.target time.target centrifydc.service
+ConditionFileIsExecutable=/usr/bin/procServ
+
+[Service]
+User={ioc_config.user}
+ExecStart=/usr/bin/procServ -f -q -c {ioc_config.path} -i ^D^C^] -p /var/run/softioc-{ioc}.pid \
+  -n {ioc} --restrict -L /var/log/softioc/{ioc}/{ioc}.log \
+  {ioc_config.procserv_port} {ioc_config.path}/{ioc_config.exec_path}
+Environment="PROCPORT={ioc_config.procserv_port}"
+Environment="HOSTNAME={ioc_config.host}"
+Environment="IOCNAME={ioc}"
+Environment="TOP={ioc_config.path}"
+#Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def write_service_file(ioc_config: IOC):
+    """Atomically (re)write the systemd service file of an IOC."""
+    service_file = service_file_path(ioc_config.name)
+    tmp_file = service_file.with_name(f".{service_file.name}.{os.getpid()}")
+    try:
+        with tracing.span("write_service_file", "service files", ioc=ioc_config.name):
+            with open(tmp_file, "w") as f:
+                f.write(render_service_file(ioc_config))
+            os.replace(tmp_file, service_file)
+    except OSError:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+
+def service_file_outdated(ioc_config: IOC) -> bool:
+    """Check whether the service file of an IOC differs from what it would be rendered as."""
+    expected = hashlib.sha256(render_service_file(ioc_config).encode()).digest()
+    try:
+        with open(service_file_path(ioc_config.name), "rb") as f:
+            return hashlib.sha256(f.read()).digest() != expected
+    except FileNotFoundError:
+        return True
+
+
+def check_installable(inventory: Inventory, ioc: str, claimed_ports: set[int]) -> IOC:
+    """Check that an IOC can be installed on this host, returning its config.
+
+    ``claimed_ports`` are the ports of other IOCs being installed at the same time.
+    """
+    if inventory.is_installed(ioc):
+        raise RuntimeError(f"IOC '{ioc}' is already installed!")
+
+    ioc_config = inventory[ioc]
+    port = ioc_config.procserv_port
+    # Any installed unit claims its port, even if its config names another host
+    port_owners = inventory.installed_port_index.owners(port)
+    if port in claimed_ports or any(owner != ioc for owner in port_owners):
+        raise RuntimeError(f"Cannot install IOC '{ioc}': procServ port {port} is already in use!")
+
+    if not runs_on_this_host(ioc_config):
+        raise RuntimeError(
+            f"Cannot install IOC '{ioc}' on this host; configured host is '{ioc_config.host}'!"
+        )
+    if ioc_config.user == "root":
+        raise RuntimeError(f"Refusing to install IOC '{ioc}' to run as user 'root'!")
+    return ioc_config
+
+
+def install_iocs(iocs: list[str]) -> dict[str, BulkResult]:
+    """Install the systemd services of many IOCs, reloading systemd only once.
+
+    Every IOC is checked against the same inventory snapshot before any service file is
+    written. If systemd fails to reload, the service files that were written are removed.
+    """
+    results: dict[str, BulkResult] = {}
+    configs: dict[str, IOC] = {}
+    claimed_ports: set[int] = set()
+    with inventory_snapshot() as inventory:
+        for ioc in iocs:
+            try:
+                configs[ioc] = check_installable(inventory, ioc, claimed_ports)
+            except RuntimeError as e:
+                results[ioc] = BulkResult(ioc, False, str(e))
+            else:
+                claimed_ports.add(configs[ioc].procserv_port)
+
+        written = []
+        for ioc, ioc_config in configs.items():
+            try:
+                write_service_file(ioc_config)
+            except OSError as e:
+                results[ioc] = BulkResult(ioc, False, f"Failed to install IOC '{ioc}'!: {e}")
+            else:
+                written.append(ioc)
+
+        if written:
+            _, stderr, ret = systemd.get_backend().reload()
+            for ioc in written:
+                if ret == 0:
+                    results[ioc] = BulkResult(ioc, True)
+                else:
+                    service_file_path(ioc).unlink(missing_ok=True)
+                    results[ioc] = BulkResult(
+                        ioc, False, f"Failed to install IOC '{ioc}'!: {stderr}"
+                    )
+            inventory.refresh_installed()
+    return {ioc: results[ioc] for ioc in iocs}
+
+
+def uninstall_iocs(iocs: list[str]) -> dict[str, BulkResult]:
+    """Stop, disable and remove the systemd services of many IOCs, reloading systemd once.
+
+    IOCs are stopped and disabled with one bulk request each; an IOC is only removed if
+    both succeeded.
+    """
+    results: dict[str, BulkResult] = {}
+    with inventory_snapshot() as inventory:
+        for ioc in iocs:
+            if not inventory.is_installed(ioc):
+                results[ioc] = BulkResult(ioc, False, f"No IOC with name '{ioc}' is installed!")
+
+        todo = [ioc for ioc in iocs if ioc not in results]
+        for action in ("stop", "disable"):
+            for ioc, result in systemctl_bulk(action, todo).items():
+                if not result.succeeded:
+                    detail = (
+                        f"Failed to {action} IOC '{ioc}' before uninstalling! ({result.detail})"
+                    )
+                    results[ioc] = BulkResult(ioc, False, detail)
+            todo = [ioc for ioc in todo if ioc not in results]
+
+        removed = []
+        for ioc in todo:
+            try:
+                service_file_path(ioc).unlink()
+            except OSError as e:
+                results[ioc] = BulkResult(ioc, False, f"Failed to uninstall IOC '{ioc}'!: {e}")
+            else:
+                removed.append(ioc)
+
+        if removed:
+            _, stderr, ret = systemd.get_backend().reload()
+            for ioc in removed:
+                if ret == 0:
+                    results[ioc] = BulkResult(ioc, True)
+                else:
+                    results[ioc] = BulkResult(
+                        ioc, False, f"Failed to uninstall IOC '{ioc}'!: {stderr}"
+                    )
+        inventory.refresh_installed()
+    return {ioc: results[ioc] for ioc in iocs}
+
+
+def sync_service_files(iocs: list[IOC]) -> dict[str, BulkResult]:
+    """Rewrite the service files that differ from their rendered contents.
+
+    Only the IOCs whose service file was out of date appear in the results, and systemd is
+    only reloaded if at least one file was rewritten.
+    """
+    results: dict[str, BulkResult] = {}
+    for ioc_config in iocs:
+        ioc = ioc_config.name
+        if not service_file_outdated(ioc_config):
+            continue
+        try:
+            write_service_file(ioc_config)
+        except OSError as e:
+            results[ioc] = BulkResult(ioc, False, f"Failed to rewrite service file: {e}")
+        else:
+            results[ioc] = BulkResult(ioc, True)
+
+    rewritten = [ioc for ioc, result in results.items() if result.succeeded]
+    if rewritten:
+        _, stderr, ret = systemd.get_backend().reload()
+        if ret != 0:
+            for ioc in rewritten:
+                results[ioc] = BulkResult(ioc, False, f"Failed to reload systemd: {stderr}")
+    return results
+
+
 def requires_root(func: Callable):
     @functools.wraps(func)
-    def wrapper(*args):
+    def wrapper(*args, **kwargs):
         if os.geteuid() != 0:
             raise PermissionError(f"Command {func.__name__} requires root privileges.")
-        return func(*args)
+        return func(*args, **kwargs)
 
     return wrapper
 
@@ -128,9 +808,9 @@ def requires_root(func: Callable):
 def requires_ioc_installed(func: Callable):
     @functools.wraps(func)
     def wrapper(ioc: str, *args, **kwargs):
-        installed_iocs = find_installed_iocs()
-        if ioc not in installed_iocs:
-            raise RuntimeError(f"No IOC with name '{ioc}' is installed!")
-        return func(ioc, *args, **kwargs)
+        with inventory_snapshot() as inventory:
+            if not inventory.is_installed(ioc):
+                raise RuntimeError(f"No IOC with name '{ioc}' is installed!")
+            return func(ioc, *args, **kwargs)
 
     return wrapper
@@ -6,6 +6,8 @@ from dataclasses import dataclass
 import pytest
 
 import manage_iocs.commands as cmds
+import manage_iocs.ports
+import manage_iocs.systemd
 import manage_iocs.utils
 
 
@@ -19,6 +21,27 @@ def sim_running_as_root(monkeypatch):
     monkeypatch.setattr(os, "geteuid", lambda: 0)  # Mock as root user
 
 
+@pytest.fixture(autouse=True)
+def isolated_inventory_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        manage_iocs.utils, "MANAGE_IOCS_CACHE_PATH", tmp_path / "run" / "manage-iocs"
+    )
+    monkeypatch.setattr(manage_iocs.utils, "USE_INVENTORY_CACHE", True)
+    return tmp_path / "run" / "manage-iocs"
+
+
+@pytest.fixture(autouse=True)
+def subprocess_systemd_backend(monkeypatch):
+    # Never talk to the host's systemd over D-Bus from the test suite
+    monkeypatch.setattr(manage_iocs.systemd, "_backend", manage_iocs.systemd.SubprocessBackend())
+
+
+@pytest.fixture(autouse=True)
+def no_listening_ports(monkeypatch):
+    # Keep nextport independent of whatever happens to be listening on the test host
+    monkeypatch.setattr(manage_iocs.ports, "PROC_NET_TCP", [])
+
+
 @pytest.fixture
 def sample_config_file_factory(tmp_path):
     def _simple_config_file(
@@ -58,53 +81,31 @@ class IOCState:
     enabled: str
 
 
-@pytest.fixture
-def sample_iocs(tmp_path, sample_config_file_factory, monkeypatch):
-    sample_config_file_factory(name="ioc1", port=1234, hostname="another_host")
-    sample_config_file_factory(
-        name="ioc2", port=2345, user="softioc-tst", hostname=socket.gethostname()
-    )
-    sample_config_file_factory(name="ioc3", port=3456, exec_path="start_epics", chdir="iocBoot")
-    sample_config_file_factory(name="ioc4", port=6789)
-    sample_config_file_factory(name="ioc5", port=7890, hostname="remote_host")
-    sample_config_file_factory(name="ioc6", port=8901, hostname="random")
+class DummySystemdBackend(manage_iocs.systemd.SystemdBackend):
+    """Dummy systemd backend for testing, keeping IOC unit states in memory."""
 
-    monkeypatch.setattr(manage_iocs.utils, "IOC_SEARCH_PATH", [tmp_path / "iocs"])
-    monkeypatch.setattr(
-        manage_iocs.utils, "SYSTEMD_SERVICE_PATH", tmp_path / "etc" / "systemd" / "system"
-    )
+    name = "dummy"
 
-    log_dir = tmp_path / "var" / "log" / "softioc"
-    monkeypatch.setattr(manage_iocs.utils, "MANAGE_IOCS_LOG_PATH", log_dir)
-    os.makedirs(log_dir, exist_ok=True)
+    def __init__(self, ioc_states: dict[str, IOCState]):
+        self.ioc_states = ioc_states
+        self.calls: list[tuple[str, list[str]]] = []
 
-    ioc_states: dict[str, IOCState] = {}
-    ioc_states["ioc1"] = IOCState("active", "enabled")
-    ioc_states["ioc3"] = IOCState("active", "disabled")
-    ioc_states["ioc4"] = IOCState("inactive", "disabled")
-    ioc_states["ioc5"] = IOCState("inactive", "enabled")
-
-    def dummy_systemctl_passthrough(action: str, ioc: str) -> tuple[str, str, int]:
-        """Dummy systemctl passthrough for testing."""
+    def passthrough(self, action: str, unit: str) -> tuple[str, str, int]:
+        self.calls.append((action, [unit]))
+        ioc = unit.removeprefix("softioc-").removesuffix(".service")
+        ioc_states = self.ioc_states
         stdout = ""
         stderr = ""
         rc = 0
 
-        if ioc not in ioc_states and action != "install":
+        if ioc not in ioc_states:
             rc = 4  # simulating 'not found' return code
-        elif action == "install" and ioc in ioc_states:
-            rc = 1  # simulating 'already installed' error
-        elif action == "install":
-            ioc_states[ioc] = IOCState(state="stopped", enabled="disabled")
         else:
             ioc_state = ioc_states[ioc]
             if action == "is-active":
                 stdout = ioc_state.state
             elif action == "is-enabled":
                 stdout = ioc_state.enabled
-            elif action == "uninstall":
-                del ioc_states[ioc]
-                os.remove(manage_iocs.utils.SYSTEMD_SERVICE_PATH / f"softioc-{ioc}.service")
             elif action == "start":
                 ioc_states[ioc].state = "active"
             elif action == "stop":
@@ -118,7 +119,78 @@ def sample_iocs(tmp_path, sample_config_file_factory, monkeypatch):
 
         return stdout, stderr, rc
 
-    monkeypatch.setattr(manage_iocs.utils, "systemctl_passthrough", dummy_systemctl_passthrough)
+    def show(self, units: list[str], properties: list[str]) -> list[dict[str, str]]:
+        self.calls.append(("show", units))
+        results = []
+        for unit in units:
+            ioc_state = self.ioc_states.get(unit.removeprefix("softioc-").removesuffix(".service"))
+            if ioc_state is None:
+                results.append({"Id": unit, "LoadState": "not-found", "ActiveState": "inactive"})
+            else:
+                results.append(
+                    {
+                        "Id": unit,
+                        "LoadState": "loaded",
+                        "ActiveState": ioc_state.state,
+                        "UnitFileState": ioc_state.enabled,
+                    }
+                )
+        return results
+
+    def enqueue(self, action: str, units: list[str]) -> tuple[str, str, int]:
+        self.calls.append((action, units))
+        errors = []
+        for unit in units:
+            _, _, rc = self.passthrough(action, unit)
+            self.calls.pop()
+            if rc != 0:
+                errors.append(f"Failed to {action} {unit}")
+        return "", "\n".join(errors), 1 if errors else 0
+
+    def pending_jobs(self) -> set[str]:
+        return set()
+
+    def reload(self) -> tuple[str, str, int]:
+        # Pick up service files that were written or removed since the last reload
+        self.calls.append(("daemon-reload", []))
+        service_files = manage_iocs.utils.SYSTEMD_SERVICE_PATH.glob("softioc-*.service")
+        iocs = {
+            path.name.removeprefix("softioc-").removesuffix(".service") for path in service_files
+        }
+        for ioc in iocs - self.ioc_states.keys():
+            self.ioc_states[ioc] = IOCState(state="stopped", enabled="disabled")
+        for ioc in self.ioc_states.keys() - iocs:
+            del self.ioc_states[ioc]
+        return "", "", 0
+
+
+@pytest.fixture
+def sample_iocs(tmp_path, sample_config_file_factory, monkeypatch):
+    sample_config_file_factory(name="ioc1", port=1234, hostname="another_host")
+    sample_config_file_factory(
+        name="ioc2", port=2345, user="softioc-tst", hostname=socket.gethostname()
+    )
+    sample_config_file_factory(name="ioc3", port=3456, exec_path="start_epics", chdir="iocBoot")
+    sample_config_file_factory(name="ioc4", port=6789)
+    sample_config_file_factory(name="ioc5", port=7890, hostname="remote_host")
+    sample_config_file_factory(name="ioc6", port=8901, hostname="random")
+
+    monkeypatch.setattr(manage_iocs.utils, "IOC_SEARCH_PATH", [tmp_path / "iocs"])
+    monkeypatch.setattr(
+        manage_iocs.utils, "SYSTEMD_SERVICE_PATH", tmp_path / "etc" / "systemd" / "system"
+    )
+
+    log_dir = tmp_path / "var" / "log" / "softioc"
+    monkeypatch.setattr(manage_iocs.utils, "MANAGE_IOCS_LOG_PATH", log_dir)
+    os.makedirs(log_dir, exist_ok=True)
+
+    ioc_states: dict[str, IOCState] = {}
+    ioc_states["ioc1"] = IOCState("active", "enabled")
+    ioc_states["ioc3"] = IOCState("active", "disabled")
+    ioc_states["ioc4"] = IOCState("inactive", "disabled")
+    ioc_states["ioc5"] = IOCState("inactive", "enabled")
+
+    monkeypatch.setattr(manage_iocs.systemd, "_backend", DummySystemdBackend(ioc_states))
 
     os.makedirs(manage_iocs.utils.SYSTEMD_SERVICE_PATH, exist_ok=True)
     for ioc in ["ioc1", "ioc3", "ioc4", "ioc5"]:
@@ -132,15 +204,29 @@ def sample_iocs(tmp_path, sample_config_file_factory, monkeypatch):
 @pytest.fixture
 def dummy_popen(monkeypatch):
     class DummyPopen:
-        def __init__(self, args, stdin, stdout):
+        def __init__(self, args, stdin=None, stdout=None):
             self.args = args
             self.returncode = 0
 
         def wait(self):
             return self.args
 
-        def communicate(self):
+        def communicate(self, timeout=None):
             return (str(self.args).encode(), b"")
 
-    monkeypatch.setattr(cmds, "Popen", DummyPopen)
-    monkeypatch.setattr(manage_iocs.utils, "Popen", DummyPopen)
+    monkeypatch.setattr(manage_iocs.systemd, "Popen", DummyPopen)
+
+
+@pytest.fixture
+def fake_systemctl(tmp_path, monkeypatch):
+    """Put a ``systemctl`` script on the PATH, returning a function to set its body."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def _set_script(body: str):
+        script = bin_dir / "systemctl"
+        script.write_text(f"#!/bin/sh\n{body}\n")
+        script.chmod(0o755)
+
+    return _set_script
@@ -0,0 +1,123 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import manage_iocs.__main__
+import manage_iocs.agent
+import manage_iocs.output
+import manage_iocs.systemd
+import manage_iocs.utils
+from manage_iocs.agent import AgentServer, request, socket_path
+
+
+@pytest.fixture
+def running_agent(sample_iocs):
+    path = socket_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    server = AgentServer(path)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    path.unlink()
+
+
+def test_no_agent(sample_iocs):
+    assert request(["status"]) is None
+
+
+def test_agent_serves_status(running_agent, capsys):
+    response = request(["status"])
+    assert response is not None
+    assert response["rc"] == 0
+    assert "ioc4" in response["stdout"]
+    # Output goes back to the client rather than the agent's own stdout
+    assert capsys.readouterr().out == ""
+
+
+def test_agent_reuses_unit_states(running_agent):
+    backend = manage_iocs.systemd.get_backend()
+    for _ in range(3):
+        assert request(["status", "--format", "json"])["rc"] == 0
+    assert [call[0] for call in backend.calls].count("show") == 1
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["start", "ioc4"], "Command not served by the agent: start ioc4"),
+        (["status", "--bogus"], "Unknown option for command 'status': --bogus"),
+    ],
+)
+def test_agent_errors(running_agent, args, message):
+    with pytest.raises(RuntimeError, match=message):
+        request(args)
+
+
+def test_main_uses_agent(running_agent, monkeypatch, capsys):
+    requests = []
+    monkeypatch.setattr(
+        manage_iocs.agent, "request", lambda args: requests.append(args) or request(args)
+    )
+    monkeypatch.setattr(sys, "argv", ["manage-iocs", "report", "--format", "csv"])
+    assert manage_iocs.__main__.main() == 0
+    assert requests == [["report", "--format", "csv"]]
+    assert capsys.readouterr().out.startswith("base,ioc,user,port,exec,host,status")
+
+
+@pytest.mark.parametrize("flag", ["--no-agent", "--no-cache"])
+def test_main_skips_agent(running_agent, monkeypatch, capsys, flag):
+    monkeypatch.setattr(manage_iocs.utils, "USE_AGENT", True)
+    monkeypatch.setattr(sys, "argv", ["manage-iocs", "nextport", flag])
+    monkeypatch.setattr(
+        manage_iocs.agent, "request", lambda args: pytest.fail("the agent should not be used")
+    )
+    assert manage_iocs.__main__.main() == 0
+    assert capsys.readouterr().out.strip() == "4000"
+
+
+@pytest.mark.parametrize("watch", ["--watch", "--watch=1", "--watch=yes"])
+def test_main_does_not_send_watch_to_agent(running_agent, monkeypatch, watch):
+    monkeypatch.setattr(manage_iocs.utils, "USE_AGENT", True)
+    monkeypatch.setattr(sys, "argv", ["manage-iocs", "status", watch])
+    monkeypatch.setattr(
+        manage_iocs.agent, "request", lambda args: pytest.fail("the agent should not be used")
+    )
+    monkeypatch.setattr(manage_iocs.output, "watch_table", lambda header, fetch, interval: 0)
+    assert manage_iocs.__main__.main() == 0
+
+
+def test_agent_refuses_watch(running_agent):
+    with pytest.raises(RuntimeError, match="Watching is not served by the agent"):
+        request(["status", "--watch=1"])
+
+
+def test_agent_started_through_main_sees_new_iocs(
+    sample_iocs, sample_config_file_factory, monkeypatch
+):
+    monkeypatch.setattr(manage_iocs.agent, "AGENT_INVENTORY_TTL", 0.0)
+    servers = []
+
+    class RecordedAgentServer(AgentServer):
+        def __init__(self, path):
+            super().__init__(path)
+            servers.append(self)
+
+    monkeypatch.setattr(manage_iocs.agent, "AgentServer", RecordedAgentServer)
+    monkeypatch.setattr(sys, "argv", ["manage-iocs", "agent"])
+    thread = threading.Thread(target=manage_iocs.__main__.main)
+    thread.start()
+    try:
+        while not servers and thread.is_alive():
+            time.sleep(0.01)
+        assert "ioc7" not in request(["report", "--format", "csv"])["stdout"]
+        sample_config_file_factory(name="ioc7", port=9012)
+        assert "ioc7" in request(["report", "--format", "csv"])["stdout"]
+    finally:
+        if servers:
+            servers[0].shutdown()
+        thread.join()
@@ -0,0 +1,169 @@
+import json
+import os
+import time
+
+import pytest
+
+import manage_iocs.commands as cmds
+import manage_iocs.utils
+from manage_iocs.cache import CACHE_VERSION, InventoryCache
+from manage_iocs.utils import find_iocs, read_config_file
+
+
+def age_tree(path, seconds=60):
+    """Push back the mtime of everything under path so it is outside the racy window."""
+    past = time.time() - seconds
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.utime(os.path.join(root, name), (past, past))
+    os.utime(path, (past, past))
+
+
+@pytest.fixture
+def counted_reads(monkeypatch):
+    reads = []
+
+    def counting_read_config_file(config_path):
+        reads.append(config_path.parent.name)
+        return read_config_file(config_path)
+
+    monkeypatch.setattr(manage_iocs.utils, "read_config_file", counting_read_config_file)
+    return reads
+
+
+def test_cache_file_written(sample_iocs, isolated_inventory_cache):
+    age_tree(sample_iocs / "iocs")
+    find_iocs()
+
+    with open(isolated_inventory_cache / "inventory.json") as f:
+        data = json.load(f)
+    assert data["version"] == CACHE_VERSION
+    items = data["search_paths"][str(sample_iocs / "iocs")]["items"]
+    assert sorted(items) == ["ioc1", "ioc2", "ioc3", "ioc4", "ioc5", "ioc6"]
+    assert items["ioc3"]["config"]["EXEC"] == "start_epics"
+
+
+def test_cache_warm_scan_skips_parsing(sample_iocs, counted_reads):
+    age_tree(sample_iocs / "iocs")
+    cold = find_iocs()
+    assert len(counted_reads) == 6
+
+    counted_reads.clear()
+    warm = find_iocs()
+    assert counted_reads == []
+    assert warm == cold
+
+
+def test_cache_reparses_only_changed_config(sample_iocs, counted_reads):
+    age_tree(sample_iocs / "iocs")
+    find_iocs()
+    counted_reads.clear()
+
+    with open(sample_iocs / "iocs" / "ioc4" / "config", "a") as f:
+        f.write("CHDIR=iocBoot/iocioc4\n")
+    age_tree(sample_iocs / "iocs" / "ioc4", seconds=30)
+
+    iocs = find_iocs()
+    assert counted_reads == ["ioc4"]
+    assert iocs["ioc4"].chdir == "iocBoot/iocioc4"
+
+
+def test_cache_detects_added_and_removed_iocs(
+    sample_iocs, counted_reads, sample_config_file_factory
+):
+    age_tree(sample_iocs / "iocs")
+    find_iocs()
+    counted_reads.clear()
+
+    sample_config_file_factory(name="ioc7", port=9012)
+    os.remove(sample_iocs / "iocs" / "ioc1" / "config")
+    os.rmdir(sample_iocs / "iocs" / "ioc1")
+    age_tree(sample_iocs / "iocs" / "ioc7", seconds=30)
+    os.utime(sample_iocs / "iocs", (time.time() - 30, time.time() - 30))
+
+    iocs = find_iocs()
+    assert counted_reads == ["ioc7"]
+    assert "ioc1" not in iocs
+    assert iocs["ioc7"].procserv_port == 9012
+
+
+def test_cache_detects_config_added_to_existing_dir(sample_iocs, counted_reads):
+    os.makedirs(sample_iocs / "iocs" / "ioc8")
+    age_tree(sample_iocs / "iocs")
+    assert "ioc8" not in find_iocs()
+
+    with open(sample_iocs / "iocs" / "ioc8" / "config", "w") as f:
+        f.write("PORT=9013\n")
+    age_tree(sample_iocs / "iocs" / "ioc8", seconds=30)
+
+    assert find_iocs()["ioc8"].procserv_port == 9013
+
+
+def test_cache_does_not_trust_recent_timestamps(sample_iocs, counted_reads):
+    find_iocs()
+    counted_reads.clear()
+
+    # Within the racy window the config may be rewritten without a visible stat change
+    find_iocs()
+    assert len(counted_reads) == 6
+
+
+def test_cache_disabled(sample_iocs, isolated_inventory_cache, monkeypatch):
+    monkeypatch.setattr(manage_iocs.utils, "USE_INVENTORY_CACHE", False)
+    assert len(find_iocs()) == 6
+    assert not (isolated_inventory_cache / "inventory.json").exists()
+
+
+@pytest.mark.parametrize("contents", ["not json", json.dumps({"version": -1})])
+def test_cache_ignores_invalid_file(sample_iocs, isolated_inventory_cache, contents):
+    os.makedirs(isolated_inventory_cache)
+    with open(isolated_inventory_cache / "inventory.json", "w") as f:
+        f.write(contents)
+
+    assert len(find_iocs()) == 6
+
+
+def test_cache_save_unwritable(tmp_path):
+    inventory_cache = InventoryCache(tmp_path / "missing" / "inventory.json")
+    inventory_cache.dirty = True
+    os.chmod(tmp_path, 0o500)
+    try:
+        if os.access(tmp_path, os.W_OK):
+            pytest.skip("Running with permissions that bypass file modes")
+        inventory_cache.save()
+        with pytest.raises(OSError):
+            inventory_cache.save(strict=True)
+    finally:
+        os.chmod(tmp_path, 0o700)
+
+
+def test_cache_rebuild(sample_iocs, isolated_inventory_cache, capsys):
+    rc = cmds.cache("rebuild")
+    assert rc == 0
+    assert "Rebuilt inventory cache with 6 IOC(s)." in capsys.readouterr().out
+    assert (isolated_inventory_cache / "inventory.json").exists()
+
+    rc = cmds.cache("clear")
+    assert rc == 0
+    assert not (isolated_inventory_cache / "inventory.json").exists()
+
+
+def test_cache_unknown_action(sample_iocs):
+    with pytest.raises(RuntimeError, match="Unknown cache action: bogus"):
+        cmds.cache("bogus")
+
+
+def test_cache_cold_scan_does_not_stat_ioc_dirs(sample_iocs, isolated_inventory_cache, monkeypatch):
+    age_tree(sample_iocs / "iocs")
+    ioc_dirs = {str(path) for path in (sample_iocs / "iocs").iterdir()}
+    stat = os.stat
+    stat_calls = []
+
+    def counting_stat(path, *args, **kwargs):
+        stat_calls.append(str(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    assert len(find_iocs()) == 6
+    assert ioc_dirs.isdisjoint(stat_calls)
+    assert any(path.endswith("config") for path in stat_calls)
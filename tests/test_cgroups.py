@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import manage_iocs.cgroups
+import manage_iocs.commands as cmds
+from manage_iocs.cgroups import CgroupSample, measure_usage, read_sample, usage_between
+from manage_iocs.output import format_bytes
+
+
+def write_cgroup(root, ioc: str, cpu_usec: int, memory: int, rbytes: int = 0, wbytes: int = 0):
+    path = root / "system.slice" / f"softioc-{ioc}.service"
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "cpu.stat").write_text(f"usage_usec {cpu_usec}\nuser_usec {cpu_usec}\nsystem_usec 0\n")
+    (path / "memory.current").write_text(f"{memory}\n")
+    (path / "io.stat").write_text(
+        f"8:0 rbytes={rbytes} wbytes={wbytes} rios=1 wios=1 dbytes=0 dios=0\n"
+        "8:16 rbytes=100 wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n"
+    )
+
+
+@pytest.fixture
+def cgroup_root(tmp_path, monkeypatch):
+    root = tmp_path / "cgroup"
+    monkeypatch.setattr(manage_iocs.cgroups, "CGROUP_ROOT", root)
+    return root
+
+
+@pytest.fixture
+def busy_iocs(cgroup_root, monkeypatch):
+    """ioc1 uses half a CPU, ioc3 a quarter but more memory and I/O; ioc4 is not running."""
+    write_cgroup(cgroup_root, "ioc1", 1_000_000, 10 * 2**20)
+    write_cgroup(cgroup_root, "ioc3", 2_000_000, 50 * 2**20)
+    clock = [100.0]
+    monkeypatch.setattr(manage_iocs.cgroups.time, "monotonic", lambda: clock[0])
+
+    def sleep(seconds):
+        clock[0] += 2.0
+        write_cgroup(cgroup_root, "ioc1", 2_000_000, 10 * 2**20)
+        write_cgroup(cgroup_root, "ioc3", 2_500_000, 50 * 2**20, rbytes=4096, wbytes=2048)
+
+    monkeypatch.setattr(manage_iocs.cgroups.time, "sleep", sleep)
+
+
+def test_read_sample(cgroup_root):
+    write_cgroup(cgroup_root, "ioc1", 1234, 5678, rbytes=10, wbytes=20)
+    sample = read_sample("ioc1")
+    assert sample is not None
+    assert (sample.cpu_usec, sample.memory_bytes) == (1234, 5678)
+    assert (sample.io_read_bytes, sample.io_write_bytes) == (110, 20)
+    assert read_sample("ioc2") is None
+
+
+def test_usage_between():
+    first = CgroupSample("ioc1", 10.0, 0, 100, 0, 0)
+    second = CgroupSample("ioc1", 12.0, 3_000_000, 200, 1024, 2048)
+    usage = usage_between(first, second)
+    assert usage.cpu_percent == pytest.approx(150.0)
+    assert usage.memory_bytes == 200
+    assert (usage.io_read_rate, usage.io_write_rate) == (512.0, 1024.0)
+
+
+@pytest.mark.parametrize(
+    "sort, expected",
+    [("cpu", ["ioc1", "ioc3"]), ("memory", ["ioc3", "ioc1"]), ("ioc", ["ioc1", "ioc3"])],
+)
+def test_measure_usage_sorting(busy_iocs, sort, expected):
+    usages = measure_usage(["ioc1", "ioc3", "ioc4"], 2.0, sort)
+    assert [usage.ioc for usage in usages] == expected
+
+
+def test_measure_usage_unknown_sort(cgroup_root):
+    with pytest.raises(RuntimeError, match="Unknown sort column: disk"):
+        measure_usage(["ioc1"], 1.0, "disk")
+
+
+def test_format_bytes():
+    assert format_bytes(512) == "512 B"
+    assert format_bytes(1536) == "1.5 KiB"
+    assert format_bytes(50 * 2**20) == "50.0 MiB"
+    assert format_bytes(3 * 2**40) == "3.0 TiB"
+
+
+def test_usage_command(sample_iocs, busy_iocs, capsys):
+    assert cmds.usage(sort="io") == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[2].split() == ["ioc3", "25.0%", "50.0", "MiB", "2.0", "KiB/s", "1.0", "KiB/s"]
+    assert lines[3].split()[:2] == ["ioc1", "50.0%"]
+    assert len(lines) == 4
+
+
+def test_usage_command_json(sample_iocs, busy_iocs, capsys):
+    assert cmds.usage(format="json") == 0
+    records = json.loads(capsys.readouterr().out)
+    assert [record["ioc"] for record in records] == ["ioc1", "ioc3"]
+    assert records[0]["cpu_percent"] == pytest.approx(50.0)
+    assert records[1]["memory_bytes"] == 50 * 2**20
@@ -4,7 +4,9 @@ from collections.abc import Callable
 import pytest
 
 import manage_iocs.commands as cmds
-from manage_iocs.__main__ import get_command_from_args
+import manage_iocs.utils
+from manage_iocs.__main__ import apply_global_options, get_command_from_args, parse_options
+from manage_iocs.registry import COMMANDS
 
 
 def test_no_command_provided():
@@ -23,7 +25,10 @@ def _get_cmds_w_required_args():
     """
     cmds_w_req_args = []
     for name, obj in inspect.getmembers(cmds):
-        if inspect.isfunction(obj) and bool(inspect.signature(obj).parameters):
+        if inspect.isfunction(obj) and any(
+            param.kind == param.POSITIONAL_OR_KEYWORD and param.default is param.empty
+            for param in inspect.signature(obj).parameters.values()
+        ):
             cmds_w_req_args.append(name)
     return cmds_w_req_args
 
@@ -60,3 +65,67 @@ def test_get_command_from_args(args, expected_command):
     cmd = get_command_from_args(["manage_iocs"] + args)
     assert isinstance(cmd, Callable)
     assert cmd.__name__ == expected_command.__name__
+
+
+def test_no_cache_global_option(monkeypatch):
+    monkeypatch.setattr(manage_iocs.utils, "USE_INVENTORY_CACHE", True)
+    args = apply_global_options(["manage_iocs", "--no-cache", "status"])
+    assert args == ["manage_iocs", "status"]
+    assert manage_iocs.utils.USE_INVENTORY_CACHE is False
+
+
+@pytest.mark.parametrize(
+    "args, expected_options",
+    [
+        (["startall"], {}),
+        (["startall", "--chunk", "10"], {"chunk": 10}),
+        (["stopall", "--chunk=5", "--timeout", "2.5"], {"chunk": 5, "timeout": 2.5}),
+    ],
+)
+def test_parse_options(args, expected_options):
+    positional, options = parse_options(args[0], args[1:])
+    assert positional == []
+    assert options == expected_options
+
+
+@pytest.mark.parametrize(
+    "args, expected_message",
+    [
+        (["startall", "--bogus"], "Unknown option for command 'startall': --bogus"),
+        (["startall", "--chunk"], "Option '--chunk' requires a value!"),
+        (["startall", "--chunk", "many"], "Invalid value for option '--chunk': many"),
+    ],
+)
+def test_parse_options_errors(args, expected_message):
+    with pytest.raises(RuntimeError, match=expected_message):
+        get_command_from_args(["manage_iocs"] + args)
+
+
+def test_registry_matches_commands(all_manage_iocs_commands):
+    assert sorted(COMMANDS) == sorted(func.__name__ for func in all_manage_iocs_commands)
+
+    for func in all_manage_iocs_commands:
+        info = COMMANDS[func.__name__]
+        parameters = inspect.signature(func).parameters.values()
+        assert info.doc == func.__doc__
+        assert info.params == tuple(
+            p.name for p in parameters if p.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
+        )
+        assert info.varargs == next(
+            (p.name for p in parameters if p.kind == inspect.Parameter.VAR_POSITIONAL), ""
+        )
+        assert info.options == {
+            p.name: p.default for p in parameters if p.kind == inspect.Parameter.KEYWORD_ONLY
+        }
+
+
+def test_help_lists_every_command(capsys):
+    cmds.help()
+    out = capsys.readouterr().out
+    for name in COMMANDS:
+        assert f"  {name} " in out
+    assert "  logs <ioc> [iocs...] " in out
+    assert "\n        [--follow] [--since-restart]\n" in out
+    # Options do not widen the column of commands
+    assert max(len(line.split(" - ")[0]) for line in out.splitlines() if " - " in line) < 40
+    assert "--no-agent" in out
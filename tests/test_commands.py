@@ -1,9 +1,16 @@
+import asyncio
+import csv
+import io
+import json
 import os
 
 import pytest
 
 import manage_iocs
 import manage_iocs.commands as cmds
+import manage_iocs.console
+import manage_iocs.ports
+import manage_iocs.systemd
 import manage_iocs.utils
 from manage_iocs.utils import find_installed_iocs, get_ioc_status
 
@@ -55,7 +62,7 @@ def test_report_no_iocs(monkeypatch, capsys):
     monkeypatch.setattr(
         manage_iocs.utils,
         "find_iocs",
-        lambda: {},
+        lambda host=None: {},
     )
 
     rc = cmds.report()
@@ -173,18 +180,32 @@ def test_state_change_all(sample_iocs, cmd, expected_state, expected_enabled):
 
 
 @pytest.mark.parametrize("as_root", [True, False])
-def test_attach(sample_iocs, monkeypatch, dummy_popen, as_root):
+def test_attach(sample_iocs, monkeypatch, as_root):
     if not as_root:
         monkeypatch.setattr(os, "geteuid", lambda: 1000)  # Mock as non-root user
+    monkeypatch.setattr(manage_iocs.console, "attach_console", lambda host, port: (host, port))
 
     ret = cmds.attach("ioc3")
 
-    assert ret == ["telnet", "localhost", "3456"]
+    assert ret == ("localhost", 3456)
 
     with pytest.raises(RuntimeError, match="Cannot attach to IOC 'ioc4': IOC is not running!"):
         cmds.attach("ioc4")  # IOC is stopped
 
 
+def test_attach_unknown_state(sample_iocs, monkeypatch):
+    monkeypatch.setattr(manage_iocs.utils, "systemctl_show", lambda iocs: {})
+    with pytest.raises(RuntimeError, match="systemd reported no state for IOC 'ioc3'!"):
+        cmds.attach("ioc3")
+
+    timed_out = {"ioc3": manage_iocs.utils.UnitState("ioc3", timed_out=True)}
+    monkeypatch.setattr(manage_iocs.utils, "systemctl_show", lambda iocs: timed_out)
+    with pytest.raises(RuntimeError, match="did not report the state of IOC 'ioc3' in time!"):
+        cmds.attach("ioc3")
+    with pytest.raises(RuntimeError, match="did not report the state of IOC 'ioc3' in time!"):
+        cmds.rename("ioc3", "ioc3b")
+
+
 @pytest.mark.parametrize("as_root", [True, False])
 def test_status(sample_iocs, capsys, monkeypatch, as_root):
     if not as_root:
@@ -216,7 +237,7 @@ def test_status_no_installed_iocs(sample_iocs, monkeypatch, capsys):
     monkeypatch.setattr(
         manage_iocs.utils,
         "find_installed_iocs",
-        lambda: {},
+        lambda iocs=None: {},
     )
 
     rc = cmds.status()
@@ -248,21 +269,121 @@ def test_command_failures(sample_iocs, monkeypatch, cmd, expected_message):
 @pytest.mark.parametrize(
     "failed_action, expected_message",
     [
-        ("stop", "Failed to stop IOC 'ioc5' before uninstalling!"),
-        ("disable", "Failed to disable IOC 'ioc5' before uninstalling!"),
-        ("uninstall", "Failed to uninstall IOC 'ioc5'!"),
+        ("stop", "Failed to stop IOC 'ioc1' before uninstalling!"),
+        ("disable", "Failed to disable IOC 'ioc1' before uninstalling!"),
+        ("daemon-reload", "Failed to uninstall IOC 'ioc1'!"),
     ],
 )
 def test_uninstall_failures(sample_iocs, monkeypatch, failed_action, expected_message):
-    def failing_systemctl_passthrough(action: str, ioc: str) -> tuple[str, str, int]:
+    backend = manage_iocs.systemd.get_backend()
+    enqueue = backend.enqueue
+    reload = backend.reload
+
+    def failing_enqueue(action: str, units: list[str]) -> tuple[str, str, int]:
         if action == failed_action:
             return ("", "Simulated failure", 1)
-        return ("", "", 0)
+        return enqueue(action, units)
 
-    monkeypatch.setattr(manage_iocs.utils, "systemctl_passthrough", failing_systemctl_passthrough)
+    def failing_reload() -> tuple[str, str, int]:
+        if failed_action == "daemon-reload":
+            return ("", "Simulated failure", 1)
+        return reload()
+
+    monkeypatch.setattr(backend, "enqueue", failing_enqueue)
+    monkeypatch.setattr(backend, "reload", failing_reload)
 
     with pytest.raises(RuntimeError, match=expected_message):
-        cmds.uninstall("ioc5")
+        cmds.uninstall("ioc1")
+
+
+def test_install_port_used_by_ioc_of_other_host(sample_iocs, sample_config_file_factory):
+    # ioc1 is configured for another host, but its unit is installed here on port 1234
+    sample_config_file_factory(name="ioc7", port=1234)
+    with pytest.raises(RuntimeError, match="procServ port 1234 is already in use!"):
+        cmds.install("ioc7")
+
+
+def test_install_many_reloads_once(sample_iocs, sample_config_file_factory, capsys):
+    sample_config_file_factory(name="ioc7", port=4007)
+    sample_config_file_factory(name="ioc8", port=4007)
+    backend = manage_iocs.systemd.get_backend()
+
+    assert cmds.install("ioc2", "ioc7", "ioc8", "ioc3") == 1
+    assert [call for call in backend.calls if call[0] == "daemon-reload"] == [("daemon-reload", [])]
+    assert {"ioc2", "ioc7"} <= find_installed_iocs().keys()
+    assert "ioc8" not in find_installed_iocs()
+
+    out = capsys.readouterr().out
+    assert "procServ port 4007 is already in use!" in out
+    assert "IOC 'ioc3' is already installed!" in out
+    assert "Install: 2 succeeded, 2 failed" in out
+
+
+def test_install_all(sample_iocs):
+    assert cmds.install(all=True) == 0
+    # ioc6 is configured for another host, and was left alone
+    assert find_installed_iocs().keys() == {"ioc1", "ioc2", "ioc3", "ioc4", "ioc5"}
+
+
+def test_install_rolls_back_on_reload_failure(sample_iocs, monkeypatch):
+    monkeypatch.setattr(manage_iocs.systemd.get_backend(), "reload", lambda: ("", "No bus", 1))
+
+    with pytest.raises(RuntimeError, match="Failed to install IOC 'ioc2'!: No bus"):
+        cmds.install("ioc2")
+    assert not manage_iocs.utils.is_service_installed("ioc2")
+
+
+def test_uninstall_all(sample_iocs, capsys):
+    backend = manage_iocs.systemd.get_backend()
+
+    assert cmds.uninstall(all=True) == 0
+    assert find_installed_iocs() == {}
+    assert [call[0] for call in backend.calls].count("daemon-reload") == 1
+    assert "Uninstall: 4 succeeded, 0 failed" in capsys.readouterr().out
+
+
+def test_sync(sample_iocs, sample_config_file_factory, capsys):
+    backend = manage_iocs.systemd.get_backend()
+
+    # The dummy service files of sample_iocs never match the rendered ones
+    assert cmds.sync() == 0
+    assert "Sync: 4 succeeded, 0 failed" in capsys.readouterr().out
+    assert [call[0] for call in backend.calls].count("daemon-reload") == 1
+    service_file = manage_iocs.utils.service_file_path("ioc3")
+    assert "IOCNAME=ioc3" in service_file.read_text()
+
+    backend.calls.clear()
+    assert cmds.sync() == 0
+    assert "all 4 service files are up to date" in capsys.readouterr().out
+    assert not any(call[0] == "daemon-reload" for call in backend.calls)
+
+    sample_config_file_factory(name="ioc3", port=4444, exec_path="start_epics", chdir="iocBoot")
+    assert cmds.sync(dry_run=True) == 0
+    assert capsys.readouterr().out == "  ioc3\nSync: 1 of 4 service files out of date.\n"
+    assert "4444" not in service_file.read_text()
+
+    assert cmds.sync(restart=True) == 0
+    out = capsys.readouterr().out
+    assert "Sync: 1 succeeded, 0 failed" in out
+    assert "Restart: 1 succeeded, 0 failed" in out
+    assert "PROCPORT=4444" in service_file.read_text()
+    assert ("restart", ["softioc-ioc3.service"]) in backend.calls
+
+
+def test_sync_restarts_only_running_iocs(sample_iocs, capsys):
+    backend = manage_iocs.systemd.get_backend()
+
+    assert cmds.sync(restart=True) == 0
+    # Of the rewritten IOCs, only ioc1 and ioc3 were running
+    assert ("restart", ["softioc-ioc1.service", "softioc-ioc3.service"]) in backend.calls
+
+
+@pytest.mark.parametrize("command", [cmds.install, cmds.uninstall])
+def test_install_uninstall_needs_iocs_or_all(sample_iocs, command):
+    with pytest.raises(RuntimeError, match="Specify either IOC names or --all"):
+        command()
+    with pytest.raises(RuntimeError, match="Specify either IOC names or --all"):
+        command("ioc4", all=True)
 
 
 def test_fail_to_install_ioc_to_run_as_root(sample_iocs, monkeypatch, sample_config_file_factory):
@@ -283,10 +404,44 @@ def test_command_requires_ioc_installed(sample_iocs, cmd):
 def test_nextport(sample_iocs, capsys):
     rc = cmds.nextport()
     captured = capsys.readouterr()
-    assert int(captured.out.strip()) == 8902  # Highest used port is 7890 in sample_iocs
+    assert int(captured.out.strip()) == 4000  # Lowest port in the range is unused
     assert rc == 0
 
 
+def test_nextport_reuses_gaps(sample_iocs, sample_config_file_factory, monkeypatch, capsys):
+    sample_config_file_factory(name="ioc7", port=4000)
+    sample_config_file_factory(name="ioc8", port=4002)
+    sample_config_file_factory(name="ioc9", port=4001, hostname="another_host")
+    monkeypatch.setattr(manage_iocs.ports, "listening_ports", lambda: {4001})
+
+    assert cmds.nextport() == 0
+    assert capsys.readouterr().out.strip() == "4003"
+
+
+def test_nextport_range_exhausted(sample_iocs, sample_config_file_factory, monkeypatch):
+    sample_config_file_factory(name="ioc7", port=4000)
+    monkeypatch.setattr(manage_iocs.utils, "PROCSERV_PORT_RANGE", (4000, 4000))
+
+    with pytest.raises(RuntimeError, match="No unused procServ port left in the range 4000-4000"):
+        cmds.nextport()
+
+
+def test_install_port_conflict(sample_iocs, sample_config_file_factory):
+    sample_config_file_factory(name="ioc7", port=3456)
+
+    with pytest.raises(RuntimeError, match="procServ port 3456 is already in use!"):
+        cmds.install("ioc7")
+
+
+def test_report_duplicate_ports(sample_iocs, sample_config_file_factory, capsys):
+    sample_config_file_factory(name="ioc7", port=3456)
+
+    assert cmds.report() == 0
+    out = capsys.readouterr().out
+    assert "Detected multiple IOCs configured to use the same procServ port!" in out
+    assert "Port 3456: ioc3, ioc7" in out
+
+
 def test_lastlog(sample_iocs, monkeypatch, capsys):
     log_file = sample_iocs / "var" / "log" / "softioc" / "ioc3.log"
 
@@ -315,3 +470,310 @@ def test_lastlog_no_restart_marker(sample_iocs, monkeypatch, capsys):
     captured = capsys.readouterr()
     assert captured.out.strip() == "Line A\nLine B\nLine C"
     assert rc == 0
+
+
+def test_status_uses_bulk_query(sample_iocs, monkeypatch, capsys):
+    def no_passthrough(action: str, ioc: str) -> tuple[str, str, int]:
+        raise AssertionError("status should not query IOCs one at a time")
+
+    monkeypatch.setattr(manage_iocs.utils, "systemctl_passthrough", no_passthrough)
+
+    rc = cmds.status()
+    assert rc == 0
+    assert "ioc5" in capsys.readouterr().out
+
+
+def test_status_reports_timed_out_iocs(sample_iocs, monkeypatch, capsys):
+    backend = manage_iocs.systemd.get_backend()
+    show = backend.show
+
+    async def show_async(units, properties):
+        if units == ["softioc-ioc4.service"]:
+            await asyncio.sleep(10)
+        return show(units, properties)
+
+    monkeypatch.setattr(backend, "show_async", show_async)
+    monkeypatch.setattr(manage_iocs.utils, "SHOW_CHUNK_SIZE", 1)
+    monkeypatch.setattr(manage_iocs.systemd, "CALL_TIMEOUT", 0.1)
+
+    assert cmds.status() == 1
+    captured = capsys.readouterr()
+    rows = {line.split()[0]: line.split()[1:] for line in captured.out.splitlines()[2:]}
+    assert set(rows) == {"ioc1", "ioc3", "ioc4", "ioc5"}
+    assert "Timed out" in " ".join(rows["ioc4"])
+    assert rows["ioc4"][-1] == "-"
+    assert "did not report the state of 1 IOC(s) in time: ioc4" in captured.err
+
+
+def test_report_other_host(sample_iocs, capsys):
+    backend = manage_iocs.systemd.get_backend()
+    assert cmds.report(host="remote_host.example.org") == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split("|")[1].strip() for line in lines[2:]] == ["ioc5"]
+    assert lines[2].split("|")[-1].strip() == "Remote"
+    assert not any(call[0] == "show" for call in backend.calls)
+
+    assert cmds.report(host="elsewhere") == 1
+    assert "No IOCs found on configured to run on host 'elsewhere'." in capsys.readouterr().out
+
+
+def test_report_status_column(sample_iocs, capsys):
+    cmds.report()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[-1] == "STATUS"
+    statuses = {line.split("|")[1].strip(): line.split("|")[-1].strip() for line in lines[2:]}
+    assert statuses == {"ioc2": "Not installed", "ioc3": "Running", "ioc4": "Stopped"}
+
+
+def test_startall_queues_all_units_at_once(sample_iocs, capsys):
+    backend = manage_iocs.systemd.get_backend()
+
+    assert cmds.startall() == 0
+    queued = [call for call in backend.calls if call[0] == "start"]
+    assert queued == [("start", ["softioc-ioc4.service", "softioc-ioc5.service"])]
+
+    captured = capsys.readouterr()
+    assert "ioc1  OK (unchanged)" in captured.out
+    assert "ioc4  OK" in captured.out
+    assert "Start: 4 succeeded, 0 failed in" in captured.out
+
+
+def test_stopall_in_chunks(sample_iocs):
+    backend = manage_iocs.systemd.get_backend()
+
+    assert cmds.stopall(chunk=1) == 0
+    queued = [call for call in backend.calls if call[0] == "stop"]
+    assert queued == [("stop", ["softioc-ioc1.service"]), ("stop", ["softioc-ioc3.service"])]
+
+
+def test_startall_reports_failures(sample_iocs, monkeypatch, capsys):
+    backend = manage_iocs.systemd.get_backend()
+    monkeypatch.setattr(backend, "enqueue", lambda action, units: ("", "Simulated failure", 1))
+
+    # The exit status only says that something failed; the count is printed
+    assert cmds.startall() == 1
+    captured = capsys.readouterr()
+    assert "ioc4  FAILED (Stopped)" in captured.out
+    assert "Start: 2 succeeded, 2 failed in" in captured.out
+
+
+def test_startall_times_out(sample_iocs, monkeypatch, capsys):
+    backend = manage_iocs.systemd.get_backend()
+    monkeypatch.setattr(backend, "pending_jobs", lambda: {"softioc-ioc5.service"})
+    monkeypatch.setattr(manage_iocs.utils, "JOB_POLL_INTERVAL", 0.01)
+
+    assert cmds.startall(timeout=0.05) == 1
+    assert "ioc5  FAILED (timed out after 0.05s)" in capsys.readouterr().out
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    def fail_sleep(seconds):
+        raise AssertionError("output should not be artificially delayed")
+
+    monkeypatch.setattr(cmds.ttime, "sleep", fail_sleep)
+
+
+def test_status_lists_masked_and_not_found_units(sample_iocs, capsys):
+    backend = manage_iocs.systemd.get_backend()
+    backend.ioc_states["ioc4"].enabled = "masked"
+    del backend.ioc_states["ioc5"]  # Service file written without a daemon-reload
+
+    assert cmds.status(format="ndjson") == 0
+    records = {
+        record["ioc"]: record for record in map(json.loads, capsys.readouterr().out.splitlines())
+    }
+    assert list(records) == ["ioc1", "ioc3", "ioc4", "ioc5"]
+    assert records["ioc4"]["unit_file_state"] == "masked"
+    assert records["ioc5"]["status"] == "Stopped"
+
+    assert cmds.status() == 0
+    rows = {line.split()[0]: line.split()[1:] for line in capsys.readouterr().out.splitlines()[2:]}
+    assert rows["ioc4"][-1] == "Masked"
+    assert rows["ioc5"][-1] == "Not-found"
+
+
+def test_status_json(sample_iocs, capsys, no_sleep):
+    assert cmds.status(format="json") == 0
+    records = json.loads(capsys.readouterr().out)
+    assert [record["ioc"] for record in records] == ["ioc1", "ioc3", "ioc4", "ioc5"]
+    assert records[0]["status"] == "Running"
+    assert records[0]["enabled"] is True
+    assert set(records[0]) == set(cmds.STATUS_FIELDS)
+
+
+def test_status_ndjson(sample_iocs, capsys, no_sleep):
+    assert cmds.status(format="ndjson") == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 4
+    assert json.loads(lines[2]) == {
+        "ioc": "ioc4",
+        "status": "Stopped",
+        "enabled": False,
+        "unit_file_state": "disabled",
+        "active_state": "inactive",
+        "sub_state": "",
+        "main_pid": 0,
+        "since": "",
+    }
+
+
+def test_report_csv(sample_iocs, capsys, no_sleep):
+    assert cmds.report(format="csv") == 0
+    rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    assert [row["ioc"] for row in rows] == ["ioc2", "ioc3", "ioc4"]
+    assert rows[1]["exec"] == f"{sample_iocs}/iocs/ioc3/iocBoot/start_epics"
+    assert rows[0]["status"] == "Not installed"
+
+
+def test_report_table_is_one_write(sample_iocs, capsys, monkeypatch, no_sleep):
+    printed = []
+    monkeypatch.setattr("builtins.print", lambda *args, **kwargs: printed.append(args))
+    assert cmds.report() == 0
+    assert len(printed) == 1
+
+
+def test_machine_formats_keep_messages_off_stdout(monkeypatch, capsys):
+    monkeypatch.setattr(manage_iocs.utils, "find_iocs", lambda host=None: {})
+
+    assert cmds.report(format="json") == 1
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "No IOCs found" in captured.err
+
+
+def test_unknown_output_format(sample_iocs):
+    with pytest.raises(RuntimeError, match="Unknown output format: xml"):
+        cmds.status(format="xml")
+
+
+def test_logs_since_restart(sample_iocs, capsys):
+    log_dir = sample_iocs / "var" / "log" / "softioc"
+    (log_dir / "ioc3.log").write_text('Line 1\n@@@ Restarting child "ioc3"\nLine 2\n')
+    (log_dir / "ioc4.log").write_text("Line A\n")
+
+    assert cmds.logs("ioc3") == 0
+    assert capsys.readouterr().out == 'Line 1\n@@@ Restarting child "ioc3"\nLine 2\n'
+
+    assert cmds.logs("ioc3", "ioc4", since_restart=True) == 0
+    assert (
+        capsys.readouterr().out == 'ioc3: @@@ Restarting child "ioc3"\nioc3: Line 2\nioc4: Line A\n'
+    )
+
+
+def test_logs_not_installed(sample_iocs):
+    with pytest.raises(RuntimeError, match="No IOC with name 'ioc2' is installed!"):
+        cmds.logs("ioc3", "ioc2")
+
+
+@pytest.fixture
+def fake_exec(monkeypatch):
+    calls = []
+
+    async def exec_on_iocs(command, ports, concurrency, timeout):
+        calls.append((command, ports, concurrency, timeout))
+        return [manage_iocs.console.ExecResult(ioc, output=f"{command} on {ioc}") for ioc in ports]
+
+    monkeypatch.setattr(manage_iocs.console, "exec_on_iocs", exec_on_iocs)
+    return calls
+
+
+def test_exec_all(sample_iocs, capsys, fake_exec):
+    assert cmds.exec("dbl", all=True, parallel=4) == 0
+    assert fake_exec == [("dbl", {"ioc1": 1234, "ioc3": 3456}, 4, manage_iocs.console.EXEC_TIMEOUT)]
+    out = capsys.readouterr().out
+    assert "==> ioc3 <==\ndbl on ioc3" in out
+    assert "Exec: 2 succeeded, 0 failed." in out
+
+
+def test_exec_json(sample_iocs, capsys, fake_exec):
+    assert cmds.exec("dbl", "ioc4", "ioc3", format="json") == 1
+    assert json.loads(capsys.readouterr().out) == [
+        {"ioc": "ioc4", "succeeded": False, "output": "", "error": "IOC is not running"},
+        {"ioc": "ioc3", "succeeded": True, "output": "dbl on ioc3", "error": ""},
+    ]
+
+
+@pytest.mark.parametrize(
+    "iocs, options, message",
+    [
+        ((), {}, "Specify either IOC names or --all"),
+        (("ioc3",), {"all": True}, "Specify either IOC names or --all"),
+        (("ioc2",), {}, "No IOC with name 'ioc2' is installed!"),
+        (("ioc3",), {"format": "csv"}, "Unknown output format: csv"),
+    ],
+)
+def test_exec_errors(sample_iocs, fake_exec, iocs, options, message):
+    with pytest.raises(RuntimeError, match=message):
+        cmds.exec("dbl", *iocs, **options)
+
+
+@pytest.fixture
+def fake_probes(monkeypatch):
+    calls = []
+
+    async def probe_iocs(ports, check_console, timeout):
+        calls.append((ports, check_console, timeout))
+        return [
+            manage_iocs.console.HealthResult(ioc, 0.001, 0.002, check_console or None)
+            if ioc == "ioc1"
+            else manage_iocs.console.HealthResult(ioc, 0.001, error="timed out after 5s")
+            for ioc in ports
+        ]
+
+    monkeypatch.setattr(manage_iocs.console, "probe_iocs", probe_iocs)
+    return calls
+
+
+def test_health(sample_iocs, capsys, fake_probes):
+    assert cmds.health(check_console=True) == 1
+    assert fake_probes == [({"ioc1": 1234, "ioc3": 3456}, True, manage_iocs.utils.HEALTH_TIMEOUT)]
+    lines = capsys.readouterr().out.splitlines()
+    assert "1.0 ms" in lines[2]
+    assert "Responds" in lines[2]
+    assert "FAILED" in lines[3]
+    assert "timed out after 5s" in lines[3]
+    assert lines[4].split()[-1] == "-"  # ioc4 is stopped, so it is not probed
+    assert lines[-1] == "Health: 1 healthy, 1 unhealthy."
+
+
+def test_health_json(sample_iocs, capsys, fake_probes):
+    assert cmds.health(format="json") == 1
+    records = {record["ioc"]: record for record in json.loads(capsys.readouterr().out)}
+    assert records["ioc1"]["healthy"] is True
+    assert records["ioc1"]["first_byte_time"] == 0.002
+    assert records["ioc1"]["responds"] is None
+    assert records["ioc3"]["error"] == "timed out after 5s"
+    assert records["ioc4"]["healthy"] is None
+
+
+def test_status_watch_redraws_changed_rows(sample_iocs, capsys, monkeypatch):
+    backend = manage_iocs.systemd.get_backend()
+    ticks = []
+
+    def sleep(seconds):
+        ticks.append(seconds)
+        if len(ticks) == 1:
+            backend.ioc_states["ioc4"].state = "active"
+        else:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(manage_iocs.output.time, "sleep", sleep)
+    scans = []
+    find_iocs = manage_iocs.utils.find_iocs
+    monkeypatch.setattr(manage_iocs.utils, "find_iocs", lambda: scans.append(1) or find_iocs())
+
+    assert cmds.status(watch=True, interval=0.5) == 0
+    assert ticks == [0.5, 0.5]
+    assert len(scans) == 1
+    first, second = capsys.readouterr().out.split("Every 0.5s")[:2]
+    assert strip_ansi_codes(first).count("\n") == 5
+    # Only the row for ioc4 (the fifth line on screen) is redrawn on the second refresh
+    redrawn = second.split("\n", 1)[0]
+    assert "\033[5;1H\033[2Kioc4" in redrawn
+    assert "ioc1" not in redrawn and "ioc5" not in redrawn
+
+
+def test_status_watch_requires_table(sample_iocs):
+    with pytest.raises(RuntimeError, match="'--watch' can only be used with table output"):
+        cmds.status(watch=True, format="json")
@@ -0,0 +1,238 @@
+import asyncio
+import io
+import os
+
+import pytest
+
+from manage_iocs.console import (
+    DO,
+    DONT,
+    IAC,
+    SB,
+    SE,
+    WILL,
+    WONT,
+    TelnetParser,
+    exec_on_iocs,
+    filter_keys,
+    probe_iocs,
+    run_command,
+    run_console,
+)
+
+
+def test_telnet_parser_strips_negotiation():
+    parser = TelnetParser()
+    data = bytes([IAC, DO, 24, IAC, WILL, 1, IAC, WILL, 31]) + b"epics> "
+    assert parser.feed(data) == (
+        b"epics> ",
+        bytes([IAC, WONT, 24, IAC, DO, 1, IAC, DONT, 31]),
+    )
+
+
+def test_telnet_parser_split_commands():
+    parser = TelnetParser()
+    assert parser.feed(b"a" + bytes([IAC])) == (b"a", b"")
+    assert parser.feed(bytes([DO])) == (b"", b"")
+    assert parser.feed(bytes([3, IAC, IAC]) + b"b") == (bytes([IAC]) + b"b", bytes([IAC, WONT, 3]))
+
+
+def test_telnet_parser_subnegotiation():
+    parser = TelnetParser()
+    data = b"x" + bytes([IAC, SB, 24, 1, IAC, IAC, IAC, SE]) + b"y"
+    assert parser.feed(data) == (b"xy", b"")
+
+
+@pytest.mark.parametrize(
+    "keys, expected",
+    [
+        (b"dbl\r", (b"dbl\r", False)),
+        (b"\x03\x04ls\r", (b"ls\r", False)),
+        (b"ab\x1dcd", (b"ab", True)),
+        (bytes([IAC]), (bytes([IAC, IAC]), False)),
+    ],
+)
+def test_filter_keys(keys, expected):
+    assert filter_keys(keys) == expected
+
+
+def run_against_fake_procserv(keys: bytes, greeting: bytes) -> tuple[bytes, bytes]:
+    received = bytearray()
+
+    async def main():
+        async def handle(reader, writer):
+            writer.write(greeting)
+            while data := await reader.read(1024):
+                received.extend(data)
+                if b"\r" in data:
+                    writer.write(b"ok\r\n")
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        read_fd, write_fd = os.pipe()
+
+        class TypeAfterGreeting(io.BytesIO):
+            def write(self, data):
+                if not self.getvalue():
+                    os.write(write_fd, keys)
+                return super().write(data)
+
+        out = TypeAfterGreeting()
+        try:
+            async with server:
+                await asyncio.wait_for(run_console("127.0.0.1", port, read_fd, out), 5)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+        return out.getvalue()
+
+    output = asyncio.run(main())
+    return output, bytes(received)
+
+
+def test_run_console_detaches():
+    output, received = run_against_fake_procserv(
+        b"dbl\r\x03\x1d", bytes([IAC, WILL, 1]) + b"epics> "
+    )
+    assert output.startswith(b"epics> ")
+    assert received == bytes([IAC, DO, 1]) + b"dbl\r"
+
+
+def test_run_console_connection_refused():
+    async def main():
+        server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        await run_console("127.0.0.1", port, 0, io.BytesIO())
+
+    with pytest.raises(RuntimeError, match="Could not connect to procServ"):
+        asyncio.run(main())
+
+
+@pytest.fixture
+def fake_iocsh():
+    """Start procServ-like servers running a fake IOC shell, returning their ports."""
+
+    async def start(count: int = 1, delay: float = 0.0, state=None):
+        async def handle(reader, writer):
+            writer.write(bytes([IAC, WILL, 1]) + b"@@@ Welcome to procServ\r\n")
+            try:
+                while line := await reader.readline():
+                    command = line.replace(bytes([IAC, DO, 1]), b"").strip(b"\r\n")
+                    if command:
+                        if state is not None:
+                            state["running"] += 1
+                            state["max_running"] = max(state["max_running"], state["running"])
+                        await asyncio.sleep(delay)
+                        writer.write(command + b"\r\n")
+                        writer.write(b"result of " + command + b"\r\n")
+                        if state is not None:
+                            state["running"] -= 1
+                    writer.write(b"epics> ")
+            finally:
+                writer.close()
+
+        servers = [await asyncio.start_server(handle, "127.0.0.1", 0) for _ in range(count)]
+        return servers, [server.sockets[0].getsockname()[1] for server in servers]
+
+    return start
+
+
+def test_run_command(fake_iocsh):
+    async def main():
+        servers, ports = await fake_iocsh()
+        async with servers[0]:
+            return await run_command("127.0.0.1", ports[0], "dbl")
+
+    assert asyncio.run(main()) == "result of dbl"
+
+
+def test_exec_on_iocs_limits_concurrency(fake_iocsh):
+    state = {"running": 0, "max_running": 0}
+
+    async def main():
+        servers, ports = await fake_iocsh(count=5, delay=0.05, state=state)
+        try:
+            return await exec_on_iocs(
+                "dbl",
+                {f"ioc{i}": port for i, port in enumerate(ports)},
+                host="127.0.0.1",
+                concurrency=2,
+            )
+        finally:
+            for server in servers:
+                server.close()
+
+    results = asyncio.run(main())
+    assert [result.ioc for result in results] == [f"ioc{i}" for i in range(5)]
+    assert all(result.output == "result of dbl" for result in results)
+    assert state["max_running"] == 2
+
+
+def test_exec_on_iocs_failures(fake_iocsh):
+    async def main():
+        servers, ports = await fake_iocsh(delay=1.0)
+        refused = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        refused_port = refused.sockets[0].getsockname()[1]
+        refused.close()
+        await refused.wait_closed()
+        try:
+            return await exec_on_iocs(
+                "dbl",
+                {"slow": ports[0], "down": refused_port},
+                host="127.0.0.1",
+                timeout=0.2,
+            )
+        finally:
+            servers[0].close()
+
+    slow, down = asyncio.run(main())
+    assert slow.error == "timed out after 0.2s"
+    assert not down.succeeded
+
+
+def test_probe_iocs(fake_iocsh):
+    async def hang(reader, writer):
+        # Accept the connection, but never send anything
+        await reader.read()
+        writer.close()
+
+    async def main():
+        servers, ports = await fake_iocsh(count=2)
+        silent = await asyncio.start_server(hang, "127.0.0.1", 0)
+        refused = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        refused_port = refused.sockets[0].getsockname()[1]
+        refused.close()
+        await refused.wait_closed()
+        try:
+            return await probe_iocs(
+                {
+                    "ioc0": ports[0],
+                    "ioc1": ports[1],
+                    "hung": silent.sockets[0].getsockname()[1],
+                    "down": refused_port,
+                },
+                host="127.0.0.1",
+                check_console=True,
+                timeout=0.3,
+            )
+        finally:
+            for server in [*servers, silent]:
+                server.close()
+            await asyncio.sleep(0.05)  # Let the servers see the probes hang up
+
+    ioc0, ioc1, hung, down = asyncio.run(main())
+    for result in (ioc0, ioc1):
+        assert result.healthy
+        assert result.responds
+        assert result.connect_time is not None
+        assert result.first_byte_time is not None
+        assert result.first_byte_time >= result.connect_time
+    assert not hung.healthy
+    assert hung.connect_time is not None
+    assert hung.first_byte_time is None
+    assert hung.error == "timed out after 0.3s"
+    assert not down.healthy
+    assert down.connect_time is None
@@ -0,0 +1,113 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import manage_iocs.console
+import manage_iocs.utils
+from manage_iocs.exporter import ExporterServer, MetricsCollector, metric_family
+from manage_iocs.logs import MarkerCounter
+
+
+@pytest.fixture
+def fake_probes(monkeypatch):
+    async def probe_iocs(ports, timeout):
+        return [
+            manage_iocs.console.HealthResult(ioc, connect_time=0.001 if ioc == "ioc1" else None)
+            for ioc in ports
+        ]
+
+    monkeypatch.setattr(manage_iocs.console, "probe_iocs", probe_iocs)
+
+
+def test_marker_counter(tmp_path):
+    log_file = tmp_path / "ioc1.log"
+    counter = MarkerCounter(log_file, b"@@@ Restart")
+    assert counter.update() == 0
+
+    log_file.write_bytes(b"@@@ Restart\nfoo\n@@@ Res")
+    assert counter.update(block_size=4) == 1
+    with open(log_file, "ab") as f:
+        f.write(b"tart\nbar\n")
+    assert counter.update() == 2
+
+    # Rotated: counting starts over with the new file
+    log_file.unlink()
+    log_file.write_bytes(b"@@@ Restart\n")
+    assert counter.update() == 1
+
+
+def test_metric_family():
+    assert metric_family("up", "gauge", "Is it up.", [({"ioc": 'a"b'}, True), ({}, 0.5)]) == [
+        "# HELP up Is it up.",
+        "# TYPE up gauge",
+        'up{ioc="a\\"b"} 1',
+        "up 0.5",
+    ]
+
+
+def test_collector_refresh(sample_iocs, fake_probes):
+    (manage_iocs.utils.MANAGE_IOCS_LOG_PATH / "ioc3.log").write_text(
+        '@@@ Restarting child "ioc3"\nioc3> \n@@@ Restarting child "ioc3"\n'
+    )
+    collector = MetricsCollector()
+    assert collector.text == ""
+    collector.refresh()
+
+    lines = collector.text.splitlines()
+    assert "manage_iocs_installed_iocs 4" in lines
+    assert 'manage_iocs_ioc_active{ioc="ioc1"} 1' in lines
+    assert 'manage_iocs_ioc_active{ioc="ioc4"} 0' in lines
+    assert 'manage_iocs_ioc_enabled{ioc="ioc5"} 1' in lines
+    assert 'manage_iocs_procserv_up{ioc="ioc1",port="1234"} 1' in lines
+    assert 'manage_iocs_procserv_up{ioc="ioc3",port="3456"} 0' in lines
+    assert 'manage_iocs_ioc_restarts_total{ioc="ioc3"} 2' in lines
+    assert 'manage_iocs_ioc_restarts_total{ioc="ioc1"} 0' in lines
+    stages = [line.split('"')[1] for line in lines if line.startswith("manage_iocs_refresh_dur")]
+    assert stages == ["scan", "systemd", "probe", "logs"]
+
+
+def test_scrapes_are_served_from_memory(sample_iocs, fake_probes, monkeypatch):
+    collector = MetricsCollector()
+    collector.refresh()
+    scans = []
+    find_iocs = manage_iocs.utils.find_iocs
+    monkeypatch.setattr(manage_iocs.utils, "find_iocs", lambda: scans.append(1) or find_iocs())
+
+    with ExporterServer(("127.0.0.1", 0), collector, interval=60.0) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            for _ in range(3):
+                with urllib.request.urlopen(f"{url}/metrics") as response:
+                    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                    assert response.read().decode() == collector.text
+            with pytest.raises(urllib.error.HTTPError, match="404"):
+                urllib.request.urlopen(f"{url}/other")
+        finally:
+            server.shutdown()
+            thread.join()
+    assert scans == []
+
+
+def test_collector_leaves_out_timed_out_iocs(sample_iocs, fake_probes, monkeypatch):
+    show = manage_iocs.utils.systemctl_show
+
+    def systemctl_show(iocs):
+        states = show(iocs)
+        states["ioc4"] = manage_iocs.utils.UnitState("ioc4", timed_out=True)
+        return states
+
+    monkeypatch.setattr(manage_iocs.utils, "systemctl_show", systemctl_show)
+    collector = MetricsCollector()
+    collector.refresh()
+
+    lines = collector.text.splitlines()
+    assert 'manage_iocs_ioc_state_unknown{ioc="ioc4"} 1' in lines
+    assert 'manage_iocs_ioc_state_unknown{ioc="ioc1"} 0' in lines
+    assert not any(
+        '{ioc="ioc4"' in line for line in lines if "_active" in line or "_enabled" in line
+    )
+    assert 'manage_iocs_ioc_active{ioc="ioc5"} 0' in lines
@@ -0,0 +1,156 @@
+import io
+import threading
+import time
+
+import pytest
+
+from manage_iocs.logs import (
+    FollowedLog,
+    copy_from,
+    find_last_marker,
+    follow_logs,
+    restart_marker,
+)
+
+MARKER = restart_marker("ioc3")
+
+
+def make_log(tmp_path, content: bytes):
+    log_file = tmp_path / "ioc3.log"
+    log_file.write_bytes(content)
+    return log_file
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 16, 64 * 1024])
+def test_find_last_marker(tmp_path, block_size):
+    content = b"Line 1\n" + MARKER + b"\nLine 2\n" + MARKER + b"\r\nLine 3\nLine 4\n"
+    log_file = make_log(tmp_path, content)
+    with open(log_file, "rb") as f:
+        offset = find_last_marker(f, MARKER, block_size)
+    assert offset == content.rindex(MARKER)
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 64 * 1024])
+def test_find_last_marker_missing(tmp_path, block_size):
+    log_file = make_log(tmp_path, b'Line A\nLine B\n@@@ Restarting child "ioc33"\n')
+    with open(log_file, "rb") as f:
+        assert find_last_marker(f, MARKER, block_size) == 0
+
+
+def test_find_last_marker_first_and_last_line(tmp_path):
+    with open(make_log(tmp_path, MARKER + b"\nLine 1\n"), "rb") as f:
+        assert find_last_marker(f, MARKER, 4) == 0
+    with open(make_log(tmp_path, b"Line 1\n" + MARKER), "rb") as f:
+        assert find_last_marker(f, MARKER, 4) == len(b"Line 1\n")
+
+
+def test_find_last_marker_reads_only_the_tail(tmp_path):
+    tail = MARKER + b"\nLine 4\n"
+    log_file = make_log(tmp_path, b"x" * 1_000_000 + b"\n" + tail)
+
+    class CountingReader(io.FileIO):
+        bytes_read = 0
+
+        def read(self, size=-1):
+            data = super().read(size)
+            CountingReader.bytes_read += len(data)
+            return data
+
+    with CountingReader(log_file, "r") as f:
+        assert find_last_marker(f, MARKER, 1024) == 1_000_001
+    assert CountingReader.bytes_read <= 2048
+
+
+def test_copy_from(tmp_path):
+    log_file = make_log(tmp_path, "Line 1\nLïne 2\nLine 3\n".encode())
+    out = io.StringIO()
+    with open(log_file, "rb") as f:
+        assert copy_from(f, 7, out, block_size=2) == len("Lïne 2\nLine 3\n".encode())
+    assert out.getvalue() == "Lïne 2\nLine 3\n"
+
+
+@pytest.fixture
+def follow(tmp_path):
+    threads = []
+
+    def _follow(logs):
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=follow_logs, args=(logs,), kwargs={"stop": stop, "poll_interval": 0.05}
+        )
+        thread.start()
+        threads.append((stop, thread))
+
+    yield _follow
+    for stop, thread in threads:
+        stop.set()
+        thread.join()
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting for log output"
+        time.sleep(0.01)
+
+
+def append(path, text):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def test_follow_new_output(tmp_path, follow):
+    log_file = make_log(tmp_path, b"old line\n")
+    out = io.StringIO()
+    log = FollowedLog(log_file, out)
+    log.open()
+    follow([log])
+
+    append(log_file, "new line\n")
+    wait_for(lambda: out.getvalue() == "new line\n")
+
+
+def test_follow_truncation(tmp_path, follow):
+    log_file = make_log(tmp_path, b"old line\n")
+    out = io.StringIO()
+    log = FollowedLog(log_file, out)
+    log.open()
+    follow([log])
+
+    log_file.write_text("after\n")
+    wait_for(lambda: out.getvalue() == "after\n")
+
+
+def test_follow_rotation(tmp_path, follow):
+    log_file = make_log(tmp_path, b"")
+    out = io.StringIO()
+    log = FollowedLog(log_file, out)
+    log.open()
+    follow([log])
+
+    append(log_file, "before rotation\n")
+    wait_for(lambda: out.getvalue() == "before rotation\n")
+    log_file.rename(tmp_path / "ioc3.log.1")
+    append(tmp_path / "ioc3.log.1", "late write\n")
+    log_file.write_text("after rotation\n")
+    wait_for(lambda: "after rotation\n" in out.getvalue())
+    assert out.getvalue().startswith("before rotation\n")
+
+
+def test_follow_several_logs(tmp_path, follow):
+    out = io.StringIO()
+    logs = [
+        FollowedLog(tmp_path / "ioc1.log", out, prefix="ioc1: "),
+        FollowedLog(tmp_path / "ioc2.log", out, prefix="ioc2: "),
+    ]
+    for log in logs:
+        log.open()
+    follow(logs)
+
+    append(tmp_path / "ioc1.log", "one\npart")
+    wait_for(lambda: out.getvalue() == "ioc1: one\n")
+    append(tmp_path / "ioc2.log", "two\n")
+    append(tmp_path / "ioc1.log", "ial\n")
+    wait_for(
+        lambda: sorted(out.getvalue().splitlines()) == ["ioc1: one", "ioc1: partial", "ioc2: two"]
+    )
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+from manage_iocs.ports import PortIndex, listening_ports
+from manage_iocs.utils import IOC
+
+
+def make_iocs(ports: dict[str, int]) -> list[IOC]:
+    return [
+        IOC(name, "softioc", port, Path("/"), "localhost", "st.cmd", ".")
+        for name, port in ports.items()
+    ]
+
+
+def test_port_index_lookups():
+    index = PortIndex(make_iocs({"b": 4001, "a": 4001, "c": 4005}))
+    assert len(index) == 3
+    assert 4001 in index
+    assert 4002 not in index
+    assert index.owners(4001) == ["a", "b"]
+    assert index.owners(4005) == ["c"]
+    assert index.owners(3999) == []
+    assert index.duplicates() == {4001: ["a", "b"]}
+
+
+def test_port_index_first_free():
+    index = PortIndex(make_iocs({"a": 4000, "b": 4001, "c": 4001, "d": 4003, "e": 9000}))
+    assert index.first_free(4000, 4999) == 4002
+    assert index.first_free(4000, 4999, exclude={4002}) == 4004
+    assert index.first_free(3000, 4999) == 3000
+    assert index.first_free(4000, 4001) is None
+    assert PortIndex([]).first_free(4000, 4999) == 4000
+
+
+def test_listening_ports(tmp_path):
+    tcp = tmp_path / "tcp"
+    tcp.write_text(
+        "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid\n"
+        "   0: 0100007F:0FA0 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0\n"
+        "   1: 0100007F:0FA1 0100007F:D431 01 00000000:00000000 00:00000000 00000000     0\n"
+    )
+    tcp6 = tmp_path / "tcp6"
+    tcp6.write_text(
+        "  sl  local_address                         remote_address                        st\n"
+        "   0: 00000000000000000000000000000000:1F90 00000000000000000000000000000000:0000 0A\n"
+    )
+    assert listening_ports([tcp, tcp6, tmp_path / "missing"]) == {4000, 8080}
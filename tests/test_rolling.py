@@ -0,0 +1,157 @@
+import socket
+import time
+
+import pytest
+
+import manage_iocs.commands as cmds
+import manage_iocs.rolling
+import manage_iocs.systemd
+import manage_iocs.utils
+from manage_iocs.rolling import ReadinessProbe, port_accepts, rolling_restart
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(manage_iocs.utils, "JOB_POLL_INTERVAL", 0.01)
+
+
+@pytest.fixture
+def listener():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        sock.listen()
+        yield sock.getsockname()[1]
+
+
+@pytest.fixture
+def restarts_log_prompt(sample_iocs, monkeypatch):
+    """Make every restart of the dummy backend write an IOC prompt to the IOC's log."""
+    backend = manage_iocs.systemd.get_backend()
+    enqueue = backend.enqueue
+    waves = []
+
+    def enqueue_and_log(action: str, units: list[str]) -> tuple[str, str, int]:
+        waves.append(units)
+        for unit in units:
+            ioc = unit.removeprefix("softioc-").removesuffix(".service")
+            with open(manage_iocs.utils.MANAGE_IOCS_LOG_PATH / f"{ioc}.log", "a") as f:
+                f.write(f'@@@ Restarting child "{ioc}"\niocInit\n{ioc}> ')
+        return enqueue(action, units)
+
+    monkeypatch.setattr(backend, "enqueue", enqueue_and_log)
+    monkeypatch.setattr(manage_iocs.rolling, "port_accepts", lambda port: True)
+    return waves
+
+
+def test_port_accepts(listener):
+    assert port_accepts(listener)
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        assert not port_accepts(sock.getsockname()[1])
+
+
+def test_readiness_probe_only_counts_new_output(sample_iocs, listener, tmp_path):
+    ioc = manage_iocs.utils.find_ioc("ioc3")
+    assert ioc is not None
+    ioc.procserv_port = listener
+    log_file = tmp_path / "ioc3.log"
+    log_file.write_text("ioc3> \n")
+
+    probe = ReadinessProbe(ioc, log_file)
+    assert probe.check() is None
+    with open(log_file, "a") as f:
+        f.write("Starting iocInit\nio")
+    assert probe.check() is None
+    with open(log_file, "a") as f:
+        f.write("c3> ")
+    ready_after = probe.check()
+    assert ready_after is not None
+    assert probe.check() == ready_after
+
+
+def test_readiness_probe_without_log(sample_iocs, listener, tmp_path):
+    ioc = manage_iocs.utils.find_ioc("ioc3")
+    assert ioc is not None
+    ioc.procserv_port = listener
+    assert ReadinessProbe(ioc, tmp_path / "missing.log").check() is not None
+
+
+def test_rolling_restart_in_waves(restarts_log_prompt, fast_polling):
+    all_iocs = manage_iocs.utils.find_iocs()
+    iocs = [all_iocs[name] for name in ("ioc1", "ioc3", "ioc4")]
+    results, downtimes = rolling_restart(iocs, batch=2)
+
+    assert restarts_log_prompt == [
+        ["softioc-ioc1.service", "softioc-ioc3.service"],
+        ["softioc-ioc4.service"],
+    ]
+    assert all(result.succeeded for result in results.values())
+    assert list(downtimes) == ["ioc1", "ioc3", "ioc4"]
+
+
+def test_rolling_restart_stops_after_failure(restarts_log_prompt, fast_polling, monkeypatch):
+    monkeypatch.setattr(manage_iocs.rolling, "port_accepts", lambda port: port != 3456)
+    all_iocs = manage_iocs.utils.find_iocs()
+    iocs = [all_iocs[name] for name in ("ioc1", "ioc3", "ioc4")]
+    results, _ = rolling_restart(iocs, timeout=0.1)
+
+    assert restarts_log_prompt == [["softioc-ioc1.service"], ["softioc-ioc3.service"]]
+    assert results["ioc1"].succeeded
+    assert results["ioc3"].detail == "not ready after 0.1s"
+    assert results["ioc4"].detail == "skipped after an earlier failure"
+
+
+def test_restartall_restarts_running_iocs(restarts_log_prompt, fast_polling, capsys):
+    assert cmds.restartall(max_unavailable=2) == 0
+
+    # Only ioc1 and ioc3 are running; with batches of one, both may be down at once
+    assert restarts_log_prompt == [["softioc-ioc1.service"], ["softioc-ioc3.service"]]
+    out = capsys.readouterr().out
+    assert "Restart: 2 succeeded, 0 failed" in out
+    assert out.splitlines()[-1].startswith("Slowest: ")
+
+
+def test_rolling_restart_fails_refused_restart_at_once(
+    restarts_log_prompt, fast_polling, monkeypatch
+):
+    backend = manage_iocs.systemd.get_backend()
+    enqueue = backend.enqueue
+
+    def refuse_ioc3(action: str, units: list[str]) -> tuple[str, str, int]:
+        _, stderr, rc = enqueue(action, units)
+        if "softioc-ioc3.service" in units:
+            return "", "Failed to restart softioc-ioc3.service: Access denied", 1
+        return "", stderr, rc
+
+    monkeypatch.setattr(backend, "enqueue", refuse_ioc3)
+    all_iocs = manage_iocs.utils.find_iocs()
+    iocs = [all_iocs[name] for name in ("ioc1", "ioc3", "ioc4")]
+    results, downtimes = rolling_restart(iocs, batch=2, timeout=30)
+
+    assert results["ioc1"].succeeded
+    assert results["ioc3"].detail == "Failed to restart softioc-ioc3.service: Access denied"
+    assert results["ioc4"].detail == "skipped after an earlier failure"
+    assert list(downtimes) == ["ioc1"]
+
+
+def test_rolling_restart_keeps_probing_while_waiting_on_jobs(
+    restarts_log_prompt, fast_polling, monkeypatch
+):
+    # The restart job of ioc1 finishes quickly, the one of ioc3 never does
+    backend = manage_iocs.systemd.get_backend()
+    started = time.monotonic()
+
+    def pending_jobs() -> set[str]:
+        pending = {"softioc-ioc3.service"}
+        if time.monotonic() - started < 0.1:
+            pending.add("softioc-ioc1.service")
+        return pending
+
+    monkeypatch.setattr(backend, "pending_jobs", pending_jobs)
+    all_iocs = manage_iocs.utils.find_iocs()
+    iocs = [all_iocs[name] for name in ("ioc1", "ioc3")]
+    results, downtimes = rolling_restart(iocs, max_unavailable=2, timeout=1)
+
+    assert results["ioc1"].succeeded
+    assert downtimes["ioc1"] < 0.5
+    assert results["ioc3"].detail == "not ready after 1s"
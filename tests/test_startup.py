@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import manage_iocs
+
+# How much slower than a bare interpreter trivial commands may start, in seconds
+STARTUP_BUDGET = 0.25
+
+# Modules that trivial commands should never need to load
+HEAVY_MODULES = [
+    "asyncio",
+    "socket",
+    "subprocess",
+    "manage_iocs.agent",
+    "manage_iocs.cache",
+    "manage_iocs.console",
+    "manage_iocs.logs",
+    "manage_iocs.output",
+    "manage_iocs.systemd",
+]
+
+LOADED_MODULES_SCRIPT = """
+import contextlib, io, json, sys
+sys.argv = ["manage-iocs", sys.argv[1]]
+from manage_iocs.__main__ import main
+with contextlib.redirect_stdout(io.StringIO()):
+    main()
+loaded = [name for name, module in sys.modules.items() if type(module).__name__ != "_LazyModule"]
+print(json.dumps(loaded))
+"""
+
+TABLE_MODULES_SCRIPT = """
+import json, sys
+from manage_iocs import output
+output.render_table(["IOC"], [["ioc1"]])
+loaded = [name for name, module in sys.modules.items() if type(module).__name__ != "_LazyModule"]
+print(json.dumps(loaded))
+"""
+
+
+@pytest.fixture
+def run_python():
+    env = dict(os.environ, PYTHONPATH=str(Path(manage_iocs.__file__).parents[1]))
+
+    def _run(*args: str) -> str:
+        return subprocess.run(
+            [sys.executable, *args], env=env, check=True, capture_output=True, text=True
+        ).stdout
+
+    return _run
+
+
+def best_time(run, *args: str) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        run(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@pytest.mark.parametrize("command", ["version", "help"])
+def test_trivial_commands_load_no_heavy_modules(run_python, command):
+    loaded = json.loads(run_python("-c", LOADED_MODULES_SCRIPT, command))
+    assert [module for module in HEAVY_MODULES if module in loaded] == []
+
+
+def test_tables_load_no_console_support(run_python):
+    loaded = json.loads(run_python("-c", TABLE_MODULES_SCRIPT))
+    assert "manage_iocs.output" in loaded
+    console_support = ["manage_iocs.cgroups", "manage_iocs.console", "termios", "tty"]
+    assert [module for module in console_support if module in loaded] == []
+
+
+@pytest.mark.parametrize("command", ["version", "help"])
+def test_startup_budget(run_python, command):
+    baseline = best_time(run_python, "-c", "pass")
+    elapsed = best_time(run_python, "-m", "manage_iocs", command)
+    assert elapsed - baseline < STARTUP_BUDGET
@@ -0,0 +1,389 @@
+import shutil
+import threading
+import time
+from functools import partial
+from subprocess import DEVNULL, PIPE, Popen
+
+import pytest
+
+import manage_iocs.systemd
+import manage_iocs.utils
+from manage_iocs.systemd import (
+    DBusBackend,
+    SubprocessBackend,
+    get_backend,
+    open_backend,
+    parse_show_output,
+)
+
+jeepney = pytest.importorskip("jeepney")
+
+from jeepney import DBusAddress, HeaderFields, MessageType  # noqa: E402
+from jeepney.io.blocking import open_dbus_connection  # noqa: E402
+from jeepney.wrappers import new_error, new_method_return, new_signal  # noqa: E402
+
+
+def escape_unit_path(unit: str) -> str:
+    """Escape a unit name into an object path the way systemd does."""
+    return "/org/freedesktop/systemd1/unit/" + "".join(
+        c if c.isalnum() else f"_{ord(c):02x}" for c in unit
+    )
+
+
+class FakeSystemdService:
+    """Stand-in for the systemd manager, implementing just enough of its D-Bus API."""
+
+    def __init__(self, address: str, units: dict[str, dict[str, str]]):
+        self.units = units
+        self.calls: list[str] = []
+        self.failing_units: set[str] = set()
+        # Units whose properties are never replied to
+        self.hanging_units: set[str] = set()
+        self._next_job = 1
+        self._paths = {escape_unit_path(unit): unit for unit in units}
+        self._connection = open_dbus_connection(bus=address)
+        self._connection.bus_proxy.RequestName(manage_iocs.systemd.SYSTEMD_BUS_NAME)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._connection.close()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                msg = self._connection.receive(timeout=0.05)
+            except TimeoutError:
+                continue
+            if msg.header.message_type == MessageType.method_call:
+                reply = self._handle(msg)
+                if reply is not None:
+                    self._connection.send(reply)
+
+    def _unit_properties(self, unit: str) -> dict[str, tuple[str, object]]:
+        state = self.units.get(unit)
+        if state is None:
+            return {
+                "Id": ("s", unit),
+                "LoadState": ("s", "not-found"),
+                "ActiveState": ("s", "inactive"),
+                "SubState": ("s", "dead"),
+                "UnitFileState": ("s", ""),
+                "ActiveEnterTimestamp": ("t", 0),
+            }
+        return {
+            "Id": ("s", unit),
+            "LoadState": ("s", "loaded"),
+            "ActiveState": ("s", state["active"]),
+            "SubState": ("s", "running" if state["active"] == "active" else "dead"),
+            "UnitFileState": ("s", state["enabled"]),
+            "ActiveEnterTimestamp": ("t", 1_700_000_000_000_000),
+            "MainPID": ("u", 4242 if state["active"] == "active" else 0),
+        }
+
+    def _handle(self, msg):
+        member = msg.header.fields[HeaderFields.member]
+        path = msg.header.fields[HeaderFields.path]
+        self.calls.append(member)
+
+        if member in ("Subscribe", "Reload"):
+            return new_method_return(msg)
+        elif member == "LoadUnit":
+            (unit,) = msg.body
+            path = escape_unit_path(unit)
+            self._paths[path] = unit
+            return new_method_return(msg, "o", (path,))
+        elif member == "GetUnitFileState":
+            (unit,) = msg.body
+            if unit not in self.units:
+                return new_error(
+                    msg, "org.freedesktop.DBus.Error.FileNotFound", "s", ("No such file",)
+                )
+            return new_method_return(msg, "s", (self.units[unit]["enabled"],))
+        elif member in ("EnableUnitFiles", "DisableUnitFiles"):
+            for unit in msg.body[0]:
+                self.units[unit]["enabled"] = (
+                    "enabled" if member == "EnableUnitFiles" else "disabled"
+                )
+            if member == "EnableUnitFiles":
+                return new_method_return(msg, "ba(sss)", (False, []))
+            return new_method_return(msg, "a(sss)", ([],))
+        elif member in ("StartUnit", "StopUnit", "RestartUnit"):
+            unit, _ = msg.body
+            job = f"/org/freedesktop/systemd1/job/{self._next_job}"
+            self._next_job += 1
+            reply = new_method_return(msg, "o", (job,))
+            result = "done"
+            if unit in self.failing_units:
+                result = "failed"
+            else:
+                self.units[unit]["active"] = "inactive" if member == "StopUnit" else "active"
+            self._connection.send(reply)
+            return new_signal(
+                DBusAddress(
+                    manage_iocs.systemd.SYSTEMD_OBJECT_PATH,
+                    interface=manage_iocs.systemd.MANAGER_INTERFACE,
+                ),
+                "JobRemoved",
+                "uoss",
+                (self._next_job - 1, job, unit, result),
+            )
+        elif member == "ListJobs":
+            return new_method_return(msg, "a(usssoo)", ([],))
+        elif member == "GetAll":
+            (interface,) = msg.body
+            if self._paths[path] in self.hanging_units:
+                return None
+            properties = self._unit_properties(self._paths[path])
+            if interface == manage_iocs.systemd.SERVICE_INTERFACE:
+                properties = {"MainPID": properties.get("MainPID", ("u", 0))}
+            else:
+                properties.pop("MainPID", None)
+            return new_method_return(msg, "a{sv}", (properties,))
+        return new_error(msg, "org.freedesktop.DBus.Error.UnknownMethod")
+
+
+@pytest.fixture
+def private_bus(tmp_path):
+    if shutil.which("dbus-daemon") is None:
+        pytest.skip("dbus-daemon is not available")
+
+    proc = Popen(
+        [
+            "dbus-daemon",
+            "--session",
+            "--nofork",
+            "--print-address",
+            f"--address=unix:path={tmp_path / 'bus'}",
+        ],
+        stdout=PIPE,
+        stderr=DEVNULL,
+    )
+    assert proc.stdout is not None
+    address = proc.stdout.readline().decode().strip()
+    yield address
+    proc.terminate()
+    proc.wait()
+    proc.stdout.close()
+
+
+@pytest.fixture
+def fake_systemd(private_bus):
+    service = FakeSystemdService(
+        private_bus,
+        {
+            "softioc-ioc1.service": {"active": "active", "enabled": "enabled"},
+            "softioc-ioc4.service": {"active": "inactive", "enabled": "disabled"},
+        },
+    )
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def dbus_backend(private_bus, fake_systemd, monkeypatch):
+    backend = DBusBackend(bus=private_bus)
+    monkeypatch.setattr(manage_iocs.systemd, "_backend", backend)
+    yield backend
+    backend.close()
+
+
+def test_dbus_backend_subscribes(dbus_backend, fake_systemd):
+    assert fake_systemd.calls == ["Subscribe"]
+
+
+@pytest.mark.parametrize(
+    "action, unit, expected",
+    [
+        ("is-active", "softioc-ioc1.service", ("active", "", 0)),
+        ("is-active", "softioc-ioc4.service", ("inactive", "", 3)),
+        ("is-active", "softioc-ioc9.service", ("inactive", "", 3)),
+        ("is-enabled", "softioc-ioc1.service", ("enabled", "", 0)),
+        ("is-enabled", "softioc-ioc4.service", ("disabled", "", 1)),
+    ],
+)
+def test_dbus_backend_queries(dbus_backend, action, unit, expected):
+    assert dbus_backend.passthrough(action, unit) == expected
+
+
+def test_dbus_backend_unknown_unit_file(dbus_backend):
+    out, err, rc = dbus_backend.passthrough("is-enabled", "softioc-ioc9.service")
+    assert rc == 1
+    assert "No such file" in err
+
+
+@pytest.mark.parametrize(
+    "action, unit, key, expected",
+    [
+        ("start", "softioc-ioc4.service", "active", "active"),
+        ("stop", "softioc-ioc1.service", "active", "inactive"),
+        ("restart", "softioc-ioc4.service", "active", "active"),
+        ("enable", "softioc-ioc4.service", "enabled", "enabled"),
+        ("disable", "softioc-ioc1.service", "enabled", "disabled"),
+    ],
+)
+def test_dbus_backend_actions(dbus_backend, fake_systemd, action, unit, key, expected):
+    assert dbus_backend.passthrough(action, unit) == ("", "", 0)
+    assert fake_systemd.units[unit][key] == expected
+
+
+def test_dbus_backend_failed_job(dbus_backend, fake_systemd):
+    fake_systemd.failing_units.add("softioc-ioc4.service")
+    _, err, rc = dbus_backend.passthrough("start", "softioc-ioc4.service")
+    assert rc == 1
+    assert "failed" in err
+
+
+def test_dbus_backend_reload(dbus_backend, fake_systemd):
+    assert dbus_backend.passthrough("daemon-reload", "softioc-ioc4.service")[2] == 0
+    assert fake_systemd.calls[-1] == "Reload"
+
+
+def test_dbus_backend_show(dbus_backend):
+    results = dbus_backend.show(
+        ["softioc-ioc1.service", "softioc-ioc9.service"],
+        manage_iocs.utils.UNIT_PROPERTIES,
+    )
+    assert results[0]["Id"] == "softioc-ioc1.service"
+    assert results[0]["ActiveState"] == "active"
+    assert results[0]["MainPID"] == "4242"
+    assert results[0]["ActiveEnterTimestamp"] != ""
+    assert results[1]["LoadState"] == "not-found"
+    assert results[1]["ActiveEnterTimestamp"] == ""
+
+
+def test_dbus_backend_enqueue(dbus_backend, fake_systemd):
+    units = ["softioc-ioc1.service", "softioc-ioc4.service"]
+    assert dbus_backend.enqueue("stop", units) == ("", "", 0)
+    assert dbus_backend.enqueue("enable", units) == ("", "", 0)
+    assert dbus_backend.pending_jobs() == set()
+    assert fake_systemd.units["softioc-ioc1.service"] == {
+        "active": "inactive",
+        "enabled": "enabled",
+    }
+    assert fake_systemd.units["softioc-ioc4.service"] == {
+        "active": "inactive",
+        "enabled": "enabled",
+    }
+    assert fake_systemd.calls.count("Reload") == 1
+
+
+def test_utils_through_dbus_backend(dbus_backend):
+    assert manage_iocs.utils.get_ioc_status("ioc1") == ("Running", True)
+    assert manage_iocs.utils.systemctl_passthrough("stop", "ioc1") == ("", "", 0)
+    states = manage_iocs.utils.systemctl_show(["ioc1", "ioc4"])
+    assert states["ioc1"].status == "Stopped"
+    assert states["ioc4"].known
+    results = manage_iocs.utils.systemctl_bulk("start", ["ioc1", "ioc4"])
+    assert all(result.succeeded for result in results.values())
+
+
+def test_dbus_backend_hanging_show(dbus_backend, fake_systemd, monkeypatch):
+    fake_systemd.hanging_units.add("softioc-ioc4.service")
+    monkeypatch.setattr(manage_iocs.systemd, "CALL_TIMEOUT", 1.0)
+    connection = dbus_backend._connection
+    send_and_get_reply = connection.send_and_get_reply
+    in_flight = []
+    overlapping = []
+
+    def tracked_send_and_get_reply(*args, **kwargs):
+        in_flight.append(args)
+        overlapping.append(len(in_flight) > 1)
+        try:
+            return send_and_get_reply(*args, **kwargs)
+        finally:
+            in_flight.pop()
+
+    monkeypatch.setattr(connection, "send_and_get_reply", tracked_send_and_get_reply)
+    units = ["softioc-ioc1.service", "softioc-ioc4.service", "softioc-ioc9.service"]
+    calls = {
+        unit: partial(dbus_backend.show_async, [unit], ["Id", "ActiveState"]) for unit in units
+    }
+
+    start = time.monotonic()
+    results, timed_out = manage_iocs.systemd.run_calls(calls, 3, timeout=5.0, deadline=0.3)
+    # The hung call is abandoned at the deadline rather than waited for
+    assert time.monotonic() - start < 0.9
+    assert results == {
+        "softioc-ioc1.service": [{"Id": "softioc-ioc1.service", "ActiveState": "active"}]
+    }
+    assert sorted(timed_out) == ["softioc-ioc4.service", "softioc-ioc9.service"]
+
+    # The connection is still usable once the hung reply times out
+    assert dbus_backend.show(["softioc-ioc1.service"], ["ActiveState"]) == [
+        {"ActiveState": "active"}
+    ]
+    assert not any(overlapping)
+    # The call queued behind the hung one was never sent
+    assert fake_systemd.calls.count("GetAll") == 3
+
+
+def test_open_backend_falls_back_to_subprocess(monkeypatch, tmp_path):
+    monkeypatch.setenv("DBUS_SYSTEM_BUS_ADDRESS", f"unix:path={tmp_path / 'missing'}")
+    assert isinstance(open_backend("auto"), SubprocessBackend)
+    assert isinstance(open_backend("subprocess"), SubprocessBackend)
+    with pytest.raises(RuntimeError, match="Could not connect to systemd over D-Bus"):
+        open_backend("dbus")
+    with pytest.raises(RuntimeError, match="Unknown systemd backend: bogus"):
+        open_backend("bogus")
+
+
+def test_incomplete_backend_cannot_be_created():
+    class ShowOnlyBackend(manage_iocs.systemd.SystemdBackend):
+        def show(self, units, properties):
+            return []
+
+    with pytest.raises(TypeError, match="passthrough"):
+        ShowOnlyBackend()
+
+
+def test_get_backend_is_reused(monkeypatch):
+    monkeypatch.setattr(manage_iocs.systemd, "_backend", None)
+    monkeypatch.setattr(manage_iocs.systemd, "SYSTEMD_BACKEND", "subprocess")
+    assert get_backend() is get_backend()
+
+
+def test_parse_show_output():
+    assert parse_show_output("Id=a.service\nActiveState=active\n\nId=b.service\n") == [
+        {"Id": "a.service", "ActiveState": "active"},
+        {"Id": "b.service"},
+    ]
+    assert parse_show_output("") == []
+
+
+def test_run_calls_deadlines():
+    import asyncio
+
+    cancelled = []
+
+    async def reply(value, delay=0.0):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(value)
+            raise
+        return value
+
+    calls = {
+        "fast": lambda: reply("fast"),
+        "hung": lambda: reply("hung", 10),
+        "queued": lambda: reply("queued", 0.3),
+    }
+    results, timed_out = manage_iocs.systemd.run_calls(calls, 1, timeout=0.2, deadline=0.4)
+    assert results == {"fast": "fast"}
+    assert timed_out == {
+        "hung": "timed out after 0.2s",
+        "queued": "no reply within the 0.4s deadline",
+    }
+    # One call at a time: "queued" only starts once "hung" timed out, and misses the deadline
+    assert sorted(cancelled) == ["hung", "queued"]
+
+
+def test_subprocess_backend_kills_hung_systemctl(fake_systemctl):
+    fake_systemctl("exec sleep 10")
+    backend = SubprocessBackend()
+    out, err, rc = backend._systemctl("is-active", "softioc-ioc1.service", timeout=0.2)
+    assert (out, err, rc) == ("", "systemctl is-active timed out after 0.2s", 124)
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+import manage_iocs.__main__
+import manage_iocs.agent
+import manage_iocs.tracing
+import manage_iocs.utils
+from manage_iocs import tracing
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.start()
+    yield tracer
+    tracing.stop()
+
+
+@pytest.fixture
+def trace_flags(monkeypatch):
+    monkeypatch.setattr(manage_iocs.tracing, "TRACE_FILE", None)
+    monkeypatch.setattr(manage_iocs.tracing, "PRINT_TIMINGS", False)
+
+
+def test_span_without_tracer():
+    assert tracing.TRACER is None
+    with tracing.span("nothing", "test"):
+        pass
+
+
+def test_spans_count_filesystem_operations(tracer, tmp_path):
+    (tmp_path / "a").write_text("a")
+    with tracing.span("outer", "test", path=str(tmp_path)):
+        with tracing.span("inner", "test"):
+            (tmp_path / "a").read_text()
+        with os.scandir(tmp_path) as entries:
+            list(entries)
+
+    inner, outer = tracer.spans
+    assert (inner.name, outer.name) == ("inner", "outer")
+    assert inner.args == {"open": 1}
+    assert outer.args == {"path": str(tmp_path), "open": 1, "scandir": 1}
+    assert outer.duration_ns >= inner.duration_ns
+
+
+def test_spans_from_threads(tracer, tmp_path):
+    def work():
+        with tracing.span("work", "thread"):
+            (tmp_path / "b").write_text("b")
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    with tracing.span("main", "test"):
+        pass
+
+    events = tracer.trace_events()
+    assert [event["name"] for event in events] == ["work", "main"]
+    assert events[0]["tid"] != events[1]["tid"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    assert tracer.fs_operations == {"open": 1}
+    summary = tracer.summary().splitlines()
+    assert summary[0] == "Timings (time summed over threads):"
+    assert summary[-1] == "Filesystem operations: 1 open"
+
+
+@pytest.mark.parametrize(
+    "args", [["--trace", "out.json", "status"], ["status", "--trace=out.json"]]
+)
+def test_trace_global_option(trace_flags, args):
+    assert manage_iocs.__main__.apply_global_options(["manage_iocs", *args]) == [
+        "manage_iocs",
+        "status",
+    ]
+    assert manage_iocs.tracing.TRACE_FILE is not None
+    assert manage_iocs.tracing.TRACE_FILE.name == "out.json"
+
+
+def test_trace_requires_a_file(trace_flags):
+    with pytest.raises(RuntimeError, match="Option '--trace' requires a value!"):
+        manage_iocs.__main__.apply_global_options(["manage_iocs", "status", "--trace"])
+
+
+def test_main_writes_trace(sample_iocs, trace_flags, monkeypatch, capsys, tmp_path):
+    trace_file = tmp_path / "trace.json"
+    monkeypatch.setattr(manage_iocs.utils, "USE_AGENT", True)
+    monkeypatch.setattr(
+        manage_iocs.agent, "request", lambda args: pytest.fail("the agent should not be used")
+    )
+    monkeypatch.setattr(
+        sys, "argv", ["manage-iocs", "status", "--timings", "--trace", str(trace_file)]
+    )
+    assert manage_iocs.__main__.main() == 0
+    assert tracing.TRACER is None
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    categories = {event["cat"] for event in events}
+    assert {"command", "inventory", "scan", "config", "systemd"} <= categories
+    assert events[0]["name"] == "status"
+    err = capsys.readouterr().err
+    assert err.startswith("Timings (time summed over threads):\n  command ")
+    assert "Filesystem operations: " in err
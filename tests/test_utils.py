@@ -1,15 +1,23 @@
+import os
 import socket
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
+import manage_iocs.commands as cmds
 import manage_iocs.utils
 from manage_iocs.utils import (
+    Inventory,
     find_installed_iocs,
+    find_ioc,
     find_iocs,
     find_iocs_on_host,
     get_ioc_procserv_port,
     get_ioc_status,
+    inventory_snapshot,
+    parse_systemctl_show,
     read_config_file,
+    scan_search_path,
     systemctl_passthrough,
 )
 
@@ -48,6 +56,50 @@ def test_find_iocs_on_host(sample_iocs):
     assert "ioc4" in iocs
 
 
+@pytest.mark.parametrize(
+    "host, expected",
+    [
+        ("localhost", "xf31id-ioc1"),
+        ("xf31id-ioc1", "xf31id-ioc1"),
+        ("XF31ID-IOC1.nsls2.bnl.gov.", "xf31id-ioc1"),
+        ("xf31id-ioc2.nsls2.bnl.gov", "xf31id-ioc2"),
+        ("127.0.0.1", "xf31id-ioc1"),
+        ("10.0.0.5", "10.0.0.5"),
+        ("10.0.0.6", "10.0.0.6"),
+        ("FE80:0:0::1", "fe80::1"),
+    ],
+)
+def test_normalize_host(monkeypatch, host, expected):
+    monkeypatch.setattr(manage_iocs.utils, "this_host", lambda: "xf31id-ioc1")
+    assert manage_iocs.utils.normalize_host(host) == expected
+
+
+def test_on_host_only_builds_that_hosts_records(sample_iocs, monkeypatch):
+    built = []
+    ioc_from_config = manage_iocs.utils.ioc_from_config
+    monkeypatch.setattr(
+        manage_iocs.utils,
+        "ioc_from_config",
+        lambda name, path, config: built.append(name) or ioc_from_config(name, path, config),
+    )
+
+    inventory = Inventory()
+    assert list(inventory.on_host("remote_host")) == ["ioc5"]
+    assert built == ["ioc5"]
+    assert sorted(inventory.on_host(manage_iocs.utils.this_host())) == ["ioc2", "ioc3", "ioc4"]
+
+    # Once every IOC is loaded, hosts are looked up in the index instead
+    assert len(inventory.iocs) == 6
+    assert set(inventory.host_index) == {
+        manage_iocs.utils.this_host(),
+        "another_host",
+        "remote_host",
+        "random",
+    }
+    assert list(inventory.on_host("another_host")) == ["ioc1"]
+    assert inventory.on_host("nowhere") == {}
+
+
 def test_get_ioc_procserv_port(sample_iocs):
     port = get_ioc_procserv_port("ioc2")
     assert port == 2345
@@ -97,3 +149,204 @@ def test_get_ioc_status_unknown_response(sample_iocs, monkeypatch):
 def test_systemctl_passthrough(dummy_popen, action, ioc):
     out, _, _ = systemctl_passthrough(action, ioc)
     assert out == f"['systemctl', '{action}', 'softioc-{ioc}.service']"
+
+
+def test_find_ioc_point_lookup(sample_iocs, monkeypatch):
+    def no_listdir(path):
+        raise AssertionError("find_ioc should not list search paths")
+
+    monkeypatch.setattr(os, "listdir", no_listdir)
+
+    ioc = find_ioc("ioc3")
+    assert ioc is not None
+    assert ioc.procserv_port == 3456
+    assert ioc.chdir == "iocBoot"
+    assert find_ioc("ioc42") is None
+
+
+@pytest.mark.parametrize("name", ["", ".", "..", "../iocs/ioc1"])
+def test_find_ioc_rejects_paths(sample_iocs, name):
+    assert find_ioc(name) is None
+
+
+def test_find_ioc_search_path_precedence(sample_iocs, tmp_path, monkeypatch):
+    override = tmp_path / "override"
+    os.makedirs(override / "ioc3")
+    with open(override / "ioc3" / "config", "w") as f:
+        f.write("PORT=4321\n")
+    monkeypatch.setattr(manage_iocs.utils, "IOC_SEARCH_PATH", [tmp_path / "iocs", override])
+
+    assert find_iocs()["ioc3"].procserv_port == 4321
+    ioc = find_ioc("ioc3")
+    assert ioc is not None
+    assert ioc.procserv_port == 4321
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_find_iocs_later_search_paths_win(tmp_path, monkeypatch, use_cache):
+    search_paths = [tmp_path / f"path{i}" for i in range(3)]
+    for i, search_path in enumerate(search_paths):
+        for name in ("shared", f"only{i}"):
+            os.makedirs(search_path / name)
+            with open(search_path / name / "config", "w") as f:
+                f.write(f"PORT={4000 + i}\n")
+    monkeypatch.setattr(manage_iocs.utils, "IOC_SEARCH_PATH", search_paths)
+    monkeypatch.setattr(manage_iocs.utils, "USE_INVENTORY_CACHE", use_cache)
+    monkeypatch.setattr(manage_iocs.utils, "SCAN_WORKERS", 2)
+
+    iocs = find_iocs()
+    assert list(iocs) == ["only0", "shared", "only1", "only2"]
+    assert iocs["shared"].procserv_port == 4002
+    assert iocs["shared"].path == search_paths[2] / "shared"
+
+
+def test_scan_search_path_skips_non_iocs(tmp_path):
+    os.makedirs(tmp_path / "no_config")
+    os.makedirs(tmp_path / "ioc")
+    (tmp_path / "ioc" / "config").write_text("PORT=4000\n")
+    (tmp_path / "README").write_text("not an IOC\n")
+
+    with ThreadPoolExecutor(2) as executor:
+        assert scan_search_path(tmp_path, executor) == {"ioc": {"PORT": "4000"}}
+    assert scan_search_path(tmp_path / "missing") == {}
+
+
+def test_scan_search_path_skips_inaccessible_dirs(tmp_path, monkeypatch):
+    for name in ("ioc", "locked"):
+        os.makedirs(tmp_path / name)
+        (tmp_path / name / "config").write_text("PORT=4000\n")
+    read_config_file = manage_iocs.utils.read_config_file
+
+    def read_unless_locked(config_path):
+        if config_path.parent.name == "locked":
+            raise PermissionError(13, "Permission denied", str(config_path))
+        return read_config_file(config_path)
+
+    monkeypatch.setattr(manage_iocs.utils, "read_config_file", read_unless_locked)
+    assert scan_search_path(tmp_path) == {"ioc": {"PORT": "4000"}}
+
+
+def test_inventory_snapshot_is_shared(sample_iocs):
+    with inventory_snapshot() as outer:
+        with inventory_snapshot() as inner:
+            assert inner is outer
+    with inventory_snapshot() as other:
+        assert other is not outer
+
+
+def test_inventory_scans_once(sample_iocs, monkeypatch):
+    scans = []
+    real_find_iocs = manage_iocs.utils.find_iocs
+
+    def counting_find_iocs():
+        scans.append(1)
+        return real_find_iocs()
+
+    monkeypatch.setattr(manage_iocs.utils, "find_iocs", counting_find_iocs)
+
+    with inventory_snapshot() as inventory:
+        assert inventory.is_installed("ioc1")
+        assert not inventory.is_installed("ioc2")
+        assert inventory["ioc2"].procserv_port == 2345
+        assert scans == []
+
+        assert len(inventory.installed) == 4
+        assert len(inventory.iocs) == 6
+        assert inventory.is_installed("ioc3")
+        assert scans == [1]
+
+    with pytest.raises(RuntimeError, match="No IOC with name 'ioc42' found!"):
+        Inventory()["ioc42"]
+
+
+def test_startall_scans_once(sample_iocs, monkeypatch):
+    scans = []
+    real_find_iocs = manage_iocs.utils.find_iocs
+
+    def counting_find_iocs():
+        scans.append(1)
+        return real_find_iocs()
+
+    monkeypatch.setattr(manage_iocs.utils, "find_iocs", counting_find_iocs)
+
+    assert cmds.startall() == 0
+    assert scans == [1]
+
+
+SAMPLE_SYSTEMCTL_SHOW = """Id=softioc-ioc1.service
+LoadState=loaded
+ActiveState=active
+SubState=running
+UnitFileState=enabled
+MainPID=1234
+ActiveEnterTimestamp=Fri 2026-10-16 09:00:00 EDT
+InactiveEnterTimestamp=
+
+Id=softioc-ioc4.service
+LoadState=loaded
+ActiveState=inactive
+SubState=dead
+UnitFileState=disabled
+MainPID=0
+ActiveEnterTimestamp=
+InactiveEnterTimestamp=Fri 2026-10-16 10:00:00 EDT
+
+Id=softioc-ioc9.service
+LoadState=not-found
+ActiveState=inactive
+SubState=dead
+UnitFileState=
+MainPID=0
+ActiveEnterTimestamp=
+InactiveEnterTimestamp=
+"""
+
+
+def test_parse_systemctl_show():
+    states = parse_systemctl_show(SAMPLE_SYSTEMCTL_SHOW)
+    assert list(states) == ["ioc1", "ioc4", "ioc9"]
+
+    assert states["ioc1"].status == "Running"
+    assert states["ioc1"].enabled
+    assert states["ioc1"].main_pid == 1234
+    assert states["ioc1"].sub_state == "running"
+    assert states["ioc1"].active_enter_timestamp == "Fri 2026-10-16 09:00:00 EDT"
+
+    assert states["ioc4"].status == "Stopped"
+    assert not states["ioc4"].enabled
+    assert states["ioc4"].known
+
+    assert states["ioc9"].load_state == "not-found"
+    assert not states["ioc9"].known
+
+
+def test_systemctl_show_single_call(fake_systemctl, tmp_path):
+    (tmp_path / "show.txt").write_text(SAMPLE_SYSTEMCTL_SHOW)
+    fake_systemctl(f'echo "$@" >> {tmp_path}/calls.txt\ncat {tmp_path}/show.txt')
+
+    states = manage_iocs.utils.systemctl_show(["ioc1", "ioc4", "ioc9"])
+    calls = (tmp_path / "calls.txt").read_text().splitlines()
+    assert len(calls) == 1
+    assert calls[0].split()[0] == "show"
+    assert calls[0].split()[2:] == [
+        "softioc-ioc1.service",
+        "softioc-ioc4.service",
+        "softioc-ioc9.service",
+    ]
+    assert set(states) == {"ioc1", "ioc4", "ioc9"}
+
+    assert manage_iocs.utils.systemctl_show([]) == {}
+    assert len((tmp_path / "calls.txt").read_text().splitlines()) == 1
+
+
+def test_systemctl_show_marks_timed_out_iocs(fake_systemctl, tmp_path, monkeypatch):
+    # ioc1 and ioc4 are queried in separate calls; the call for ioc4 hangs
+    (tmp_path / "show.txt").write_text(SAMPLE_SYSTEMCTL_SHOW.split("\n\n")[0])
+    fake_systemctl(f'case "$@" in *ioc4*) exec sleep 10;; esac\ncat {tmp_path}/show.txt')
+    monkeypatch.setattr(manage_iocs.utils, "SHOW_CHUNK_SIZE", 1)
+    monkeypatch.setattr(manage_iocs.systemd, "CALL_TIMEOUT", 0.5)
+
+    states = manage_iocs.utils.systemctl_show(["ioc1", "ioc4"])
+    assert states["ioc1"].status == "Running"
+    assert states["ioc4"].timed_out
+    assert states["ioc4"].status == "Timed out"